@@ -1,24 +1,33 @@
 import os
-import re
-import fitz
-import pandas as pd
+import uuid
+import queue
+import asyncio
+import threading
 from dotenv import load_dotenv
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 import time
 from groq_wrapper import GroqWrapper
-from pymongo import MongoClient
-from typing import List, Tuple
+from pymongo import MongoClient, AsyncMongoClient, ReplaceOne
+from embedding_cache import CachedQueryEmbeddings
+from embedding_scheduler import embedding_scheduler
+from pdf_extraction import make_text_splitter, pdf_extractor
+from local_vector_index import local_vector_index
+from context_packer import context_packer
+from typing import Callable, Iterator, List, Optional, Tuple
 
 # Load environment variables
 load_dotenv()
 
+PDF_PIPELINE_QUEUE_SIZE = int(os.getenv("PDF_PIPELINE_QUEUE_SIZE", 8))
+_PIPELINE_DONE = object()
+
 class FinancialRAGSystem:
     def __init__(self):
         self.mongo_client = MongoClient(os.getenv("MONGO_URI"))
         self.mongo_db = self.mongo_client["Financial_Rag_DB"]
         self.mongo_collection = self.mongo_db["finqa_pdf"]
+        self._async_collection = None  # created on first async query, inside the event loop
+        self._ensure_chunk_index()
 
         # Configuration
         self.GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -27,7 +36,7 @@ class FinancialRAGSystem:
         print("\n=== INITIALIZING FINANCIAL RAG SYSTEM ===")
         self._initialize_embeddings()
         self._initialize_text_splitter()
-        self.vector_store = None
+        self.vector_store = local_vector_index  # per-file FAISS indexes, Atlas is the fallback
         self.index_name = "financial_reports_faiss_index"
         
         # Initialize Groq client through wrapper
@@ -40,15 +49,17 @@ class FinancialRAGSystem:
             if not self.GOOGLE_API_KEY:
                 raise ValueError("GOOGLE_API_KEY not found in environment variables")
             
-            self.embeddings = GoogleGenerativeAIEmbeddings(
+            client = GoogleGenerativeAIEmbeddings(
                 model="models/embedding-001",
                 google_api_key=self.GOOGLE_API_KEY
             )
+            # Query embeddings go through the shared embedding cache
+            self.embeddings = CachedQueryEmbeddings(client, "models/embedding-001")
             
-            # Test the embeddings
+            # Test the embeddings (uncached, to validate the key)
             test_text = "Financial report analysis"
             start_time = time.time()
-            embedding = self.embeddings.embed_query(test_text)
+            embedding = client.embed_query(test_text)
             latency = (time.time() - start_time) * 1000
             
             print(f"✅ Google embeddings initialized successfully")
@@ -64,17 +75,24 @@ class FinancialRAGSystem:
     def _initialize_text_splitter(self):
         """Initialize text splitter with logging"""
         print("\n[2/3] Initializing text splitter...")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", "(?<=\. )", " ", ""]
-        )
+        self.text_splitter = make_text_splitter()
         print("✅ Text splitter configured with:")
         print(f"   - Chunk size: 1000")
         print(f"   - Overlap: 200")
         print(f"   - Separators: ['\\n\\n', '\\n', '(?<=\\. )', ' ', '']")
 
+    def _ensure_chunk_index(self):
+        """Index the (user_id, filename, chunk_key) upsert key; chunks stored before chunk keys existed are exempt"""
+        try:
+            self.mongo_collection.create_index(
+                [("user_id", 1), ("filename", 1), ("chunk_key", 1)],
+                name="user_file_chunk_key",
+                unique=True,
+                partialFilterExpression={"chunk_key": {"$exists": True}}
+            )
+        except Exception as e:
+            print(f"⚠️ Could not create chunk key index: {e}")
+
     def _initialize_groq(self):
         """Initialize Groq connection through wrapper with enhanced logging"""
         print("\n[3/3] Initializing Groq client...")
@@ -85,143 +103,253 @@ class FinancialRAGSystem:
             print(f"❌ Groq initialization failed: {e}")
             raise
 
-    def _extract_financial_tables(self, page, page_num: int, pdf_path: str) -> List[Document]:
-        """Extract and format tables from PDF page with logging"""
-        print(f"  Processing page {page_num+1} for tables...")
-        table_docs = []
-        tables = page.find_tables()
-        
-        if tables.tables:
-            print(f"  Found {len(tables.tables)} tables on page {page_num+1}")
-            for i, table in enumerate(tables.tables):
-                try:
-                    df = table.to_pandas()
-                    if not df.empty and self._is_financial_table(df):
-                        table_str = self._format_table(df)
-                        table_docs.append(Document(
-                            page_content=f"TABLE {i+1} FROM PAGE {page_num+1}:\n{table_str}",
-                            metadata={
-                                "source": pdf_path,
-                                "page": page_num + 1,
-                                "table_id": i + 1,
-                                "type": "financial_table",
-                                "section": self._detect_section(page.get_text("text"))
-                            }
-                        ))
-                        print(f"    Added table {i+1} (shape: {df.shape})")
-                except Exception as e:
-                    print(f"    ❌ Error processing table {i+1}: {e}")
-        else:
-            print(f"  No tables found on page {page_num+1}")
-        return table_docs
-
-    def _is_financial_table(self, df: pd.DataFrame) -> bool:
-        """Check if table contains financial data with logging"""
-        cols = "|".join(df.columns.astype(str))
-        patterns = r"year|quarter|q\d|fy\d|usd|million|billion|revenue|income|balance|assets|liabilities"
-        is_financial = bool(re.search(patterns, cols, re.IGNORECASE))
-        if not is_financial:
-            print(f"    Table filtered out (non-financial): {df.columns.tolist()}")
-        return is_financial
-
-    def _format_table(self, df: pd.DataFrame) -> str:
-        """Convert table to structured string format"""
-        df = df.map(lambda x: re.sub(r"\((\d+)\)", r"-\1", str(x)))
-        return df.to_markdown(index=False, floatfmt=".2f")
-
-    def _detect_section(self, text: str) -> str:
-        """Detect financial report section with logging"""
-        text = text.lower()
-        if "balance sheet" in text:
-            return "balance_sheet"
-        elif "income statement" in text:
-            return "income_statement"
-        elif "cash flow" in text:
-            return "cash_flow"
-        return "other"
-
-    def process_pdf(self, pdf_path: str, user_id: str) -> bool:
-        """Process PDF file and store embeddings in MongoDB (user-specific, no company)"""
+    def _iter_page_chunks(self, pdf_path: str, user_id: str, filename: str) -> Iterator[Tuple[int, List[dict]]]:
+        """Yield (page count, chunks of one page) in page order; pages are parsed by the worker pool"""
+        for page_count, _, records in pdf_extractor.iter_pages(pdf_path):
+            yield page_count, [
+                {
+                    "user_id": str(user_id),
+                    "filename": filename,
+                    "chunk_key": chunk_key,
+                    "content": content,
+                    "metadata": metadata
+                }
+                for chunk_key, content, metadata in records
+            ]
+
+    def process_pdf(self, pdf_path: str, user_id: str, progress: Optional[Callable] = None,
+                    filename: Optional[str] = None) -> bool:
+        """Process PDF file and store embeddings in MongoDB (user-specific, no company)
+
+        Pages stream through three stages joined by bounded queues: page extraction
+        (the pdf_extractor process pool), embedding (in groups, through
+        the embedding scheduler) and batched Mongo upserts keyed on
+        (user_id, filename, chunk_key). Only a few pages' worth of chunks and vectors
+        are in memory at any time. Every upserted group is searchable right away.
+        Chunks of an earlier upload of the same file that were not overwritten are
+        deleted at the end. If ingestion fails part-way, the chunks written so far
+        stay searchable. The stored chunks are also staged into a local FAISS index
+        for the file, which is swapped in once the run succeeds.
+
+        ``progress(stage, **details)`` is called after every stored group, before the
+        old chunks are deleted and when the run finishes; a job's progress callback
+        raises once the job is cancelled, so a superseded run stops before it can
+        delete the chunks of the upload that replaced it. ``filename`` is the name the
+        chunks are stored under (default: the file's base name).
+        """
         print(f"\n=== PROCESSING PDF: {pdf_path} ===")
         print(f"User: {user_id}")
 
+        filename = filename or os.path.basename(pdf_path)
+        ingest_id = uuid.uuid4().hex
+        group_size = embedding_scheduler.batch_size * embedding_scheduler.max_workers
+        chunk_queue = queue.Queue(maxsize=PDF_PIPELINE_QUEUE_SIZE)   # one page per item
+        write_queue = queue.Queue(maxsize=PDF_PIPELINE_QUEUE_SIZE)   # one embedded group per item
+        failed = threading.Event()
+        errors = []
+        counts = {"pages": 0, "pages_extracted": 0, "chunks_embedded": 0, "chunks_stored": 0}
+        index_builder = local_vector_index.builder(user_id, filename, ingest_id)
+
+        def put(q, item):
+            while not failed.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(q):
+            while not failed.is_set():
+                try:
+                    return q.get(timeout=0.5)
+                except queue.Empty:
+                    pass
+            return _PIPELINE_DONE
+
+        def extract():
+            try:
+                for page_count, chunks in self._iter_page_chunks(pdf_path, user_id, filename):
+                    counts["pages"] = page_count
+                    counts["pages_extracted"] += 1
+                    if not put(chunk_queue, chunks):
+                        return
+                put(chunk_queue, _PIPELINE_DONE)
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+
+        def embed_group(group):
+            vectors = embedding_scheduler.embed(self.embeddings, [chunk["content"] for chunk in group])
+            for chunk, vector in zip(group, vectors):
+                chunk["embedding"] = vector
+                chunk["ingest_id"] = ingest_id
+            counts["chunks_embedded"] += len(group)
+            return put(write_queue, group)
+
+        def embed():
+            try:
+                pending = []
+                while True:
+                    chunks = get(chunk_queue)
+                    if chunks is _PIPELINE_DONE:
+                        break
+                    pending.extend(chunks)
+                    while len(pending) >= group_size:
+                        if not embed_group(pending[:group_size]):
+                            return
+                        pending = pending[group_size:]
+                if failed.is_set() or (pending and not embed_group(pending)):
+                    return
+                put(write_queue, _PIPELINE_DONE)
+            except Exception as e:
+                errors.append(e)
+                failed.set()
+
+        workers = [
+            threading.Thread(target=extract, name="pdf-extract", daemon=True),
+            threading.Thread(target=embed, name="pdf-embed", daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
         try:
-            filename = os.path.basename(pdf_path)
-            doc = fitz.open(pdf_path)
-            all_chunks = []
-
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text("text")
-                section = self._detect_section(text)
-
-                # 1. Process text chunks
-                text_chunks = self.text_splitter.split_text(text)
-                for i, chunk in enumerate(text_chunks):
-                    all_chunks.append({
-                        "user_id": str(user_id),
-                        "filename": filename,
-                        "content": chunk,
-                        "metadata": {
-                            "page": page_num + 1,
-                            "section": section,
-                            "type": "text",
-                            "chunk_id": i
-                        }
-                    })
-
-                # 2. Process financial tables
-                tables = self._extract_financial_tables(page, page_num, pdf_path)
-                for doc in tables:
-                    all_chunks.append({
-                        "user_id": str(user_id),
-                        "filename": filename,
-                        "content": doc.page_content,
-                        "metadata": doc.metadata
-                    })
-
-            print(f"Total text/table chunks: {len(all_chunks)}")
-            if not all_chunks:
-                print("❌ No valid content extracted.")
-                return False
-
-            # 3. Generate embeddings
-            texts = [chunk["content"] for chunk in all_chunks]
-            embeddings = self.embeddings.embed_documents(texts)
-
-            # 4. Prepare MongoDB docs
-            documents = []
-            for chunk, embedding in zip(all_chunks, embeddings):
-                documents.append({
-                    "user_id": str(chunk["user_id"]),
-                    "filename": chunk["filename"],
-                    "content": chunk["content"],
-                    "metadata": chunk["metadata"],
-                    "embedding": embedding
-                })
-
-            # 5. Remove previous entries
+            # Writer stage runs on the calling thread
+            while True:
+                group = get(write_queue)
+                if group is _PIPELINE_DONE:
+                    break
+                self.mongo_collection.bulk_write([
+                    ReplaceOne({"user_id": chunk["user_id"], "filename": chunk["filename"], "chunk_key": chunk["chunk_key"]}, chunk, upsert=True)
+                    for chunk in group
+                ], ordered=False)
+                counts["chunks_stored"] += len(group)
+                index_builder.add(group)
+                print(f"✅ Stored {counts['chunks_stored']} chunks ({counts['pages_extracted']}/{counts['pages']} pages read)")
+                if progress:
+                    progress("ingesting", **counts)
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+        finally:
+            for worker in workers:
+                worker.join()
+
+        if errors or not counts["chunks_stored"]:
+            index_builder.abort()
+            print(f"❌ PDF processing failed: {errors[0]}" if errors else "❌ No valid content extracted.")
+            return False
+
+        try:
+            if progress:
+                progress("finalizing", **counts)  # raises if this run was superseded
+            # Remove chunks of a previous upload that this run did not overwrite
             deleted = self.mongo_collection.delete_many({
                 "user_id": str(user_id),
-                "filename": filename
+                "filename": filename,
+                "ingest_id": {"$ne": ingest_id}
             })
             print(f"🧹 Deleted {deleted.deleted_count} old records")
+            index_builder.commit()
+            if progress:
+                progress("stored", pages=counts["pages"], chunks=counts["chunks_stored"])
 
-            # 6. Insert fresh records
-            inserted = self.mongo_collection.insert_many(documents)
-            print(f"✅ Inserted {len(inserted.inserted_ids)} new documents")
-
-            # 7. Delete uploaded PDF
-            doc.close()
+            # Delete uploaded PDF (this run's own copy)
             os.remove(pdf_path)
             print(f"🗑️ Deleted PDF: {pdf_path}")
-
             return True
 
         except Exception as e:
+            index_builder.abort()
             print(f"❌ PDF processing failed: {e}")
             return False
 
+    def _vector_search_pipeline(self, query_embedding: List[float], user_id: str, filename: str, k: int) -> List[dict]:
+        return [
+            {
+                "$vectorSearch": {
+                    "queryVector": query_embedding,
+                    "path": "embedding",
+                    "numCandidates": 100,
+                    "limit": k,
+                    "index": "vector_index_pdf", 
+                    "filter": {
+                        "user_id": str(user_id),
+                        "filename": filename
+                    }
+                }
+            }
+        ]
+
+    def _search_chunks(self, query: str, user_id: str, filename: str, k: int) -> List[dict]:
+        """Embed the query and run a filtered vector search over the user's PDF chunks"""
+        # 1. Generate query embedding
+        query_embedding = self.embeddings.embed_query(query)
+        print("✅ Generated embedding for query")
+
+        # 2. Hybrid (vector + BM25) search of the file's local index, if this host has one
+        results = local_vector_index.search(user_id, filename, query_embedding, k, query_text=query)
+        if results is not None:
+            print(f"⚡ Local hybrid search: {len(results)} chunks")
+            return results
+
+        # 3. Fall back to vector search in MongoDB
+        print("🔍 Performing vector search in MongoDB Atlas...")
+        print(f"Filter: user_id={str(user_id)}, filename={filename}") 
+        results = self.mongo_collection.aggregate(self._vector_search_pipeline(query_embedding, user_id, filename, k))
+        return list(results)
+
+    async def _search_chunks_async(self, query: str, user_id: str, filename: str, k: int) -> List[dict]:
+        """_search_chunks on the asyncio Mongo driver"""
+        if self._async_collection is None:
+            self._async_collection = AsyncMongoClient(os.getenv("MONGO_URI"))["Financial_Rag_DB"]["finqa_pdf"]
+        query_embedding = await self.embeddings.aembed_query(query)
+        # In-process, but a cold index reads docs.jsonl and builds BM25, so it runs in a worker thread
+        results = await asyncio.to_thread(local_vector_index.search, user_id, filename, query_embedding, k, query_text=query)
+        if results is not None:
+            return results
+        cursor = await self._async_collection.aggregate(self._vector_search_pipeline(query_embedding, user_id, filename, k))
+        return await cursor.to_list()
+
+    def _build_messages(self, results: List[dict], query: str) -> List[dict]:
+        """Build the Groq chat messages from retrieved chunks, packed into the prompt token budget"""
+        print("Preparing context for Groq...")
+        # Results arrive ranked; overlapping neighbours are trimmed and low-ranked chunks dropped or cut to fit
+        chunks, context_tokens = context_packer.pack_documents(
+            results,
+            context_packer.budget - context_packer.count_tokens(query) - 120,  # system prompt and framing
+            render=lambda doc, text: f"Page {doc.get('metadata', {}).get('page', '?')} | Section: {doc.get('metadata', {}).get('section', 'unknown').upper()}\n{text}",
+            text_key="content",
+            score_key=None
+        )
+        context = "\n\n".join(chunks)
+        print(f"Context: {len(chunks)}/{len(results)} chunks, {context_tokens} tokens")
+
+        messages = [
+            {
+                "role": "system",
+                "content": """You are a financial analyst. Follow these rules:
+    1. Base answers ONLY on the provided context
+    2. For numerical questions, provide exact figures with units
+    3. For tables, reference the page number
+    4. Be concise but complete"""
+            },
+            {
+                "role": "user",
+                "content": f"Context:\n{context}\n\nQuestion: {query}"
+            }
+        ]
+        context_packer.record(messages)
+        return messages
+
+    def _format_sources(self, results: List[dict]) -> List[dict]:
+        return [{
+            "content": doc["content"][:500] + "...",
+            "source": doc["filename"],
+            "page": doc.get("metadata", {}).get("page"),
+            "section": doc.get("metadata", {}).get("section", "unknown").upper()
+        } for doc in results]
+
     def query_financial_data(self, query: str, user_id: str, filename: str, k: int = 4) -> Tuple[str, List[dict]]:
         """Query user-specific PDF data using MongoDB Atlas Vector Search"""
         print(f"\n=== QUERY PROCESSING ===")
@@ -231,60 +359,17 @@ class FinancialRAGSystem:
         try:
             start_time = time.time()
 
-            # 1. Generate query embedding
-            query_embedding = self.embeddings.embed_query(query)
-            print("✅ Generated embedding for query")
-
-            # 2. Run vector search in MongoDB
-            print("🔍 Performing vector search in MongoDB Atlas...")
-            print(f"Filter: user_id={str(user_id)}, filename={filename}") 
-            results = self.mongo_collection.aggregate([
-                {
-                    "$vectorSearch": {
-                        "queryVector": query_embedding,
-                        "path": "embedding",
-                        "numCandidates": 100,
-                        "limit": k,
-                        "index": "vector_index_pdf", 
-                        "filter": {
-                            "user_id": str(user_id),
-                            "filename": filename
-                        }
-                    }
-                }
-            ])
-            results = list(results)
+            results = self._search_chunks(query, user_id, filename, k)
 
             if not results:
                 print("⚠️ No relevant documents found.")
                 return "No relevant documents found.", []
 
-            # 3. Prepare LLM context
-            print("Preparing context for Groq...")
-            context = "\n\n".join([
-                f"Page {doc.get('metadata', {}).get('page', '?')} | Section: {doc.get('metadata', {}).get('section', 'unknown').upper()}\n{doc['content'][:1000]}..."
-                for doc in results
-            ])
-            print(f"Total context length: {len(context)} characters")
-
-            # 4. Send to Groq LLM
+            # 3. Send context and question to Groq LLM
             print("Sending context and question to Groq LLM...")
             response, error = GroqWrapper.make_rag_request(
                 model="mistral-saba-24b",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a financial analyst. Follow these rules:
-    1. Base answers ONLY on the provided context
-    2. For numerical questions, provide exact figures with units
-    3. For tables, reference the page number
-    4. Be concise but complete"""
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Context:\n{context}\n\nQuestion: {query}"
-                    }
-                ],
+                messages=self._build_messages(results, query),
                 temperature=0.3,
                 max_tokens=1024
             )
@@ -294,13 +379,8 @@ class FinancialRAGSystem:
 
             print("✅ Groq LLM response received")
 
-            # 5. Extract sources
-            sources = [{
-                "content": doc["content"][:500] + "...",
-                "source": doc["filename"],
-                "page": doc.get("metadata", {}).get("page"),
-                "section": doc.get("metadata", {}).get("section", "unknown").upper()
-            } for doc in results]
+            # 4. Extract sources
+            sources = self._format_sources(results)
 
             print(f"\n=== QUERY COMPLETE ({len(results)} chunks) ===")
             print(f"Total processing time: {time.time() - start_time:.2f} seconds")
@@ -311,6 +391,73 @@ class FinancialRAGSystem:
             print(f"\n=== QUERY FAILED ===")
             print(f"❌ Error: {e}")
             return f"Error processing query: {str(e)}", []
+
+    async def query_financial_data_async(self, query: str, user_id: str, filename: str, k: int = 4) -> Tuple[str, List[dict]]:
+        """Async counterpart of query_financial_data for the ASGI server"""
+        print("\n=== QUERY PROCESSING (async) ===")
+        print(f"User: {user_id} | File: {filename} | Question: {query}")
+
+        try:
+            start_time = time.time()
+
+            results = await self._search_chunks_async(query, user_id, filename, k)
+
+            if not results:
+                print("⚠️ No relevant documents found.")
+                return "No relevant documents found.", []
+
+            messages = await asyncio.to_thread(self._build_messages, results, query)  # tokenizer counts
+            response, error = await GroqWrapper.make_rag_request_async(
+                model="mistral-saba-24b",
+                messages=messages,
+                temperature=0.3,
+                max_tokens=1024
+            )
+
+            if error:
+                raise Exception(error)
+
+            print(f"\n=== QUERY COMPLETE ({len(results)} chunks) in {time.time() - start_time:.2f} seconds ===")
+            return response.choices[0].message.content, self._format_sources(results)
+
+        except Exception as e:
+            print("\n=== QUERY FAILED ===")
+            print(f"❌ Error: {e}")
+            return f"Error processing query: {str(e)}", []
+
+    def stream_financial_data(self, query: str, user_id: str, filename: str, k: int = 4) -> Iterator[Tuple[str, dict]]:
+        """Streaming variant of query_financial_data.
+
+        Yields (event, data) pairs: a "stage" event once chunks are retrieved, one
+        "token" event per LLM delta, then "done" with the full response and sources
+        (or "error").
+        """
+        print("\n=== STREAMING QUERY ===")
+        print(f"User: {user_id} | File: {filename} | Question: {query}")
+
+        try:
+            results = self._search_chunks(query, user_id, filename, k)
+            yield "stage", {"stage": "documents_retrieved", "count": len(results)}
+
+            if not results:
+                yield "done", {"response": "No relevant documents found.", "sources": []}
+                return
+
+            parts = []
+            for delta in GroqWrapper.stream_rag_request(
+                model="mistral-saba-24b",
+                messages=self._build_messages(results, query),
+                temperature=0.3,
+                max_tokens=1024
+            ):
+                parts.append(delta)
+                yield "token", {"text": delta}
+
+            yield "done", {"response": "".join(parts), "sources": self._format_sources(results)}
+
+        except Exception as e:
+            print(f"❌ Streaming query failed: {e}")
+            yield "error", {"error": f"Error processing query: {str(e)}"}
         
 # Example Usage
 if __name__ == "__main__":
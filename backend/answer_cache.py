@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cache_backends import create_cache_backend
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial rephrasings share a key."""
+    question = question.lower().replace("'s", "")
+    question = re.sub(r"[^\w\s&.%$-]", " ", question)
+    question = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", question)  # keep decimal points only
+    return re.sub(r"\s+", " ", question).strip()
+
+
+QUARTER_WORDS = {"first": "q1", "second": "q2", "third": "q3", "fourth": "q4"}
+PERIOD_OR_NUMBER_PATTERN = re.compile(r"\b(?:(first|second|third|fourth) quarter|q[1-4]|h[12]|fy\s?\d{2,4}|\d+(?:\.\d+)?)\b")
+
+
+def question_figures(question: str) -> frozenset:
+    """Periods and numbers a question names ("q3", "2024", "10"); questions that differ in them have different answers."""
+    return frozenset(
+        QUARTER_WORDS[match.group(1)] if match.group(1) else match.group(0).replace(" ", "")
+        for match in PERIOD_OR_NUMBER_PATTERN.finditer(normalize_question(question))
+    )
+
+
+class AnswerCache:
+    """Cache of final /query_chatbot answers keyed on (company, normalized question, recent chat history).
+
+    The answer to a follow-up depends on the conversation, so the key includes a
+    digest of the last ``history_window`` messages (the most any prompt uses).
+    On an exact-key miss an optional semantic lookup embeds the question and reuses
+    the answer of the most similar cached question for the same company, if its
+    cosine similarity is above ``semantic_threshold`` and it names the same periods
+    and numbers ("revenue Q3 2024" and "revenue Q2 2024" embed almost identically).
+    The semantic tier only covers questions asked without history.
+    """
+
+    def __init__(self, backend, ttl: float, semantic_threshold: float = 0.95,
+                 embedder: Optional[Callable[[str], List[float]]] = None, max_semantic_entries: int = 2000,
+                 history_window: int = 5):
+        self.backend = backend
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.embedder = embedder
+        self.max_semantic_entries = max_semantic_entries
+        self.history_window = history_window
+
+        self._lock = threading.Lock()
+        self._semantic_index: Dict[str, List[Tuple[str, np.ndarray, frozenset]]] = {}  # company -> [(key, unit vector, figures)]
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def make_key(self, question: str, company: str, history: Optional[List[dict]] = None) -> str:
+        raw = f"{company.upper()}|{normalize_question(question)}"
+        if history:
+            raw += "|" + json.dumps(history[-self.history_window:], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(self.embedder(normalize_question(question)), dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️ Answer cache embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, question: str, company: str, history: Optional[List[dict]] = None) -> Optional[str]:
+        key = self.make_key(question, company, history)
+        answer = self.backend.get(key)
+        if answer is not None:
+            with self._lock:
+                self.hits += 1
+            return answer
+
+        if self.embedder is not None and not history:
+            answer = self._semantic_get(question, company)
+            if answer is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _semantic_get(self, question: str, company: str) -> Optional[str]:
+        figures = question_figures(question)
+        with self._lock:
+            candidates = [entry for entry in self._semantic_index.get(company.upper(), []) if entry[2] == figures]
+        if not candidates:
+            return None
+        vector = self._embed(question)
+        if vector is None:
+            return None
+
+        matrix = np.stack([v for _, v, _ in candidates])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.semantic_threshold:
+            return None
+
+        answer = self.backend.get(candidates[best][0])
+        if answer is None:
+            # Entry was evicted or expired in the backend; forget it here as well
+            with self._lock:
+                entries = self._semantic_index.get(company.upper(), [])
+                self._semantic_index[company.upper()] = [e for e in entries if e[0] != candidates[best][0]]
+        return answer
+
+    def set(self, question: str, company: str, answer: str, history: Optional[List[dict]] = None):
+        key = self.make_key(question, company, history)
+        self.backend.set(key, answer, ttl=self.ttl)
+        with self._lock:
+            self.stores += 1
+
+        if self.embedder is not None and not history:
+            vector = self._embed(question)
+            if vector is not None:
+                with self._lock:
+                    entries = self._semantic_index.setdefault(company.upper(), [])
+                    entries[:] = [e for e in entries if e[0] != key]
+                    entries.append((key, vector, question_figures(question)))
+                    del entries[:-self.max_semantic_entries]
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self._semantic_index.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round((self.hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+                "semantic_enabled": self.embedder is not None
+            }
+        stats.update(self.backend.get_stats())
+        return stats
+
+
+# Global instance (configured from the environment)
+answer_cache = AnswerCache(
+    backend=create_cache_backend(
+        os.getenv("ANSWER_CACHE_BACKEND", "memory"),
+        "answer_cache",
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000)),
+        max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+    ),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600)),
+    semantic_threshold=float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", 0.95)),
+    history_window=int(os.getenv("ANSWER_CACHE_HISTORY_WINDOW", 5))
+)
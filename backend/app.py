@@ -1,20 +1,45 @@
 #----------------------------------------Imports----------------------------------------
-from flask import Flask, request, jsonify
+# Fork the PDF extraction workers first, while this process is still single-threaded
+# (the modules below start database and API client threads as they load)
+from dotenv import load_dotenv
+load_dotenv()
+from pdf_extraction import pdf_extractor
+pdf_extractor.start()
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert, select, literal, exists, func, tuple_
+from sqlalchemy.exc import IntegrityError
 from flask_cors import CORS
 import uuid
 import os
+import json
+import queue
+import base64
+import hashlib
 from real_chatbot import query_llm, extract_sql_and_notes, execute_sql
-from real_chatbot_rag import query_llm_groq, initialize_components
+from real_chatbot_rag import query_llm_groq, initialize_components, embed_query
 from dotenv import load_dotenv
-import oracledb
 import time
 import re
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import threading
 from PDFProcessing import FinancialRAGSystem
 from groq_wrapper import GroqWrapper
 from groq_key_manager import key_manager
+from embedding_pool import embedding_pool
+from oracle_pool import oracle_pool
+from ddl_registry import ddl_registry
+from answer_cache import answer_cache
+from sql_cache import sql_cache
+from fast_sql import generate_fast_sql, fast_sql_stats
+from financial_snapshot import financial_snapshot
+from chat_history import chat_history_cache
+from embedding_cache import embedding_cache
+from local_vector_index import local_vector_index
+from bm25_index import filing_chunks_bm25
+from context_packer import context_packer
+from chat_maintenance import ChatMaintenance
+from pdf_jobs import PdfJobQueue
 import shutil
 import stat
 from datetime import datetime as dt
@@ -46,41 +71,35 @@ key_manager.initialize_keys(
 # ---------------------------------------DB Connect------------------------------------------------------
 
 def get_db_connection():
-    # Load credentials from environment variables (set in Render Secrets)
-    db_user = os.getenv("DB_USER")
-    db_password = os.getenv("DB_PASSWORD")
-    db_dsn = os.getenv("DB_DSN")  # e.g., "my_db_alias" (must match tnsnames.ora)
-    db_wallet = os.getenv("DB_WALLET_LOCATION")
-
-    # Establish connection using the wallet
-    connection = oracledb.connect(
-        user=db_user,
-        password=db_password,
-        dsn=db_dsn,
-        config_dir=db_wallet,  # Points to /opt/wallet
-        wallet_location=db_wallet,
-        wallet_password=db_password,  # Optional (if ewallet.p12 is used)
-        retry_count=3,
-        retry_delay=1
-    )
-    return connection
+    """Borrow a pooled Oracle session; use as ``with get_db_connection() as connection:``.
+
+    Credentials come from DB_USER / DB_PASSWORD / DB_DSN / DB_WALLET_LOCATION (set in Render Secrets).
+    """
+    return oracle_pool.connection()
+
+# Near-duplicate question lookup in the answer cache costs one embedding call per miss, so it is opt-in
+if os.getenv("ANSWER_CACHE_SEMANTIC", "False") == "True":
+    answer_cache.embedder = embed_query
 
 #----------------------------------------Flask App Initialization----------------------------------------
 app = Flask(__name__)
 log_memory("Startup")
 
-CORS(app)
+CORS(app, expose_headers=["ETag"])
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('POSTGRES_URI')
 # 'sqlite:///chats.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_size': 10,
-    'max_overflow': 0,
+    'pool_size': int(os.getenv('POSTGRES_POOL_SIZE', 10)),
+    'max_overflow': int(os.getenv('POSTGRES_MAX_OVERFLOW', 0)),
+    'pool_timeout': int(os.getenv('POSTGRES_POOL_TIMEOUT', 30)),
     'pool_pre_ping': True
 }
 
+# db.session is scoped to the app context: every request (and every worker thread that
+# pushes its own app context) gets its own session and pooled connection, which is
+# returned when the context tears down. Concurrency control is left to Postgres.
 db = SQLAlchemy(app)
-db_lock = threading.Lock()
 
 #---------------------------------------Initialize RAG components----------------------------------------
 # Lazy initialization of RAG system and components
@@ -114,12 +133,19 @@ def health_check():
     status["rag_initialized"] = "✅" if components_initialized else "❌"
 
     try:
-        conn = get_db_connection()
-        conn.ping()
-        conn.close()
+        with get_db_connection() as conn:
+            conn.ping()
         status["oracle_db"] = "✅ Connected"
     except Exception as e:
         status["oracle_db"] = f"❌ Failed: {str(e)}"
+    status["oracle_pool"] = oracle_pool.get_stats()
+    status["ddl_registry"] = ddl_registry.get_stats()
+    status["financial_snapshot"] = financial_snapshot.get_stats()
+    status["chat_maintenance"] = chat_maintenance.get_stats()
+    try:
+        status["pdf_jobs"] = pdf_jobs.get_stats()
+    except Exception as e:
+        status["pdf_jobs"] = f"❌ Failed: {str(e)}"
 
     return jsonify(status), 200
 
@@ -132,6 +158,11 @@ class ChatSession(db.Model):
     user_id = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=dt.utcnow)
 
+    # A user's sessions newest first, and the keyset cursor (created_at, id) of /get_sessions_page
+    __table_args__ = (
+        db.Index('ix_chat_session_user_id_created_at_id', user_id, created_at.desc(), id.desc()),
+    )
+
 class Chat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender = db.Column(db.String(10))  # 'user' or 'bot'
@@ -139,12 +170,167 @@ class Chat(db.Model):
     session_id = db.Column(db.String(50), db.ForeignKey('chat_session.id'))
     created_at = db.Column(db.DateTime, default=dt.utcnow)
 
+    # Serves "newest N messages of a session" (ORDER BY id DESC LIMIT N) as an index range scan
+    __table_args__ = (
+        db.Index('ix_chat_session_id_id_desc', session_id, id.desc()),
+    )
+
+class PdfJob(db.Model):
+    """One processing run of an uploaded PDF (see pdf_jobs.PdfJobQueue)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued | processing | done | failed | cancelled
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    stage = db.Column(db.String(50))
+    progress = db.Column(db.JSON)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    error = db.Column(db.Text)
+    worker = db.Column(db.String(100))
+    run_after = db.Column(db.DateTime, nullable=False, default=dt.utcnow)
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=dt.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=dt.utcnow)
+
+    __table_args__ = (
+        # Claim order of the job workers, and the latest job of a file for /pdf_status
+        db.Index('ix_pdf_job_status_priority_id', status, priority.desc(), id),
+        db.Index('ix_pdf_job_user_id_filename_id', user_id, filename, id.desc()),
+    )
+
+def ensure_indexes():
+    """create_all() only adds indexes to tables it creates; add any missing ones to existing tables."""
+    for model in (ChatSession, Chat, PdfJob):
+        for index in model.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
 # Initialize the DB
 with app.app_context():
     db.create_all()
+    ensure_indexes()
+
+# Scheduled removal of sessions that never got a message
+chat_maintenance = ChatMaintenance(app, db, ChatSession, Chat)
+chat_maintenance.start_scheduler()
+
+# Preload company mapping, DDLs and METRICS vocabulary
+ddl_registry.load()
+
+# Local snapshot of the *_QUARTERLY tables: serve the last one on disk (if any) while a fresh one is pulled in the background
+def invalidate_cached_data(tables):
+    """Drop cached SQL results for reloaded tables, and every cached answer (answers may quote their figures)."""
+    invalidated = sql_cache.invalidate_tables(tables)
+    answer_cache.clear()
+    print("🧹 Answer cache cleared after a data change")
+    return invalidated
+
+def refresh_financial_snapshot():
+    """Refresh the snapshot and invalidate cached results and answers if any table's data changed."""
+    changed = financial_snapshot.refresh()
+    if changed:
+        invalidate_cached_data(changed)
+    return changed
+
+def _initial_snapshot():
+    try:
+        refresh_financial_snapshot()
+    except Exception as e:
+        print(f"⚠️ Initial financial snapshot failed, numeric queries will use Oracle: {e}")
+
+financial_snapshot.load()
+threading.Thread(target=_initial_snapshot, daemon=True).start()
+financial_snapshot.start_scheduler(on_change=invalidate_cached_data)
+
+def load_chat_history(session_id, limit=None):
+    """The last ``limit`` messages of a session, oldest first, as [{'sender', 'message'}].
+
+    Served from the in-memory window when it still ends with the session's newest
+    message (another server process may have saved or deleted messages since);
+    otherwise only the newest CHAT_HISTORY_WINDOW rows are read from Postgres
+    (needs an app context).
+    """
+    newest_id = db.session.query(func.max(Chat.id)).filter(Chat.session_id == session_id).scalar()
+    if newest_id is None:
+        return []
+    history, version = chat_history_cache.get(session_id, limit, newest_id)
+    if history is not None:
+        return history
+
+    rows = (
+        db.session.query(Chat.id, Chat.sender, Chat.message)
+        .filter(Chat.session_id == session_id)
+        .order_by(Chat.id.desc())
+        .limit(chat_history_cache.window)
+        .all()
+    )
+    rows = [tuple(row) for row in reversed(rows)]
+    chat_history_cache.set(session_id, rows, version)
+    rows = rows[-limit:] if limit else rows
+    return [{'sender': sender, 'message': message} for _, sender, message in rows]
+
+#----------------------------------------Listing Helpers----------------------------------------
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+def sessions_version(user_id):
+    """Cheap change marker for a user's session list (sessions are only ever created or deleted)."""
+    count, newest = db.session.query(func.count(ChatSession.id), func.max(ChatSession.created_at)).filter(ChatSession.user_id == user_id).one()
+    return count, newest.isoformat() if newest else None
+
+def chats_version(session_id):
+    """Cheap change marker for a session's messages (messages are append-only)."""
+    return tuple(db.session.query(func.count(Chat.id), func.max(Chat.id)).filter(Chat.session_id == session_id).one())
+
+def conditional_json(version, build_payload):
+    """JSON response with an ETag derived from ``version``.
+
+    If the client's If-None-Match already has that ETag the rows are never loaded
+    and a bodyless 304 is returned, so the sidebar can revalidate its lists cheaply.
+    """
+    etag = hashlib.sha1(repr((request.full_path, version)).encode("utf-8")).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(build_payload())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def page_limit():
+    """?limit= clamped to [1, PAGE_SIZE_MAX]."""
+    try:
+        return max(1, min(int(request.args.get("limit", PAGE_SIZE_DEFAULT)), PAGE_SIZE_MAX))
+    except ValueError:
+        return PAGE_SIZE_DEFAULT
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything that is not a cursor we issued."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
 
 #----------------------------------------Routes----------------------------------------
 
+SAVE_CHATS_MAX_MESSAGES = 100
+
+def normalize_chat_message(message):
+    """Convert list or nested list responses (raw SQL rows) to a string."""
+    if isinstance(message, list):
+        message = str(message[0][0]) if message and isinstance(message[0], list) else str(message)
+    return message
+
 # Route to Save Chat Message
 @app.route('/save_chat', methods=['POST'])
 def save_chat():
@@ -154,23 +340,76 @@ def save_chat():
     sender = data['sender']
     message = data['message']
 
-    # Convert list or nested list responses to a string
-    if isinstance(message, list):
-        message = str(message[0][0]) if message and isinstance(message[0], list) else str(message)
+    message = normalize_chat_message(message)
 
-    with db_lock:
-        try:
-            chat_session = ChatSession.query.filter_by(id=session_id, user_id=user_id).first()
-            if not chat_session:
-                return jsonify({"status": "Error", "message": "Invalid session or unauthorized"}), 403
-
-            chat_message = Chat(sender=sender, message=message, session_id=session_id)
-            db.session.add(chat_message)
-            db.session.commit()
-            return jsonify({"status": "Message saved!"}), 201
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({"status": "Error", "message": str(e)}), 500
+    try:
+        # Ownership check and insert in one statement: INSERT ... SELECT ... WHERE EXISTS (owned session)
+        owned_session = exists().where(ChatSession.id == session_id, ChatSession.user_id == user_id)
+        inserted_ids = db.session.execute(
+            insert(Chat).from_select(
+                ["sender", "message", "session_id", "created_at"],
+                select(
+                    literal(sender, Chat.sender.type),
+                    literal(message, Chat.message.type),
+                    literal(session_id, Chat.session_id.type),
+                    literal(dt.utcnow(), Chat.created_at.type)
+                ).where(owned_session)
+            ).returning(Chat.id)
+        ).scalars().all()
+        db.session.commit()
+        if not inserted_ids:
+            return jsonify({"status": "Error", "message": "Invalid session or unauthorized"}), 403
+        chat_history_cache.append(session_id, [(inserted_ids[0], sender, message)])
+        return jsonify({"status": "Message saved!"}), 201
+    except IntegrityError:
+        # The session was deleted between the EXISTS check and the foreign-key check
+        db.session.rollback()
+        return jsonify({"status": "Error", "message": "Invalid session or unauthorized"}), 403
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "Error", "message": str(e)}), 500
+
+# Route to Save Several Chat Messages (e.g. a user question and the bot reply) at once
+@app.route('/save_chats', methods=['POST'])
+def save_chats():
+    """Body: {"session_id", "user_id", "messages": [{"sender", "message"}, ...]}, saved in order in one transaction."""
+    data = request.get_json() or {}
+    session_id = data.get('session_id')
+    user_id = data.get('user_id')
+    messages = data.get('messages')
+
+    if not session_id or not user_id or not isinstance(messages, list) or not messages:
+        return jsonify({"status": "Error", "message": "session_id, user_id and a non-empty messages list are required"}), 400
+    if len(messages) > SAVE_CHATS_MAX_MESSAGES:
+        return jsonify({"status": "Error", "message": f"At most {SAVE_CHATS_MAX_MESSAGES} messages per request"}), 400
+    if any(not isinstance(msg, dict) or 'sender' not in msg or 'message' not in msg for msg in messages):
+        return jsonify({"status": "Error", "message": "Each message needs a sender and a message"}), 400
+
+    now = dt.utcnow()
+    rows = [
+        {"sender": msg['sender'], "message": normalize_chat_message(msg['message']), "session_id": session_id, "created_at": now}
+        for msg in messages
+    ]
+
+    try:
+        owned = db.session.query(exists().where(ChatSession.id == session_id, ChatSession.user_id == user_id)).scalar()
+        if not owned:
+            return jsonify({"status": "Error", "message": "Invalid session or unauthorized"}), 403
+
+        # One multi-row INSERT ... VALUES (...), (...) RETURNING, one commit
+        inserted = db.session.execute(
+            insert(Chat).values(rows).returning(Chat.id, Chat.sender, Chat.message)
+        ).all()
+        db.session.commit()
+        chat_history_cache.append(session_id, [tuple(row) for row in inserted])
+        return jsonify({"status": "Messages saved!", "count": len(inserted)}), 201
+    except IntegrityError:
+        # The session was deleted after the ownership check
+        db.session.rollback()
+        return jsonify({"status": "Error", "message": "Invalid session or unauthorized"}), 403
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "Error", "message": str(e)}), 500
 
 # Route to Create New Chat Session
 @app.route('/new_session', methods=['POST'])
@@ -179,94 +418,159 @@ def new_session():
     user_id = data['user_id']
 
     new_session_id = str(uuid.uuid4())
-    with db_lock:
-        try:
-            new_chat_session = ChatSession(id=new_session_id, title=f"Chat {new_session_id[:8]}", user_id=user_id)
-            db.session.add(new_chat_session)
-            db.session.commit()
-            return jsonify({"session_id": new_session_id, "title": new_chat_session.title}), 201
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({"status": "Error", "message": str(e)}), 500
+    try:
+        new_chat_session = ChatSession(id=new_session_id, title=f"Chat {new_session_id[:8]}", user_id=user_id)
+        db.session.add(new_chat_session)
+        db.session.commit()
+        return jsonify({"session_id": new_session_id, "title": new_chat_session.title}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "Error", "message": str(e)}), 500
 
 # Route to Get Chat Sessions for a Specific User
 @app.route('/get_sessions/<user_id>', methods=['GET'])
 def get_sessions(user_id):
-    with db_lock:
-        try:
-            sessions = ChatSession.query.filter_by(user_id=user_id).all()
-            session_data = [{"id": session.id, "title": session.title} for session in sessions]
-            return jsonify(session_data)
-        except Exception as e:
-            return jsonify({"status": "Error", "message": str(e)}), 500
+    try:
+        def build():
+            sessions = ChatSession.query.filter_by(user_id=user_id).order_by(ChatSession.created_at, ChatSession.id).all()
+            return [{"id": session.id, "title": session.title} for session in sessions]
+        return conditional_json(sessions_version(user_id), build)
+    except Exception as e:
+        return jsonify({"status": "Error", "message": str(e)}), 500
 
 # Route to Get Chat Messages for a Session
 @app.route('/get_chats/<session_id>', methods=['GET'])
 def get_chats(session_id):
-    with db_lock:
-        try:
-            chats = Chat.query.filter_by(session_id=session_id).all()
-            chat_history = [{'sender': chat.sender, 'message': chat.message} for chat in chats]
-            return jsonify(chat_history)
-        except Exception as e:
-            return jsonify({"status": "Error", "message": str(e)}), 500
+    try:
+        def build():
+            chats = Chat.query.filter_by(session_id=session_id).order_by(Chat.id).all()
+            return [{'sender': chat.sender, 'message': chat.message} for chat in chats]
+        return conditional_json(chats_version(session_id), build)
+    except Exception as e:
+        return jsonify({"status": "Error", "message": str(e)}), 500
 
 # Route to Get All Chat Sessions
 @app.route('/get_all_sessions/<user_id>', methods=['GET'])
 def get_all_sessions(user_id):
-    with db_lock:
-        try:
-            sessions = ChatSession.query.filter_by(user_id=user_id).all()
-            session_list = [{'session_id': session.id, 'title': session.title, 'created_at': session.created_at.isoformat()} for session in sessions]
-            return jsonify(session_list)
-        except Exception as e:
-            return jsonify({"status": "Error", "message": str(e)}), 500
+    try:
+        def build():
+            sessions = ChatSession.query.filter_by(user_id=user_id).order_by(ChatSession.created_at, ChatSession.id).all()
+            return [{'session_id': session.id, 'title': session.title, 'created_at': session.created_at.isoformat()} for session in sessions]
+        return conditional_json(sessions_version(user_id), build)
+    except Exception as e:
+        return jsonify({"status": "Error", "message": str(e)}), 500
 
 # Route to Delete a Chat Session
 @app.route('/delete_chat/<session_id>', methods=['DELETE'])
 def delete_chat(session_id):
-    with db_lock:
-        try:
-            Chat.query.filter_by(session_id=session_id).delete()
-            ChatSession.query.filter_by(id=session_id).delete()
-            db.session.commit()
-            return jsonify({"status": "Chat deleted successfully!"}), 200
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({"status": "Error deleting chat", "error": str(e)}), 500
+    try:
+        # Lock the session row so a concurrent /save_chat (whose foreign-key check needs
+        # a share lock on it) waits for the delete instead of racing it
+        ChatSession.query.filter_by(id=session_id).with_for_update().first()
+        Chat.query.filter_by(session_id=session_id).delete()
+        ChatSession.query.filter_by(id=session_id).delete()
+        db.session.commit()
+        chat_history_cache.invalidate(session_id)
+        return jsonify({"status": "Chat deleted successfully!"}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "Error deleting chat", "error": str(e)}), 500
 
 # Route to Cleanup Empty Sessions
 @app.route('/cleanup_empty_sessions', methods=['DELETE'])
 def cleanup_empty_sessions():
-    with db_lock:
-        try:
-            active_sessions = db.session.query(Chat.session_id).distinct().all()
-            active_session_ids = [session[0] for session in active_sessions]
-            empty_sessions = ChatSession.query.filter(~ChatSession.id.in_(active_session_ids)).all()
-
-            for session in empty_sessions:
-                db.session.delete(session)
-
-            db.session.commit()
-            return jsonify({"status": "Empty chat sessions cleaned up!"}), 200
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({"status": "Error during cleanup", "error": str(e)}), 500
+    try:
+        # ?min_age=<seconds> spares sessions created more recently than that (default: all empty sessions)
+        report = chat_maintenance.delete_empty_sessions(min_age=float(request.args.get("min_age", 0)))
+        return jsonify({"status": "Empty chat sessions cleaned up!", **report}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"status": "Error during cleanup", "error": str(e)}), 500
 
 # Route to Get a Specific Chat Session
 @app.route('/get_chat/<session_id>', methods=['GET'])
 def get_chat(session_id):
-    with db_lock:
-        try:
-            chat_session = ChatSession.query.filter_by(id=session_id).first()
-            if chat_session:
-                messages = Chat.query.filter_by(session_id=session_id).all()
-                message_list = [{'sender': msg.sender, 'message': msg.message} for msg in messages]
-                return jsonify({"messages": message_list}), 200
-            else:
-                return jsonify({"status": "Error", "message": "Session not found"}), 404
-        except Exception as e:
-            return jsonify({"status": "Error", "message": str(e)}), 500
+    try:
+        chat_session = ChatSession.query.filter_by(id=session_id).first()
+        if chat_session:
+            def build():
+                messages = Chat.query.filter_by(session_id=session_id).order_by(Chat.id).all()
+                return {"messages": [{'sender': msg.sender, 'message': msg.message} for msg in messages]}
+            return conditional_json(chats_version(session_id), build)
+        else:
+            return jsonify({"status": "Error", "message": "Session not found"}), 404
+    except Exception as e:
+        return jsonify({"status": "Error", "message": str(e)}), 500
+
+#----------------------------------------Paginated Listing Routes----------------------------------------
+# Keyset pagination: each page is one index range scan on the composite indexes,
+# however deep the client has scrolled. Pass next_cursor back as ?cursor= for the next page.
+
+@app.route('/get_sessions_page/<user_id>', methods=['GET'])
+def get_sessions_page(user_id):
+    """A user's sessions, newest first: {"sessions": [...], "next_cursor": str | null}."""
+    limit = page_limit()
+    cursor = request.args.get("cursor")
+    try:
+        created_at, session_id = decode_cursor(cursor) if cursor else (None, None)
+        if created_at is not None:
+            created_at = dt.fromisoformat(created_at)
+    except (ValueError, TypeError) as e:
+        return jsonify({"status": "Error", "message": str(e)}), 400
+
+    try:
+        def build():
+            query = ChatSession.query.filter(ChatSession.user_id == user_id)
+            if cursor:
+                query = query.filter(tuple_(ChatSession.created_at, ChatSession.id) < tuple_(created_at, session_id))
+            sessions = query.order_by(ChatSession.created_at.desc(), ChatSession.id.desc()).limit(limit + 1).all()
+
+            page = sessions[:limit]
+            next_cursor = None
+            if len(sessions) > limit:
+                next_cursor = encode_cursor([page[-1].created_at.isoformat(), page[-1].id])
+            return {
+                "sessions": [{'session_id': session.id, 'title': session.title, 'created_at': session.created_at.isoformat()} for session in page],
+                "next_cursor": next_cursor
+            }
+        return conditional_json(sessions_version(user_id), build)
+    except Exception as e:
+        return jsonify({"status": "Error", "message": str(e)}), 500
+
+@app.route('/get_chats_page/<session_id>', methods=['GET'])
+def get_chats_page(session_id):
+    """A page of a session's messages, walking back from the newest.
+
+    Messages inside a page are oldest first; {"messages": [...], "next_cursor": str | null}
+    where next_cursor fetches the page of older messages.
+    """
+    limit = page_limit()
+    cursor = request.args.get("cursor")
+    try:
+        before_id = int(decode_cursor(cursor)[0]) if cursor else None
+    except (ValueError, IndexError, TypeError):
+        return jsonify({"status": "Error", "message": "Invalid cursor"}), 400
+
+    try:
+        def build():
+            query = Chat.query.filter(Chat.session_id == session_id)
+            if before_id is not None:
+                query = query.filter(Chat.id < before_id)
+            chats = query.order_by(Chat.id.desc()).limit(limit + 1).all()
+
+            page = chats[:limit]
+            next_cursor = encode_cursor([page[-1].id]) if len(chats) > limit else None
+            return {
+                "messages": [
+                    {'id': chat.id, 'sender': chat.sender, 'message': chat.message,
+                     'created_at': chat.created_at.isoformat() if chat.created_at else None}
+                    for chat in reversed(page)
+                ],
+                "next_cursor": next_cursor
+            }
+        return conditional_json(chats_version(session_id), build)
+    except Exception as e:
+        return jsonify({"status": "Error", "message": str(e)}), 500
 
 #----------------------------------------Updated Chatbot Query Route----------------------------------------
 @app.route('/query_chatbot', methods=['POST'])
@@ -282,17 +586,27 @@ def query_chatbot():
         return jsonify({"error": "Invalid request data - Missing required fields"}), 400
 
     try:
-        with db_lock:
-            chat_messages = Chat.query.filter_by(session_id=session_id).order_by(Chat.id).all()
-            chat_history = [{'sender': msg.sender, 'message': msg.message} for msg in chat_messages]
+        # Loaded once here and shared by the answer cache and both branches
+        chat_history = load_chat_history(session_id)
 
-        numerical_data, numerical_status = handle_numerical_query(user_question, selected_company, session_id)
-        contextual_data, contextual_status = handle_contextual_query(user_question, selected_company, session_id)
+        cached_response = answer_cache.get(user_question, selected_company, chat_history)
+        if cached_response is not None:
+            print(f"⚡ Answer cache hit for [{selected_company}] {user_question}")
+            return jsonify({"response": cached_response}), 200
+
+        deadline = time.monotonic() + QUERY_DEADLINE
+        branch_results = run_query_branches(user_question, selected_company, chat_history, deadline)
+        numerical_data, numerical_status = branch_results["numerical"]
+        contextual_data, contextual_status = branch_results["contextual"]
 
         numerical_text = numerical_data.get('response') if numerical_status == 200 else str(numerical_data.get('error'))
         contextual_text = contextual_data.get('response') if contextual_status == 200 else str(contextual_data.get('error'))
 
-        summarized_response = summarize_responses(user_question, numerical_text, contextual_text)
+        summarized_response = summarize_responses(user_question, numerical_text, contextual_text, deadline=deadline)
+
+        # Only cache real answers, never the fallback messages or an answer built from two failed branches
+        if (numerical_status == 200 or contextual_status == 200) and summarized_response not in SUMMARY_FALLBACK_MESSAGES:
+            answer_cache.set(user_question, selected_company, summarized_response, chat_history)
 
         log_memory("After query_chatbot")
         return jsonify({"response": summarized_response}), 200
@@ -301,28 +615,126 @@ def query_chatbot():
         print(f"Error in query_chatbot: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500    
 
+#----------------------------------------Streaming (SSE) Chatbot Routes----------------------------------------
+def sse_event(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def sse_response(generator):
+    return Response(
+        stream_with_context(generator),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def stream_summary(user_question, numerical_response, contextual_response, deadline):
+    """Yield the summarizer's tokens as Groq produces them, raising TimeoutError once ``deadline`` passes."""
+    prompt = build_summary_prompt(user_question, numerical_response, contextual_response)
+    stream = GroqWrapper.stream_summarize_request(
+        model=SUMMARY_MODEL,
+        messages=[{"role": "system", "content": prompt}],
+        max_tokens=512,
+        temperature=0.3,
+        deadline=deadline
+    )
+    for delta in stream:
+        if time.monotonic() >= deadline:
+            stream.close()
+            raise TimeoutError("Request deadline exceeded while streaming the summary")
+        yield delta
+
+@app.route('/query_chatbot_stream', methods=['POST'])
+def query_chatbot_stream():
+    """Same pipeline as /query_chatbot, streamed as server-sent events.
+
+    Emits "stage" events as each step finishes (SQL generated, rows fetched,
+    documents retrieved, ...), "token" events with the summarizer output, and a
+    final "done" event carrying the full response. If the summary stream breaks
+    off part-way, an "error" event replaces "done" and nothing is cached.
+    """
+    data = request.get_json()
+    user_question = data.get("question")
+    session_id = data.get("session_id")
+    user_id = data.get("user_id")
+    selected_company = data.get("selected_company")
+
+    if not user_question or not session_id or not user_id or not selected_company:
+        return jsonify({"error": "Invalid request data - Missing required fields"}), 400
+
+    def generate():
+        chat_history = load_chat_history(session_id)
+        cached_response = answer_cache.get(user_question, selected_company, chat_history)
+        if cached_response is not None:
+            yield sse_event("stage", {"stage": "cache_hit"})
+            yield sse_event("done", {"response": cached_response})
+            return
+
+        events = queue.Queue()
+        branch_results = {}
+        deadline = time.monotonic() + QUERY_DEADLINE
+
+        def progress(stage, **details):
+            events.put(sse_event("stage", {"stage": stage, **details}))
+
+        def run_branches():
+            try:
+                branch_results.update(run_query_branches(user_question, selected_company, chat_history, deadline, progress))
+            finally:
+                events.put(None)
+
+        # A plain thread: run_query_branches itself waits on branch_executor futures
+        threading.Thread(target=run_branches, daemon=True).start()
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            yield event
+
+        numerical_data, numerical_status = branch_results.get("numerical", ({"error": "Numerical branch failed"}, 500))
+        contextual_data, contextual_status = branch_results.get("contextual", ({"error": "Contextual branch failed"}, 500))
+        numerical_text = numerical_data.get('response') if numerical_status == 200 else str(numerical_data.get('error'))
+        contextual_text = contextual_data.get('response') if contextual_status == 200 else str(contextual_data.get('error'))
+
+        yield sse_event("stage", {"stage": "summarizing"})
+        parts = []
+        try:
+            for delta in stream_summary(user_question, numerical_text, contextual_text, deadline):
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+        except Exception as e:
+            # A cut-off answer is neither cached nor presented as the final response
+            print(f"❌ Streaming summarization failed after {len(parts)} tokens: {e}")
+            if parts:
+                yield sse_event("error", {"error": TECHNICAL_DIFFICULTIES_MESSAGE, "partial": True})
+            else:
+                yield sse_event("done", {"response": TECHNICAL_DIFFICULTIES_MESSAGE})
+            return
+
+        summarized_response = "".join(parts).strip()
+        if (numerical_status == 200 or contextual_status == 200) and summarized_response:
+            answer_cache.set(user_question, selected_company, summarized_response, chat_history)
+        yield sse_event("done", {"response": summarized_response})
+
+    return sse_response(generate())
+
 @app.route('/api/companies', methods=['GET'])
 def fetch_companies():
     """API Endpoint to get company names"""
-    return jsonify(get_company_names_from_db())
+    return jsonify(ddl_registry.get_company_names())
 
 @app.route('/api/sec_reports/<company>', methods=['GET'])
 def get_sec_reports(company):
     company = company.upper()
 
-    connection = get_db_connection()
-
-    cursor = connection.cursor()
-
     query = """
         SELECT quarter, filing_url
         FROM sec_filings
         WHERE UPPER(company_name) = :company
     """
-    cursor.execute(query, {"company": company})
-    result = cursor.fetchall()
-    cursor.close()
-    connection.close()
+    with get_db_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(query, {"company": company})
+            result = cursor.fetchall()
 
     if not result:
         return jsonify({"error": "No SEC filings found"}), 404
@@ -336,27 +748,62 @@ def get_key_metrics():
     """Endpoint to check key usage statistics"""
     try:
         stats = key_manager.get_usage_stats()
+        stats["embedding_keys"] = embedding_pool.get_usage_stats()
         return jsonify(stats), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+#----------------------------------------Cache Metrics Endpoint----------------------------------------
+@app.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """Endpoint to check cache hit/miss statistics"""
+    try:
+        return jsonify({
+            "answer_cache": answer_cache.get_stats(),
+            "sql_cache": sql_cache.get_stats(),
+            "fast_sql": fast_sql_stats.get_stats(),
+            "chat_history": chat_history_cache.get_stats(),
+            "embeddings": embedding_cache.get_stats(),
+            "pdf_local_index": local_vector_index.get_stats(),
+            "filing_bm25": filing_chunks_bm25.get_stats(),
+            "context_packer": context_packer.get_stats()
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/snapshot/refresh', methods=['POST'])
+def refresh_snapshot():
+    """Endpoint to pull a fresh copy of the *_QUARTERLY tables into the local snapshot"""
+    try:
+        changed = refresh_financial_snapshot()
+        return jsonify({"status": "Snapshot refreshed", "changed_tables": changed, "snapshot": financial_snapshot.get_stats()}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/sql_cache/invalidate', methods=['POST'])
+def invalidate_sql_cache():
+    """Endpoint for data-load jobs: drop cached SQL results for reloaded *_QUARTERLY tables and cached answers"""
+    data = request.get_json() or {}
+    tables = data.get("tables")
+    if not tables or not isinstance(tables, list):
+        return jsonify({"error": "Provide a list of table names in 'tables'"}), 400
+
+    invalidated = invalidate_cached_data(tables)
+    return jsonify({"status": "SQL result and answer caches invalidated", "tables": invalidated}), 200
+
 #----------------------------------------Utility Functions----------------------------------------
+HIGH_DEMAND_MESSAGE = "We are currently experiencing high demand. Please try again later."
+RATE_LIMITED_MESSAGE = "We are currently handling a high number of requests. Please try again in a few minutes."
+UNAUTHORIZED_MESSAGE = "We are currently unable to process this request. Please try again later."
+TECHNICAL_DIFFICULTIES_MESSAGE = "We are experiencing technical difficulties. Please try again later."
+SUMMARY_FALLBACK_MESSAGES = (HIGH_DEMAND_MESSAGE, RATE_LIMITED_MESSAGE, UNAUTHORIZED_MESSAGE, TECHNICAL_DIFFICULTIES_MESSAGE)
 
 #Summarization Function
-def summarize_responses(user_question, numerical_response, contextual_response):
-    """Summarize and format responses with detailed logging"""
-    print("\n=== STARTING RESPONSE SUMMARIZATION ===")
-    print(f"User Question: {user_question}")
-    print(f"Numerical Response: {numerical_response}")
-    print(f"Contextual Response: {contextual_response[:200]}...")  # Show preview
-    
-    # Ensure numerical_text is always a string
-    numerical_str = str(numerical_response) if numerical_response else "No numerical data available"
-    print(f"\n[1/3] Formatted Numerical Response: {numerical_str}")
-    
-    model_name = "mistral-saba-24b"
-    max_retries = 3
-    prompt = f"""
+SUMMARY_MODEL = "mistral-saba-24b"
+
+def build_summary_prompt(user_question, numerical_response, contextual_response):
+    """Prompt that merges the SQL and RAG answers into one formatted reply."""
+    return f"""
     You are an AI assistant that prioritizes the numerical response from a SQL Database to answer financial questions, supported by a contextual RAG response. Your job is to decide the correct answer, then FORMAT the output correctly based on the user's question.
 
     ### Decision Rule:
@@ -382,9 +829,31 @@ def summarize_responses(user_question, numerical_response, contextual_response):
     If you used the numerical response, always end with:
     "All monetary values are in millions."
 """
+
+def summarize_responses(user_question, numerical_response, contextual_response, deadline=None):
+    """Summarize and format responses with detailed logging.
+
+    If a ``deadline`` (time.monotonic() timestamp) is given, each Groq call times out at it,
+    backoff sleeps are cut short by it and no attempt is started once it has passed.
+    """
+    print("\n=== STARTING RESPONSE SUMMARIZATION ===")
+    print(f"User Question: {user_question}")
+    print(f"Numerical Response: {numerical_response}")
+    print(f"Contextual Response: {contextual_response[:200]}...")  # Show preview
+    
+    # Ensure numerical_text is always a string
+    numerical_str = str(numerical_response) if numerical_response else "No numerical data available"
+    print(f"\n[1/3] Formatted Numerical Response: {numerical_str}")
+    
+    model_name = SUMMARY_MODEL
+    max_retries = 3
+    prompt = build_summary_prompt(user_question, numerical_response, contextual_response)
     print(f"\n[2/3] Generated Prompt (Preview):\n{prompt[:500]}...")  # Show first 500 chars
 
     for attempt in range(max_retries):
+        if deadline is not None and time.monotonic() >= deadline:
+            print("  Request deadline exceeded, giving up on summarization retries")
+            break
         try:
             print(f"\nAttempt {attempt + 1}/{max_retries}: Querying LLM...")
             start_time = time.time()
@@ -394,7 +863,8 @@ def summarize_responses(user_question, numerical_response, contextual_response):
                 model=model_name,
                 messages=[{"role": "system", "content": prompt}],
                 max_tokens=512,
-                temperature=0.3
+                temperature=0.3,
+                deadline=deadline
             )
             
             if error:
@@ -416,151 +886,174 @@ def summarize_responses(user_question, numerical_response, contextual_response):
             return formatted_response
             
         except Exception as e:
-            error_message = str(e).lower()
-            print(f"\n⚠️ Attempt {attempt + 1} failed with error: {error_message}")
-
-            # Handle specific error cases with logging
-            if "503" in error_message or "service unavailable" in error_message:
-                print("  Detected service unavailable error")
-                if attempt == max_retries - 1:
-                    print("  Max retries reached for service unavailable")
-                    return "We are currently experiencing high demand. Please try again later."
-                time.sleep((attempt + 1) * 2)
-                continue
-
-            if "rate limit" in error_message or "too many requests" in error_message:
-                print("  Detected rate limiting")
-                if attempt == max_retries - 1:
-                    print("  Max retries reached for rate limiting")
-                    return "We are currently handling a high number of requests. Please try again in a few minutes."
-                time.sleep((attempt + 1) * 2)
-                continue
-
-            if "unauthorized" in error_message or "invalid api key" in error_message:
-                print("  Detected authorization error")
-                return "We are currently unable to process this request. Please try again later."
-
-            if attempt == max_retries - 1:
-                print("  Max retries reached for generic error")
-                return "We are experiencing technical difficulties. Please try again later."
-
-            print(f"  Waiting {((attempt + 1) * 2)} seconds before retry...")
-            time.sleep((attempt + 1) * 2)
+            fallback = summary_retry_fallback(e, attempt, max_retries)
+            if fallback:
+                return fallback
+            time.sleep(summary_retry_delay(attempt, deadline))
 
     print("\n=== SUMMARIZATION FAILED AFTER ALL RETRIES ===")
-    return "We are experiencing technical difficulties. Please try again later."
-
-
-def get_ddl_prefix_from_db(company_name):
-    """Fetch DDL prefix from the Oracle database mapping table."""
-    connection = get_db_connection()
-
-    cursor = connection.cursor()
-
-    query = "SELECT DDL_PREFIX FROM COMPANY_MAPPING WHERE LOWER(COMPANY_NAME) = LOWER(:company_name)"
-    cursor.execute(query, {"company_name": company_name})
-    
-    result = cursor.fetchone()
-    cursor.close()
-    connection.close()
+    return TECHNICAL_DIFFICULTIES_MESSAGE
 
-    return result[0] if result else None
+def summary_retry_delay(attempt, deadline=None):
+    """Seconds to wait before retrying after ``attempt``, never past the request ``deadline``."""
+    delay = (attempt + 1) * 2
+    if deadline is not None:
+        delay = min(delay, max(deadline - time.monotonic(), 0))
+    return delay
 
-def get_company_names_from_db():
-    """Fetch distinct company names from the COMPANY_MAPPING table."""
-    connection = get_db_connection()
+def summary_retry_fallback(error, attempt, max_retries):
+    """Classify a failed summarization attempt.
 
-    cursor = connection.cursor()
-    query = "SELECT DISTINCT UPPER(COMPANY_NAME) FROM COMPANY_MAPPING"
-    cursor.execute(query)
-    
-    companies = [row[0] for row in cursor.fetchall()]
-    cursor.close()
-    connection.close()
-    
-    return companies
-
-# Retrieve database configuration
-db_config = {
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "dsn": os.getenv("DB_DSN"),
-    "wallet_location": os.getenv("DB_WALLET_LOCATION"),
-}
-
-def handle_numerical_query(user_question, selected_company, session_id=None):
+    Returns the fallback message to give the user, or None if the caller should
+    wait ``summary_retry_delay(attempt, deadline)`` seconds and retry.
+    """
+    error_message = str(error).lower()
+    print(f"\n⚠️ Attempt {attempt + 1} failed with error: {error_message}")
+
+    # Handle specific error cases with logging
+    if "503" in error_message or "service unavailable" in error_message:
+        print("  Detected service unavailable error")
+        if attempt == max_retries - 1:
+            print("  Max retries reached for service unavailable")
+            return HIGH_DEMAND_MESSAGE
+        return None
+
+    if "rate limit" in error_message or "too many requests" in error_message:
+        print("  Detected rate limiting")
+        if attempt == max_retries - 1:
+            print("  Max retries reached for rate limiting")
+            return RATE_LIMITED_MESSAGE
+        return None
+
+    if "unauthorized" in error_message or "invalid api key" in error_message:
+        print("  Detected authorization error")
+        return UNAUTHORIZED_MESSAGE
+
+    if attempt == max_retries - 1:
+        print("  Max retries reached for generic error")
+        return TECHNICAL_DIFFICULTIES_MESSAGE
+
+    print("  Retrying after a backoff...")
+    return None
+
+
+def emit_progress(progress, stage, **details):
+    """Report a finished pipeline stage to an optional ``progress(stage, **details)`` callback."""
+    if progress:
+        progress(stage, **details)
+
+WRITE_OPERATION_PATTERNS = [
+    r"\b(?:insert|update|delete|drop|create|rename|replace|modify|insertMany|updateMany|bulkWrite)\b",
+    r"\$set\b",
+    r"\$push\b",
+    r"\$addToSet\b",
+    r"\$pull\b"
+]
+
+def is_write_operation(sql_query):
+    """True if generated SQL looks like it would modify data (it is then never executed)."""
+    return any(re.search(pattern, sql_query, re.IGNORECASE) for pattern in WRITE_OPERATION_PATTERNS)
+
+# The numerical pipeline's steps, shared by handle_numerical_query and its asyncio
+# counterpart in asgi_app; only the LLM call and the Oracle query differ between them.
+NUMERICAL_SQL_MODEL = "llama-3.3-70b-versatile"
+
+def numerical_query_company(selected_company):
+    """(company entry, None), or (None, (error, status)) if the company can't be queried."""
+    if not selected_company:
+        return None, ({"error": "No company selected for numerical query"}, 400)
+
+    company_entry = ddl_registry.get_company(selected_company)
+    if not company_entry:
+        return None, ({"error": "Company not recognized"}, 404)
+
+    if not company_entry.ddl_text:
+        return None, ({"error": "DDL not found for the specified company"}, 404)
+    return company_entry, None
+
+def cached_or_fast_sql(user_question, selected_company, company_entry, chat_history):
+    """(sql, source) from the SQL cache or the deterministic fast path, or (None, None) if the LLM has to write it."""
+    sql_query = sql_cache.get_sql(selected_company, user_question, chat_history)
+    if sql_query:
+        print(f"⚡ SQL cache hit: {sql_query}")
+        return sql_query, "cache"
+
+    # Templated metric questions are parsed deterministically; only the rest go to the LLM
+    sql_query = generate_fast_sql(user_question, company_entry)
+    fast_sql_stats.record(sql_query is not None)
+    if sql_query:
+        print(f"⚡ Fast-path SQL: {sql_query}")
+        return sql_query, "fast_path"
+    return None, None
+
+def rejected_sql(sql_query, sql_source, progress=None):
+    """Error response for missing SQL or SQL that would modify data, else None."""
+    if not sql_query:
+        return {"error": "Failed to extract SQL query from LLM response."}, 500
+
+    print(f"Generated SQL Query: {sql_query}")
+    emit_progress(progress, "sql_generated", source=sql_source, sql=sql_query)
+    if is_write_operation(sql_query):
+        return {"error": "Failed to run SQL query due to security concerns."}, 500
+    return None
+
+def local_rows(sql_query):
+    """(rows, source) from the result cache or the local snapshot; rows is None if only Oracle can answer."""
+    results = sql_cache.get_result(sql_query)
+    if results is not None:
+        return results, "cache"
+    # Local snapshot first; Oracle only for statements it cannot answer
+    return financial_snapshot.execute(sql_query), "snapshot"
+
+def numerical_response(user_question, selected_company, chat_history, sql_query, sql_source, results, rows_source, error_msg="", progress=None):
+    """Cache what ran and build the branch's (data, status)."""
+    emit_progress(progress, "rows_fetched", source=rows_source, rows=len(results or []))
+    if not results:
+        return {"error": error_msg or "SQL query returned no results."}, 404
+
+    if rows_source != "cache":
+        sql_cache.set_result(sql_query, results)
+    # Only remember SQL that actually ran and returned rows, keyed on the history the LLM saw
+    sql_cache.set_sql(selected_company, user_question, sql_query, None if sql_source == "fast_path" else chat_history)
+    print(results)
+    return {"response": results}, 200
+
+def handle_numerical_query(user_question, selected_company, chat_history=None, progress=None):
     try:
-        if not selected_company:
-            return {"error": "No company selected for numerical query"}, 400
-        
-        ddl_directory = "Oracle_DDLs"
-        model_name = "llama-3.3-70b-versatile"
-        ddl_prefix = get_ddl_prefix_from_db(selected_company)
-
-        # Get chat history if session_id is provided
-        chat_history = []
-        if session_id:
-            with db_lock:
-                chat_messages = Chat.query.filter_by(session_id=session_id).order_by(Chat.id).all()
-                chat_history = [{'sender': msg.sender, 'message': msg.message} for msg in chat_messages]
-
-        if ddl_prefix:
-            ddl_file_path = os.path.join(ddl_directory, f"{ddl_prefix}_ddl.sql")
-        else:
-            return {"error": "Company not recognized"}, 404
-
-        if not os.path.exists(ddl_file_path):
-            return {"error": "DDL not found for the specified company"}, 404
-
-        with open(ddl_file_path, "r", encoding="utf-8") as ddl_file:
-            ddl_content = ddl_file.read().strip()
-
-        llm_output = query_llm(user_question, ddl_content, model_name, key_manager.get_sql_key(), chat_history=chat_history)
-
-        if not llm_output:
-            return {"error": "Failed to generate a response from LLM."}, 500
-
-        sql_query, notes = extract_sql_and_notes(llm_output)
-        if sql_query:
-            print(f"Generated SQL Query: {sql_query}")
-            write_operation_patterns = [
-                r"\b(?:insert|update|delete|drop|create|rename|replace|modify|insertMany|updateMany|bulkWrite)\b",
-                r"\$set\b", 
-                r"\$push\b", 
-                r"\$addToSet\b",  
-                r"\$pull\b"  
-            ]
-            for pattern in write_operation_patterns:
-                if re.search(pattern, sql_query, re.IGNORECASE):
-                    return {"error": "Failed to run SQL query due to security concerns."}, 500
-
-            results, columns, exec_time, error_msg = execute_sql(sql_query, db_config)
-            if results:
-                formatted_results = results
-                
-                print(formatted_results)
-                return {"response": formatted_results}, 200
-        else:
-            return {"error": "Failed to extract SQL query from LLM response."}, 500
+        company_entry, error = numerical_query_company(selected_company)
+        if error:
+            return error
+
+        sql_query, sql_source = cached_or_fast_sql(user_question, selected_company, company_entry, chat_history)
+        if not sql_query:
+            sql_source = "llm"
+            llm_output = query_llm(user_question, company_entry.ddl_text, NUMERICAL_SQL_MODEL, key_manager.get_sql_key(), chat_history=chat_history)
+
+            if not llm_output:
+                return {"error": "Failed to generate a response from LLM."}, 500
+
+            sql_query, notes = extract_sql_and_notes(llm_output)
+
+        error = rejected_sql(sql_query, sql_source, progress)
+        if error:
+            return error
+
+        results, rows_source = local_rows(sql_query)
+        error_msg = ""
+        if results is None:
+            rows_source = "oracle"
+            results, columns, exec_time, error_msg = execute_sql(sql_query)
+        return numerical_response(user_question, selected_company, chat_history, sql_query, sql_source, results, rows_source, error_msg, progress)
     except Exception as e:
         return {"error": str(e)}, 500
     
     
 # Handle Contextual (RAG-based) Queries
-def handle_contextual_query(user_question, selected_company, session_id=None):
+def handle_contextual_query(user_question, selected_company, chat_history=None, progress=None):
     """Handle contextual queries using MongoDB Atlas Vector Search with conversation history."""
     try:
-    
-        # Get chat history if session_id is provided
-        # Get chat history within the same context
-        chat_history = []
-        if session_id:
-            with db_lock:
-                chat_messages = Chat.query.filter_by(session_id=session_id).order_by(Chat.id).all()
-                chat_history = [{'sender': msg.sender, 'message': msg.message} for msg in chat_messages]
-        
         final_query = f"[Company: {selected_company}] {user_question}"
-        response, relevant_docs = query_llm_groq(final_query, selected_company, chat_history)
+        response, relevant_docs = query_llm_groq(final_query, selected_company, chat_history, progress=progress)
         
         if isinstance(response, str) and response.startswith("❌"):
             return {"error": response}, 500
@@ -574,9 +1067,77 @@ def handle_contextual_query(user_question, selected_company, session_id=None):
         return {"error": str(e)}, 500
     
 
+#----------------------------------------Concurrent Query Orchestration----------------------------------------
+# The numerical (SQL) and contextual (RAG) branches are independent and mostly wait on
+# Groq, Google, MongoDB and Oracle, so they run side by side instead of back to back.
+NUMERICAL_BRANCH_TIMEOUT = float(os.getenv("NUMERICAL_BRANCH_TIMEOUT", 30))
+CONTEXTUAL_BRANCH_TIMEOUT = float(os.getenv("CONTEXTUAL_BRANCH_TIMEOUT", 30))
+QUERY_DEADLINE = float(os.getenv("QUERY_DEADLINE", 45))
+
+# A branch that times out is only reported as skipped: Python threads can't be stopped, so it
+# keeps its worker until its Groq/Oracle/Mongo call returns. Under sustained load with slow
+# backends the pool can back up and new branches then wait in its queue (and time out in turn);
+# size QUERY_BRANCH_WORKERS for about 2 x concurrent requests plus the branches left running.
+branch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("QUERY_BRANCH_WORKERS", 16)),
+    thread_name_prefix="query-branch"
+)
+
+def _run_branch(handler, *args):
+    """Run a query handler inside the app context of its worker thread."""
+    with app.app_context():
+        return handler(*args)
+
+def run_query_branches(user_question, selected_company, chat_history, deadline, progress=None):
+    """Run both query branches concurrently and collect their (data, status) results.
+
+    Each branch is bounded by its own timeout and by the overall request ``deadline``
+    (a time.monotonic() timestamp). A branch that does not finish in time is reported
+    as a 504 error so the summarizer can still work with whatever the other branch returned.
+    ``progress(stage, **details)`` is called from the branch threads as stages finish.
+    """
+    started = time.monotonic()
+    branches = {
+        "numerical": (handle_numerical_query, NUMERICAL_BRANCH_TIMEOUT),
+        "contextual": (handle_contextual_query, CONTEXTUAL_BRANCH_TIMEOUT),
+    }
+    futures = {
+        name: branch_executor.submit(_run_branch, handler, user_question, selected_company, chat_history, progress)
+        for name, (handler, _) in branches.items()
+    }
+
+    results = {}
+    for name, future in futures.items():
+        timeout = branches[name][1]
+        remaining = min(started + timeout, deadline) - time.monotonic()
+        try:
+            results[name] = future.result(timeout=max(remaining, 0))
+            print(f"✅ {name} branch finished in {time.monotonic() - started:.2f}s")
+            emit_progress(progress, f"{name}_done", status=results[name][1])
+        except FuturesTimeoutError:
+            future.cancel()  # only drops a branch still queued; a running one finishes in the background
+            print(f"⚠️ {name} branch timed out after {time.monotonic() - started:.2f}s")
+            results[name] = ({"error": f"The {name} lookup took too long and was skipped."}, 504)
+        except Exception as e:
+            print(f"❌ {name} branch failed: {e}")
+            results[name] = ({"error": str(e)}, 500)
+
+    return results
+
 #------------------------------------------PDF Processing---------------------------------------- 
-# Dictionary to track PDF processing status
-pdf_status = {}
+def run_pdf_job(job, progress):
+    """PdfJobQueue handler: embed and store one uploaded PDF."""
+    ensure_components()
+    if rag_system is None:
+        raise RuntimeError("RAG system is not initialized")
+    if not os.path.exists(job["file_path"]):
+        raise FileNotFoundError(f"Uploaded file is gone: {job['file_path']}")
+    print(f"⚙️ Processing PDF for user: {job['user_id']}")
+    return rag_system.process_pdf(job["file_path"], job["user_id"], progress=progress, filename=job["filename"])
+
+# PDF processing runs on a bounded pool of job workers; job state lives in the pdf_job table
+pdf_jobs = PdfJobQueue(app, db, PdfJob, run_pdf_job)
+pdf_jobs.start_workers()
 
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -625,11 +1186,11 @@ def upload_pdf():
     if not file.filename.endswith(".pdf"):
         return jsonify({"error": "Invalid file format"}), 400
 
-    # Save under a user-specific folder
-    user_upload_folder = os.path.join(UPLOAD_FOLDER, user_id)
-    os.makedirs(user_upload_folder, exist_ok=True)
+    # Save under a folder of its own, so a re-upload never overwrites a file an earlier job is still reading
+    upload_folder = os.path.join(UPLOAD_FOLDER, user_id, uuid.uuid4().hex)
+    os.makedirs(upload_folder, exist_ok=True)
 
-    file_path = os.path.join(user_upload_folder, file.filename)
+    file_path = os.path.join(upload_folder, file.filename)
 
     try:
         # Save PDF to user folder
@@ -639,26 +1200,18 @@ def upload_pdf():
         print(f"❌ Error saving PDF: {e}")
         return jsonify({"error": f"Failed to save file: {e}"}), 500
 
-    # Track status by user+filename combo
-    status_key = f"{user_id}:{file.filename}"
-    pdf_status[status_key] = "processing"
-
-    # Background processing thread
-    def process():
-        try:
-            print(f"⚙️ Processing PDF for user: {user_id}")
-            success = rag_system.process_pdf(file_path, user_id)
-            pdf_status[status_key] = "done" if success else "failed"
-        except Exception as e:
-            pdf_status[status_key] = "failed"
-            print(f"❌ PDF processing failed: {e}")
-
-    threading.Thread(target=process).start()
+    # Queue background processing (higher priority is claimed first)
+    try:
+        priority = int(request.form.get("priority", 0))
+    except ValueError:
+        return jsonify({"error": "priority must be an integer"}), 400
+    job_id = pdf_jobs.enqueue(user_id, file.filename, file_path, priority=priority)
 
     return jsonify({
         "message": "File uploaded! Processing in background...",
         "filename": file.filename,
         "user_id": user_id,
+        "job_id": job_id,
         "status_check": f"/pdf_status/{user_id}/{file.filename}"
     })
 
@@ -696,25 +1249,65 @@ def query_pdf_chatbot():
         return jsonify({"response": "Internal server error"}), 500
 
 
+@app.route("/query_pdf_chatbot_stream", methods=["POST"])
+def query_pdf_chatbot_stream():
+    """Streaming (SSE) variant of /query_pdf_chatbot."""
+    data = request.get_json()
+    question = data.get("question", "")
+    user_id = data.get("user_id")
+    filename = data.get("filename")
+
+    if not question or not user_id or not filename:
+        return jsonify({"response": "Missing required fields: question, user_id, or filename"}), 400
+
+    def generate():
+        for event, payload in rag_system.stream_financial_data(query=question, user_id=user_id, filename=filename):
+            yield sse_event(event, payload)
+
+    return sse_response(generate())
+
+
 # API to Check PDF Processing Status
 @app.route("/pdf_status/<user_id>/<filename>", methods=["GET"])
 def check_pdf_status(user_id, filename):
     """Check PDF processing status for a specific user and file."""
-    status_key = f"{user_id}:{filename}"
-    status = pdf_status.get(status_key, "not_found")
-    return jsonify({"status": status})
+    job = pdf_jobs.get_status(user_id, filename)
+    if job is None:
+        return jsonify({"status": "not_found"})
+    return jsonify({
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "job_id": job["id"],
+        "attempts": job["attempts"],
+        "error": job["error"]
+    })
+
+@app.route("/pdf_cancel/<user_id>/<filename>", methods=["POST"])
+def cancel_pdf_processing(user_id, filename):
+    """Cancel a queued PDF job, or stop a running one at its next progress report."""
+    cancelled = pdf_jobs.cancel(user_id, filename)
+    if not cancelled:
+        return jsonify({"error": "No queued or running job for this file"}), 404
+    return jsonify({"status": "cancelling", "jobs": cancelled})
 
 #----------------------------------------Show Company Metrics----------------------------------
 def get_metrics_for_company(company_name):
-    """Fetch available metrics from all financial tables for a selected company."""
-    ddl_prefix = get_ddl_prefix_from_db(company_name)
+    """Fetch available metrics from all financial tables for a selected company.
+
+    Served from the DDL registry; Oracle is only queried if the registry has no METRICS for the company.
+    """
+    company_entry = ddl_registry.get_company(company_name)
     
-    if not ddl_prefix:
+    if not company_entry:
         print(f"DEBUG: No DDL_PREFIX found for {company_name}")
         return {"error": f"No DDL_PREFIX found for {company_name}"}, 404
 
+    if company_entry.metrics:
+        return {"metrics": company_entry.metrics}, 200
+
     # Convert DDL_PREFIX to uppercase to match the table names in Oracle
-    ddl_prefix = ddl_prefix.upper()
+    ddl_prefix = company_entry.ddl_prefix.upper()
 
     tables = [
         f"{ddl_prefix}_BALANCE_SHEET_QUARTERLY",
@@ -725,27 +1318,22 @@ def get_metrics_for_company(company_name):
     
     metrics_set = set()
 
-    connection = get_db_connection()
-
-    cursor = connection.cursor()
-
     try:
-        for table in tables:
-            query = f'SELECT DISTINCT METRICS FROM "{table}"'
-            print(f"DEBUG: Executing query → {query}")  
-            cursor.execute(query)
-            
-            fetched_rows = cursor.fetchall()
-            print(f"DEBUG: Results from {table} → {fetched_rows}")  # Print actual results
-
-            metrics_set.update(row[0] for row in fetched_rows if row[0] is not None)
+        with get_db_connection() as connection:
+            with connection.cursor() as cursor:
+                for table in tables:
+                    query = f'SELECT DISTINCT METRICS FROM "{table}"'
+                    print(f"DEBUG: Executing query → {query}")  
+                    cursor.execute(query)
+                    
+                    fetched_rows = cursor.fetchall()
+                    print(f"DEBUG: Results from {table} → {fetched_rows}")  # Print actual results
+
+                    metrics_set.update(row[0] for row in fetched_rows if row[0] is not None)
 
     except Exception as e:
         print(f"ERROR: Failed to fetch metrics for {company_name} → {str(e)}")
         return {"error": str(e)}, 500
-    finally:
-        cursor.close()
-        connection.close()
 
     return {"metrics": list(metrics_set)}, 200
 
@@ -0,0 +1,264 @@
+#----------------------------------------Imports----------------------------------------
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as backend
+from app import (
+    app as flask_app,
+    build_summary_prompt,
+    summary_retry_fallback,
+    summary_retry_delay,
+    numerical_query_company,
+    cached_or_fast_sql,
+    rejected_sql,
+    local_rows,
+    numerical_response,
+    NUMERICAL_SQL_MODEL,
+    SUMMARY_MODEL,
+    SUMMARY_FALLBACK_MESSAGES,
+    TECHNICAL_DIFFICULTIES_MESSAGE,
+    NUMERICAL_BRANCH_TIMEOUT,
+    CONTEXTUAL_BRANCH_TIMEOUT,
+    QUERY_DEADLINE,
+)
+from real_chatbot import query_llm_async, extract_sql_and_notes, execute_sql_async
+from real_chatbot_rag import query_llm_groq_async
+from groq_wrapper import GroqWrapper
+from oracle_pool import async_oracle_pool
+from answer_cache import answer_cache
+
+# asyncio serving mode: the chat query routes run as coroutines on one event loop
+# (AsyncGroq, pymongo's AsyncMongoClient, python-oracledb async pool, asyncio.sleep
+# backoff), so in-flight chats are bounded by sockets rather than worker threads.
+# Every other route is the unchanged Flask app, mounted as WSGI.
+#
+#   uvicorn asgi_app:asgi_app --host 0.0.0.0 --port 10000
+
+#----------------------------------------Shared State----------------------------------------
+_components_lock = asyncio.Lock()
+
+async def ensure_components_async():
+    """Async wrapper around app.ensure_components (first call initializes RAG off the event loop)."""
+    if backend.components_initialized:
+        return
+    async with _components_lock:
+        if not backend.components_initialized:
+            await asyncio.to_thread(backend.ensure_components)
+
+async def load_chat_history_async(session_id):
+    """Recent chat history; reads Postgres through SQLAlchemy (at least the session's newest message id), so it runs in a worker thread."""
+    def load():
+        with flask_app.app_context():
+            return backend.load_chat_history(session_id)
+    return await asyncio.to_thread(load)
+
+#----------------------------------------Async Query Handlers----------------------------------------
+async def handle_numerical_query_async(user_question, selected_company, chat_history=None, progress=None):
+    """Async counterpart of app.handle_numerical_query, built from the same steps.
+
+    The registry, the SQL cache (SQLite with the disk backend) and the snapshot scan
+    block, so those steps run in worker threads; the LLM and Oracle calls are awaited.
+    """
+    try:
+        company_entry, error = await asyncio.to_thread(numerical_query_company, selected_company)
+        if error:
+            return error
+
+        sql_query, sql_source = await asyncio.to_thread(cached_or_fast_sql, user_question, selected_company, company_entry, chat_history)
+        if not sql_query:
+            sql_source = "llm"
+            llm_output = await query_llm_async(user_question, company_entry.ddl_text, NUMERICAL_SQL_MODEL, chat_history=chat_history)
+
+            if not llm_output:
+                return {"error": "Failed to generate a response from LLM."}, 500
+
+            sql_query, notes = extract_sql_and_notes(llm_output)
+
+        error = rejected_sql(sql_query, sql_source, progress)
+        if error:
+            return error
+
+        results, rows_source = await asyncio.to_thread(local_rows, sql_query)
+        error_msg = ""
+        if results is None:
+            rows_source = "oracle"
+            results, columns, exec_time, error_msg = await execute_sql_async(sql_query)
+        return await asyncio.to_thread(numerical_response, user_question, selected_company, chat_history,
+                                       sql_query, sql_source, results, rows_source, error_msg, progress)
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+async def handle_contextual_query_async(user_question, selected_company, chat_history=None):
+    """Async counterpart of app.handle_contextual_query."""
+    try:
+        final_query = f"[Company: {selected_company}] {user_question}"
+        response, relevant_docs = await query_llm_groq_async(final_query, selected_company, chat_history)
+
+        if isinstance(response, str) and response.startswith("❌"):
+            return {"error": response}, 500
+
+        sources = [{"source": doc["source"], "snippet": doc["text"][:200]} for doc in relevant_docs]
+        return {
+            "response": response,
+            "sources": sources
+        }, 200
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+async def run_query_branches_async(user_question, selected_company, chat_history, deadline):
+    """Both branches as concurrent tasks, with the same timeouts and 504 reporting as app.run_query_branches."""
+    started = time.monotonic()
+    branches = {
+        "numerical": (handle_numerical_query_async, NUMERICAL_BRANCH_TIMEOUT),
+        "contextual": (handle_contextual_query_async, CONTEXTUAL_BRANCH_TIMEOUT),
+    }
+
+    async def run(name, handler, timeout):
+        remaining = min(started + timeout, deadline) - time.monotonic()
+        try:
+            result = await asyncio.wait_for(handler(user_question, selected_company, chat_history), timeout=max(remaining, 0))
+            print(f"✅ {name} branch finished in {time.monotonic() - started:.2f}s")
+            return result
+        except asyncio.TimeoutError:
+            print(f"⚠️ {name} branch timed out after {time.monotonic() - started:.2f}s")
+            return {"error": f"The {name} lookup took too long and was skipped."}, 504
+        except Exception as e:
+            print(f"❌ {name} branch failed: {e}")
+            return {"error": str(e)}, 500
+
+    results = await asyncio.gather(*(run(name, handler, timeout) for name, (handler, timeout) in branches.items()))
+    return dict(zip(branches, results))
+
+async def summarize_responses_async(user_question, numerical_response, contextual_response, deadline=None):
+    """Async counterpart of app.summarize_responses (same retry policy, non-blocking backoff)."""
+    max_retries = 3
+    prompt = build_summary_prompt(user_question, numerical_response, contextual_response)
+
+    for attempt in range(max_retries):
+        if deadline is not None and time.monotonic() >= deadline:
+            print("  Request deadline exceeded, giving up on summarization retries")
+            break
+        try:
+            response, error = await GroqWrapper.make_summarize_request_async(
+                model=SUMMARY_MODEL,
+                messages=[{"role": "system", "content": prompt}],
+                max_tokens=512,
+                temperature=0.3,
+                deadline=deadline
+            )
+            if error:
+                raise Exception(error)
+
+            formatted_response = response.choices[0].message.content.strip()
+            if not formatted_response or formatted_response.lower().startswith("error"):
+                raise ValueError("Invalid response received from LLM.")
+            return formatted_response
+
+        except Exception as e:
+            fallback = summary_retry_fallback(e, attempt, max_retries)
+            if fallback:
+                return fallback
+            await asyncio.sleep(summary_retry_delay(attempt, deadline))
+
+    print("\n=== SUMMARIZATION FAILED AFTER ALL RETRIES ===")
+    return TECHNICAL_DIFFICULTIES_MESSAGE
+
+#----------------------------------------Async Routes----------------------------------------
+async def query_chatbot(request: Request):
+    """/query_chatbot with the same request and response JSON as the Flask route."""
+    data = await request.json()
+    user_question = data.get("question")
+    session_id = data.get("session_id")
+    user_id = data.get("user_id")
+    selected_company = data.get("selected_company")
+
+    if not user_question or not session_id or not user_id or not selected_company:
+        return JSONResponse({"error": "Invalid request data - Missing required fields"}, status_code=400)
+
+    try:
+        await ensure_components_async()
+
+        chat_history = await load_chat_history_async(session_id)
+
+        # The semantic tier of the answer cache may call the embedding API
+        cached_response = await asyncio.to_thread(answer_cache.get, user_question, selected_company, chat_history)
+        if cached_response is not None:
+            print(f"⚡ Answer cache hit for [{selected_company}] {user_question}")
+            return JSONResponse({"response": cached_response}, status_code=200)
+
+        deadline = time.monotonic() + QUERY_DEADLINE
+        branch_results = await run_query_branches_async(user_question, selected_company, chat_history, deadline)
+        numerical_data, numerical_status = branch_results["numerical"]
+        contextual_data, contextual_status = branch_results["contextual"]
+
+        numerical_text = numerical_data.get('response') if numerical_status == 200 else str(numerical_data.get('error'))
+        contextual_text = contextual_data.get('response') if contextual_status == 200 else str(contextual_data.get('error'))
+
+        summarized_response = await summarize_responses_async(user_question, numerical_text, contextual_text, deadline=deadline)
+
+        if (numerical_status == 200 or contextual_status == 200) and summarized_response not in SUMMARY_FALLBACK_MESSAGES:
+            await asyncio.to_thread(answer_cache.set, user_question, selected_company, summarized_response, chat_history)
+
+        return JSONResponse({"response": summarized_response}, status_code=200)
+
+    except Exception as e:
+        print(f"Error in query_chatbot (async): {str(e)}")
+        return JSONResponse({"error": "Internal server error"}, status_code=500)
+
+async def query_pdf_chatbot(request: Request):
+    """/query_pdf_chatbot with the same request and response JSON as the Flask route."""
+    try:
+        data = await request.json()
+
+        question = data.get("question", "")
+        user_id = data.get("user_id")
+        filename = data.get("filename")
+
+        if not question or not user_id or not filename:
+            return JSONResponse({"response": "Missing required fields: question, user_id, or filename"}, status_code=400)
+
+        await ensure_components_async()
+        response, sources = await backend.rag_system.query_financial_data_async(
+            query=question,
+            user_id=user_id,
+            filename=filename
+        )
+        return JSONResponse({"response": response, "sources": sources})
+
+    except Exception as e:
+        print("❌ Error processing query (async):", str(e))
+        return JSONResponse({"response": "Internal server error"}, status_code=500)
+
+#----------------------------------------ASGI App----------------------------------------
+@asynccontextmanager
+async def lifespan(_app):
+    yield
+    await async_oracle_pool.close()
+
+asgi_app = Starlette(
+    routes=[
+        Route("/query_chatbot", query_chatbot, methods=["POST"]),
+        Route("/query_pdf_chatbot", query_pdf_chatbot, methods=["POST"]),
+        # Everything else (chat history, PDF upload, metrics, SSE routes, ...) is served by Flask
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
+
+#----------------------------------------Main Execution----------------------------------------
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get("PORT", 10000))
+    uvicorn.run(asgi_app, host='0.0.0.0', port=port)
@@ -0,0 +1,78 @@
+"""Load test for the chat-history routes.
+
+Each simulated user opens its own chat session, then loops over /save_chat and
+/get_chats against a running backend. The run is repeated at increasing concurrency
+and reports throughput and latency per level. With the history routes no longer
+serialized behind one process-wide lock, throughput should keep rising with
+concurrency until the Postgres pool (POSTGRES_POOL_SIZE) is saturated; restart the
+server with a different pool size to compare.
+
+Usage: python benchmark_chat_history.py [--url http://localhost:10000] [--requests 50] [--levels 1,2,4,8,16,32]
+"""
+import sys
+import time
+import uuid
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def simulate_user(base_url, requests_per_user):
+    """One user's session; returns the latency (s) of every history request it made."""
+    http = requests.Session()
+    user_id = f"loadtest-{uuid.uuid4().hex[:8]}"
+    session_id = http.post(f"{base_url}/new_session", json={"user_id": user_id}).json()["session_id"]
+
+    latencies = []
+    for i in range(requests_per_user):
+        start = time.perf_counter()
+        if i % 2 == 0:
+            response = http.post(f"{base_url}/save_chat", json={
+                "session_id": session_id, "user_id": user_id,
+                "sender": "user", "message": f"load test message {i}"
+            })
+        else:
+            response = http.get(f"{base_url}/get_chats/{session_id}")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+    http.delete(f"{base_url}/delete_chat/{session_id}")
+    return latencies
+
+
+def run_level(base_url, concurrency, requests_per_user):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: simulate_user(base_url, requests_per_user), range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for user in results for l in user)
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    base_url = _arg("--url", "http://localhost:10000").rstrip("/")
+    requests_per_user = int(_arg("--requests", 50))
+    levels = [int(level) for level in _arg("--levels", "1,2,4,8,16,32").split(",")]
+
+    print("\n=== CHAT HISTORY LOAD TEST ===")
+    print(f"Server: {base_url} | Requests per user: {requests_per_user}")
+    print(f"{'Users':>6} {'Req/s':>10} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+    for concurrency in levels:
+        stats = run_level(base_url, concurrency, requests_per_user)
+        print(f"{concurrency:>6} {stats['throughput']:>10.1f} {stats['p50_ms']:>10.1f} {stats['p95_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Prompt-size benchmark: old chars/4 truncation vs the token-budgeted context packer.
+
+Builds contextual-answer prompts from chunks of the sample filings in
+extracted_sec_text/, chunked with the PDF text splitter. Each prompt gets k
+retrieved chunks (a run of adjacent chunks, which share the splitter overlap,
+plus random ones from the same filing) and a chat history of previous answers.
+The old build_rag_messages (last 5 history messages, then cut the document
+text by the chars/4 excess over 5800 tokens) is compared with the packer.
+Both are counted with the packer's tokenizer (chars/4 if it can't be loaded).
+
+"Unique text kept" is the share of the distinct retrieved sentences that reach
+the prompt, a rough proxy for answer quality.
+
+Usage: python benchmark_context_packing.py [--prompts 200] [--k 5] [--history 5] [--budget 3500]
+"""
+import os
+import sys
+import glob
+import time
+import random
+import statistics
+
+from context_packer import ContextPacker
+from pdf_extraction import make_text_splitter
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extracted_sec_text")
+SYSTEM_PROMPT = (
+    "You are a financial AI assistant that answers using:\n"
+    "1. Numerical data (from SQL)\n"
+    "2. Supporting document context (from RAG)\n\n"
+    "Prioritize the SQL result if it directly answers the question. Use documents for support or elaboration."
+)
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def legacy_messages(query, docs, history):
+    """build_rag_messages as it was before the context packer."""
+    retrieved_text = "\n\n".join([doc["text"] + "..." for doc in docs])
+    full_context = "Context from documents:\n" + retrieved_text
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + history[-5:] + [{"role": "user", "content": f"{full_context}\n\nMy question: {query}"}]
+    total_text = "\n".join([m["content"] for m in messages])
+    if len(total_text) // 4 > 5800:
+        excess = len(total_text) // 4 - 5800
+        retrieved_text = retrieved_text[: max(len(retrieved_text) - excess * 4, 50)] + "..."
+        messages[-1]["content"] = f"Context from documents:\n{retrieved_text}\n\nMy question: {query}"
+    return messages
+
+
+def packed_messages(packer, query, docs, history):
+    """build_rag_messages with the context packer (same steps as real_chatbot_rag)."""
+    question = f"\n\nMy question: {query}"
+    remaining = packer.budget - packer.count_tokens(SYSTEM_PROMPT) - packer.count_tokens(question) - 16
+    documents, document_tokens = packer.pack_documents(docs, remaining, render=lambda doc, text: text)
+    history_messages = packer.fit_history(history[-5:], remaining - document_tokens)
+    return [{"role": "system", "content": SYSTEM_PROMPT}] + history_messages + [
+        {"role": "user", "content": "Context from documents:\n" + "\n\n".join(documents) + question}]
+
+
+def sentences(text):
+    return {" ".join(s.split()) for s in text.split(". ") if len(s.strip()) > 30}
+
+
+def main():
+    n_prompts = int(_arg("--prompts", 200))
+    k = int(_arg("--k", 5))
+    n_history = int(_arg("--history", 5))
+    packer = ContextPacker(os.getenv("CONTEXT_TOKENIZER", "Xenova/llama3-tokenizer-new"), budget=int(_arg("--budget", 3500)))
+
+    splitter = make_text_splitter()
+    filings = []
+    for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.txt")))[:10]:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            filings.append(splitter.split_text(f.read()))
+
+    # Give the tokenizer a chance to load before counting
+    packer.count_tokens("warm up")
+    for _ in range(100):
+        if packer._tokenizer is not None:
+            break
+        time.sleep(0.1)
+
+    rng = random.Random(7)
+    results = {"legacy": [], "packed": []}
+    coverage = {"legacy": [], "packed": []}
+    build_ms = []
+    for _ in range(n_prompts):
+        chunks = rng.choice(filings)
+        start = rng.randrange(len(chunks) - 3)
+        picked = chunks[start:start + 3] + rng.sample(chunks, k - 3)
+        docs = [{"text": text, "score": 1 / (60 + rank)} for rank, text in enumerate(picked, start=1)]
+        rng.shuffle(docs)
+        history = [{"role": "user" if i % 2 else "assistant", "content": rng.choice(chunks) * rng.randint(1, 2)} for i in range(n_history)]
+        query = "What drove the change in operating income compared with the prior-year quarter?"
+        wanted = set().union(*(sentences(doc["text"]) for doc in docs))
+
+        began = time.perf_counter()
+        packed = packed_messages(packer, query, docs, history)
+        build_ms.append((time.perf_counter() - began) * 1000)
+        for name, messages in (("legacy", legacy_messages(query, docs, history)), ("packed", packed)):
+            results[name].append(sum(packer.count_tokens(m["content"]) + 4 for m in messages))
+            context = " ".join(messages[-1]["content"].split())
+            coverage[name].append(sum(1 for s in wanted if s in context) / len(wanted) if wanted else 1.0)
+
+    print(f"\n=== CONTEXT PACKING BENCHMARK ({n_prompts} prompts, k={k}, {n_history} history messages) ===")
+    print(f"Tokenizer: {packer.get_stats()['tokenizer']} | Budget: {packer.budget}")
+    print(f"{'Builder':>8} {'avg tokens':>11} {'p95 tokens':>11} {'unique text kept':>17}")
+    for name in ("legacy", "packed"):
+        tokens = sorted(results[name])
+        print(f"{name:>8} {statistics.mean(tokens):>11.0f} {tokens[int(len(tokens) * 0.95) - 1]:>11} {statistics.mean(coverage[name]):>16.1%}")
+    print(f"Packing time: p50 {statistics.median(build_ms):.2f} ms | Overlap removed: {packer.get_stats()['overlap_tokens_removed']} tokens")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Microbenchmark of the per-query setup cost in contextual retrieval.
+
+Compares what retrieve_documents used to do before every similarity search (build a
+new GoogleGenerativeAIEmbeddings client and a new MongoDBAtlasVectorSearch wrapper)
+with the shared path (embedding_pool client lookup on the vector store built once in
+initialize_components). No embedding requests are sent and no Mongo query is run,
+so only the setup overhead is measured.
+
+Usage: python benchmark_embedding_setup.py [--iterations 200]
+"""
+import os
+import sys
+import time
+
+from pymongo import MongoClient
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_mongodb import MongoDBAtlasVectorSearch
+
+from embedding_pool import EmbeddingClientPool
+
+API_KEY = os.getenv("GOOGLE_API_KEY1") or "benchmark-key"
+
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(iterations=200):
+    # connect=False: the wrapper only needs a collection handle, no server round trip
+    collection = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"), connect=False)["Financial_Rag_DB"]["chunks_data"]
+
+    def per_query_setup():
+        os.environ["GOOGLE_API_KEY"] = API_KEY
+        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=API_KEY)
+        MongoDBAtlasVectorSearch(
+            collection=collection, embedding=embeddings, index_name="vector_index",
+            embedding_key="embedding", text_key="content"
+        )
+
+    pool = EmbeddingClientPool()
+    pool.initialize_keys([API_KEY])
+    MongoDBAtlasVectorSearch(
+        collection=collection, embedding=pool, index_name="vector_index",
+        embedding_key="embedding", text_key="content"
+    )
+
+    def shared_setup():
+        pool._client(pool._next_key(set()))
+
+    before = time_per_call(per_query_setup, iterations)
+    after = time_per_call(shared_setup, iterations)
+
+    print("\n=== EMBEDDING CLIENT SETUP BENCHMARK ===")
+    print(f"Iterations:                 {iterations}")
+    print(f"Per-query client + store:   {before:,.1f} µs")
+    print(f"Shared pool + store:        {after:,.1f} µs")
+    print(f"Setup cost removed:         {before - after:,.1f} µs per query ({before / max(after, 1e-9):,.0f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[sys.argv.index("--iterations") + 1]) if "--iterations" in sys.argv else 200)
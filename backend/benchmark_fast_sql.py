@@ -0,0 +1,82 @@
+"""Benchmark the deterministic SQL fast path.
+
+Runs a sample of typical chatbot questions through fast_sql.generate_fast_sql using
+the local DDL files and metrics_values.txt (no Oracle or Groq access needed) and
+reports the fast-path hit rate and per-question latency.
+
+Usage: python benchmark_fast_sql.py [--verbose]
+"""
+import sys
+import time
+
+from ddl_registry import DDLRegistry
+from fast_sql import generate_fast_sql
+
+# Same values as the COMPANY_MAPPING table in Oracle
+COMPANY_PREFIXES = {
+    "AMAZON": "amzn", "AMD": "amd", "ATT": "t", "GOOGLE": "goog", "JPMORGAN": "jpm",
+    "MASTERCARD": "ma", "MCDONALDS": "mcd", "META": "meta", "PEPSICO": "pep",
+    "S&P GLOBAL": "spgi", "TESLA": "tsla", "NETFLIX": "nflx", "COCACOLA": "ko",
+}
+
+SAMPLE_QUESTIONS = [
+    ("MCDONALDS", "What was McDonald's revenue in Q3 2024?"),
+    ("COCACOLA", "How much gross profit did Coca-Cola report in 2023?"),
+    ("META", "What was the change in operating expenses from first quarter of 2024 to the second quarter for meta?"),
+    ("META", "What's the ratio of quarter 3 2024 and q2 2024 for Meta's cash and equivalents?"),
+    ("AMD", "What is the ratio of Accounts Receivable to Total Current Assets in Q3 2024 for AMD?"),
+    ("AMD", "What proportion of Accounts Receivable is of Total Current Assets in Q3 2024 for AMD?"),
+    ("AMAZON", "What was the average Book Value Per Share for the first three quarters of 2024 for Amazon?"),
+    ("AMAZON", "What was the percentage change in Cash and Equivalents from Q2 2024 to Q3 2024 for amazon?"),
+    ("META", "Give me the minimum value of Accounts Receivable in 2023 for Meta?"),
+    ("META", "Provide me with the maximum value of Accounts Receivable in 2023 for Meta?"),
+    ("AMD", "What's the year-over-year change in Retained Earnings from Q3 2023 to Q3 2024 for AMD?"),
+    ("AMAZON", "How did the EPS Growth in Q3 2024 compare to Q3 2023 for Amazon?"),
+    ("TESLA", "What was Tesla's net income in Q2 2024?"),
+    ("TESLA", "Total revenue for Tesla in 2023"),
+    ("NETFLIX", "Netflix free cash flow Q1 2024"),
+    ("GOOGLE", "What was Google's operating income in the fourth quarter of 2023?"),
+    ("GOOGLE", "What were Google's total assets in Q3 2024?"),
+    ("PEPSICO", "What was the highest EBITDA for Pepsico in 2023?"),
+    ("PEPSICO", "What was the lowest gross margin for PepsiCo in 2023?"),
+    ("MASTERCARD", "Difference in net income between Q1 2024 and Q1 2023 for Mastercard"),
+    ("JPMORGAN", "What was JP Morgan's net income in Q4 2023?"),
+    ("S&P GLOBAL", "What was S&P Global's revenue in Q2 2023?"),
+    ("ATT", "What was AT&T's free cash flow in Q3 2023?"),
+    ("MCDONALDS", "Average operating income for McDonald's in 2023"),
+    ("AMAZON", "What was the percent increase in Amazon's revenue from Q3 2023 to Q3 2024?"),
+    # Questions the fast path should hand to the LLM
+    ("AMAZON", "Why did Amazon's revenue grow in Q3 2024?"),
+    ("META", "How is Meta investing in AI?"),
+    ("TESLA", "What about Q2?"),
+    ("AMAZON", "What was revenue growth for Amazon in Q3 2024 compared with its peers?"),
+    ("GOOGLE", "Summarize Google's balance sheet in 2023"),
+]
+
+
+def main(verbose=False):
+    registry = DDLRegistry()
+    registry.load(COMPANY_PREFIXES)
+
+    hits = 0
+    timings = []
+    for company, question in SAMPLE_QUESTIONS:
+        entry = registry.get_company(company)
+        start = time.perf_counter()
+        sql = generate_fast_sql(question, entry)
+        timings.append((time.perf_counter() - start) * 1000)
+        hits += sql is not None
+        if verbose:
+            print(f"[{company}] {question}\n   -> {sql or 'fallback to LLM'}")
+
+    total = len(SAMPLE_QUESTIONS)
+    print("\n=== FAST-PATH SQL BENCHMARK ===")
+    print(f"Questions:        {total}")
+    print(f"Fast-path hits:   {hits} ({hits / total:.1%})")
+    print(f"LLM fallbacks:    {total - hits}")
+    print(f"Avg latency:      {sum(timings) / total:.3f} ms")
+    print(f"Max latency:      {max(timings):.3f} ms")
+
+
+if __name__ == "__main__":
+    main(verbose="--verbose" in sys.argv)
@@ -0,0 +1,197 @@
+"""Recall/latency benchmark: vector-only retrieval vs hybrid BM25 + vector (RRF).
+
+Chunks a few sample filings from extracted_sec_text/ with the PDF text splitter,
+embeds them through the embedding pool (GOOGLE_API_KEY1..3), and searches them
+with an exact in-memory FAISS index standing in for Atlas $vectorSearch.
+
+Relevance labels don't depend on the question's words. Each question is written
+by a Groq model (GROQ_API_KEY_SUMMARIZE) from one sampled chunk, in its own
+words, together with the figure that answers it copied from the chunk. The chunks
+of that filing that contain the answer are the relevant ones. Questions whose
+answer appears in the question itself, or in more than MAX_RELEVANT_CHUNKS chunks
+of the filing (a year, a page number), are discarded. The question set is saved
+to --questions and reused by later runs, so every path is scored on the same set.
+
+Compared paths (k results each):
+  current   vector top-15, sorted by sequence, first k (what retrieve_documents did)
+  vector    vector top-k
+  keyword   BM25 top-k
+  hybrid    vector top-N + BM25 top-N fused by reciprocal rank fusion (N = --candidates)
+
+Reports hit@k (any relevant chunk in the top k), recall@k, MRR, vector candidates
+fetched per query and retrieval latency (query embedding excluded).
+
+Usage: python benchmark_hybrid_retrieval.py [--filings 4] [--k 5] [--candidates 10] [--queries 200] [--questions cache/benchmark_questions.jsonl]
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import statistics
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from embedding_pool import embedding_pool
+from embedding_scheduler import embedding_scheduler
+from groq_key_manager import key_manager
+from groq_wrapper import GroqWrapper
+from pdf_extraction import make_text_splitter
+
+load_dotenv()
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extracted_sec_text")
+QUESTION_MODEL = os.getenv("BENCHMARK_QUESTION_MODEL", "llama-3.3-70b-versatile")
+QUESTION_PROMPT = """Below is a passage from the {period} SEC filing of {company}.
+
+Write one question an analyst could ask that this passage answers with a specific figure.
+Name the company and the period. Use your own words: do not copy phrases from the passage.
+Then give the answer: the figure exactly as it is written in the passage.
+
+Reply with JSON only: {{"question": "...", "answer": "..."}}
+
+Passage:
+{text}"""
+FIGURE_PATTERN = re.compile(r"\d[\d,.]*\d")
+MAX_RELEVANT_CHUNKS = 3
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def load_chunks(filings):
+    """[(filing name, sequence, text)] for the first ``filings`` sample filings."""
+    splitter = make_text_splitter()
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.txt")))[:filings]:
+        name = os.path.splitext(os.path.basename(path))[0]  # e.g. "Amazon_Q1 2023"
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for sequence, text in enumerate(splitter.split_text(f.read())):
+                chunks.append((name, sequence, text))
+    return chunks
+
+
+def write_question(name, text):
+    """(question, answer) written by the Groq model from one chunk, or None if unusable."""
+    company, period = name.split("_", 1)
+    response, error = GroqWrapper.make_summarize_request(
+        model=QUESTION_MODEL,
+        messages=[{"role": "user", "content": QUESTION_PROMPT.format(company=company, period=period, text=text)}],
+        max_tokens=200,
+        temperature=0.2,
+        response_format={"type": "json_object"}
+    )
+    if error:
+        return None
+    try:
+        reply = json.loads(response.choices[0].message.content)
+        question, answer = reply["question"].strip(), reply["answer"].strip()
+    except (ValueError, KeyError, AttributeError):
+        return None
+    if not answer or answer not in text or answer in question:
+        return None
+    return question, answer
+
+
+def build_questions(chunks, limit, path):
+    """[{"query", "filing", "answer"}], generated once and cached in ``path``."""
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f][:limit]
+
+    key_manager.initialize_keys(rag_keys=[], sql_keys=[], summarize_keys=[key for key in os.getenv("GROQ_API_KEY_SUMMARIZE", "").split(",") if key])
+    if not key_manager.summarize_keys:
+        sys.exit(f"{path} not found; set GROQ_API_KEY_SUMMARIZE to generate the question set")
+
+    rng = random.Random(7)
+    candidates = [chunk for chunk in chunks if len(FIGURE_PATTERN.findall(chunk[2])) >= 2]
+    rng.shuffle(candidates)
+    questions = []
+    for name, _, text in candidates:
+        if len(questions) == limit:
+            break
+        written = write_question(name, text)
+        if written and sum(1 for other, _, other_text in chunks if other == name and written[1] in other_text) <= MAX_RELEVANT_CHUNKS:
+            questions.append({"query": written[0], "filing": name, "answer": written[1]})
+            print(f"  [{len(questions)}/{limit}] {written[0]} -> {written[1]}")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for question in questions:
+            f.write(json.dumps(question) + "\n")
+    return questions
+
+
+def unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    filings = int(_arg("--filings", 4))
+    k = int(_arg("--k", 5))
+    candidates = int(_arg("--candidates", 10))
+    n_queries = int(_arg("--queries", 200))
+    questions_path = _arg("--questions", os.path.join(os.getenv("CACHE_DIR", "cache"), "benchmark_questions.jsonl"))
+
+    embedding_pool.initialize_keys([os.getenv("GOOGLE_API_KEY1"), os.getenv("GOOGLE_API_KEY2"), os.getenv("GOOGLE_API_KEY3"), os.getenv("GOOGLE_API_KEY")])
+    if not embedding_pool.keys:
+        sys.exit("Set GOOGLE_API_KEY1..3 (or GOOGLE_API_KEY) to embed the benchmark corpus")
+
+    chunks = load_chunks(filings)
+    questions = build_questions(chunks, n_queries, questions_path)
+    queries = []
+    for question in questions:
+        relevant = {chunk_id for chunk_id, (name, _, text) in enumerate(chunks) if name == question["filing"] and question["answer"] in text}
+        if relevant:
+            queries.append((question["query"], relevant))
+    print(f"Corpus: {len(chunks)} chunks from {filings} filings | Queries: {len(queries)} "
+          f"(avg {statistics.mean(len(relevant) for _, relevant in queries):.1f} relevant chunks)")
+
+    vectors = unit(embedding_scheduler.embed(embedding_pool, [text for _, _, text in chunks]))
+    vector_index = faiss.IndexFlatIP(vectors.shape[1])
+    vector_index.add(vectors)
+    keyword_index = BM25Index()
+    for chunk_id, (_, sequence, text) in enumerate(chunks):
+        keyword_index.add(chunk_id, text, {"chunk_id": chunk_id, "sequence": sequence})
+    query_vectors = unit([embedding_pool.embed_query(query) for query, _ in queries])
+
+    def vector_hits(query_vector, n):
+        _, ids = vector_index.search(query_vector[None, :], n)
+        return [{"chunk_id": int(i), "sequence": chunks[i][1]} for i in ids[0] if i >= 0]
+
+    paths = {
+        "current": (15, lambda q, v: sorted(vector_hits(v, 15), key=lambda d: d["sequence"])[:k]),
+        "vector": (k, lambda q, v: vector_hits(v, k)),
+        "keyword": (0, lambda q, v: [payload for payload, _ in keyword_index.search(q, k)]),
+        "hybrid": (candidates, lambda q, v: reciprocal_rank_fusion(
+            [vector_hits(v, candidates), [payload for payload, _ in keyword_index.search(q, candidates)]],
+            key=lambda d: d["chunk_id"], k=k)),
+    }
+
+    print(f"\n=== HYBRID RETRIEVAL BENCHMARK (k={k}) ===")
+    print(f"{'Path':>8} {'hit@k':>7} {'recall@k':>9} {'MRR':>6} {'Vec cand.':>10} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for name, (vector_candidates, search) in paths.items():
+        hits, recalls, reciprocal_ranks, latencies = [], [], [], []
+        for (query, relevant), query_vector in zip(queries, query_vectors):
+            start = time.perf_counter()
+            found = [doc["chunk_id"] for doc in search(query, query_vector)]
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits.append(bool(set(found) & relevant))
+            recalls.append(len(set(found) & relevant) / min(k, len(relevant)))
+            reciprocal_ranks.append(next((1 / rank for rank, chunk_id in enumerate(found, start=1) if chunk_id in relevant), 0.0))
+        latencies.sort()
+        print(f"{name:>8} {statistics.mean(hits):>7.3f} {statistics.mean(recalls):>9.3f} {statistics.mean(reciprocal_ranks):>6.3f} {vector_candidates:>10} "
+              f"{statistics.median(latencies):>9.3f} {latencies[int(len(latencies) * 0.95) - 1]:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
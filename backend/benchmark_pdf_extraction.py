@@ -0,0 +1,102 @@
+"""Throughput benchmark of PDF page extraction (text chunks + financial tables).
+
+Runs pdf_extraction.PageExtractor over the same PDF with an increasing number of
+worker processes and reports pages/sec per level. Without --pdf, a test PDF is
+rendered from the sample filings in extracted_sec_text/: each page gets a
+slice of filing text and a ruled financial table, so find_tables has real work.
+Throughput should scale with the worker count up to the number of cores.
+
+Usage: python benchmark_pdf_extraction.py [--pdf report.pdf] [--pages 120] [--levels 1,2,4,8] [--pages-per-task 8]
+"""
+import os
+import sys
+import glob
+import time
+import tempfile
+
+import fitz
+
+from pdf_extraction import PageExtractor
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extracted_sec_text")
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def draw_table(page, top, rows):
+    """Ruled table with financial column headers at y=``top``"""
+    x0, col_width, row_height = 72, 120, 18
+    for r, row in enumerate(rows):
+        for c, cell in enumerate(row):
+            page.insert_text((x0 + c * col_width + 4, top + r * row_height + 13), cell, fontsize=9)
+    for r in range(len(rows) + 1):
+        page.draw_line((x0, top + r * row_height), (x0 + col_width * len(rows[0]), top + r * row_height))
+    for c in range(len(rows[0]) + 1):
+        page.draw_line((x0 + c * col_width, top), (x0 + c * col_width, top + row_height * len(rows)))
+
+
+def build_sample_pdf(path, pages):
+    """Render ``pages`` pages of sample filing text, each with a small income-statement table."""
+    text = " ".join(open(f, encoding="utf-8", errors="ignore").read() for f in sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.txt")))[:5])
+    doc = fitz.open()
+    per_page = 2500
+    for i in range(pages):
+        page = doc.new_page()
+        body = text[(i * per_page) % max(len(text) - per_page, 1):][:per_page]
+        page.insert_textbox(fitz.Rect(72, 72, 540, 480), body, fontsize=8)
+        rows = [["Metric", "Q1 2023 (USD million)", "Q1 2024 (USD million)"]]
+        rows += [[name, f"{1000 + i * 7 + j:,}", f"({200 + j * 3})"] for j, name in enumerate(["Revenue", "Operating income", "Net income", "Total assets"])]
+        draw_table(page, 500, rows)
+    doc.save(path)
+    doc.close()
+
+
+def run_level(pdf_path, workers, pages_per_task):
+    extractor = PageExtractor(max_workers=workers, pages_per_task=pages_per_task)
+    try:
+        # Start the worker processes before timing
+        if extractor.parallel:
+            list(extractor._get_executor().map(abs, range(workers)))
+        start = time.perf_counter()
+        pages = chunks = 0
+        for _, _, records in extractor.iter_pages(pdf_path):
+            pages += 1
+            chunks += len(records)
+        elapsed = time.perf_counter() - start
+    finally:
+        extractor.close()
+    return pages, chunks, elapsed
+
+
+def main():
+    pdf_path = _arg("--pdf", None)
+    pages = int(_arg("--pages", 120))
+    levels = [int(level) for level in _arg("--levels", "1,2,4,8").split(",")]
+    pages_per_task = int(_arg("--pages-per-task", 8))
+
+    if pdf_path is None:
+        pdf_path = os.path.join(tempfile.mkdtemp(), "sample_filings.pdf")
+        build_sample_pdf(pdf_path, pages)
+
+    # Per-page logging from extraction would swamp the table
+    sys.stdout.flush()
+    devnull = open(os.devnull, "w")
+
+    print("\n=== PDF EXTRACTION THROUGHPUT ===")
+    print(f"PDF: {pdf_path} | CPU cores: {os.cpu_count()} | Pages per task: {pages_per_task}")
+    print(f"{'Workers':>8} {'Pages':>7} {'Chunks':>8} {'Seconds':>9} {'Pages/s':>9}")
+    for workers in levels:
+        real_stdout, sys.stdout = sys.stdout, devnull
+        try:
+            page_count, chunks, elapsed = run_level(pdf_path, workers, pages_per_task)
+        finally:
+            sys.stdout = real_stdout
+        print(f"{workers:>8} {page_count:>7} {chunks:>8} {elapsed:>9.2f} {page_count / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+# Numbers keep their separators ("1,234.5", "12.5") and "q3" / "fy2024" stay one token,
+# so exact metric names and period tokens match
+TOKEN_PATTERN = re.compile(r"[a-z]+\d*|\d+(?:[.,]\d+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what which with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """In-process inverted index with Okapi BM25 scoring.
+
+    Documents are added (or replaced, by id) one at a time, so the index can grow
+    as chunks are inserted. Each document keeps a payload that is returned with
+    its hits.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[Hashable, int]] = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self._doc_terms: Dict[Hashable, Counter] = {}
+        self._doc_lengths: Dict[Hashable, int] = {}
+        self._payloads: Dict[Hashable, dict] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self._doc_terms
+
+    def _remove(self, doc_id: Hashable):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        self._payloads.pop(doc_id, None)
+
+    def add(self, doc_id: Hashable, text: str, payload: dict):
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            self._doc_terms[doc_id] = terms
+            self._doc_lengths[doc_id] = sum(terms.values())
+            self._payloads[doc_id] = payload
+            self._total_length += self._doc_lengths[doc_id]
+            for term, frequency in terms.items():
+                self._postings[term][doc_id] = frequency
+
+    def add_many(self, documents: Iterable[Tuple[Hashable, str, dict]]):
+        for doc_id, text, payload in documents:
+            self.add(doc_id, text, payload)
+
+    def remove(self, doc_id: Hashable):
+        with self._lock:
+            self._remove(doc_id)
+
+    def doc_ids(self, predicate: Optional[Callable[[dict], bool]] = None) -> List[Hashable]:
+        with self._lock:
+            return [doc_id for doc_id, payload in self._payloads.items() if predicate is None or predicate(payload)]
+
+    def search(self, query: str, k: int, predicate: Optional[Callable[[dict], bool]] = None) -> List[Tuple[dict, float]]:
+        """Top-``k`` (payload, score) pairs; ``predicate(payload)`` restricts the candidates."""
+        query_terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_terms)
+            if not n_docs or not query_terms:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[Hashable, float] = defaultdict(float)
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self._doc_lengths[doc_id]
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * (1 - self.b + self.b * length / avg_length))
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for doc_id, score in ranked:
+                payload = self._payloads[doc_id]
+                if predicate is None or predicate(payload):
+                    results.append((payload, score))
+                    if len(results) == k:
+                        break
+            return results
+
+
+def reciprocal_rank_fusion(rankings: List[List[dict]], key: Callable[[dict], Hashable], k: int, rrf_k: int = 60) -> List[dict]:
+    """Fuse ranked result lists: each document scores sum(1 / (rrf_k + rank)) over the lists it appears in."""
+    scores: Dict[Hashable, float] = defaultdict(float)
+    documents: Dict[Hashable, dict] = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            doc_key = key(document)
+            scores[doc_key] += 1.0 / (rrf_k + rank)
+            documents.setdefault(doc_key, document)
+    fused = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [{**documents[doc_key], "rrf_score": round(scores[doc_key], 6)} for doc_key in fused]
+
+
+class CollectionBM25:
+    """BM25 index over a Mongo collection's chunk text, kept in step with the collection.
+
+    ``start`` loads the collection in a background thread; until that finishes,
+    ``ready`` is False and callers use vector search alone. ``sync`` (called from
+    ``search`` at most every ``sync_interval`` seconds) then:
+    - reads the documents inserted since the last sync. ObjectIds made by different
+      processes are only ordered to the second, and only as far as their clocks
+      agree, so it re-reads ``lookback`` seconds before the newest id seen
+      (re-adding a document replaces it)
+    - reloads a group (a filing's chunks, by ``group_field``) whenever its record
+      in ``manifest`` changes, so chunks that ingest_filings.py updated or deleted
+      are replaced or dropped
+    - every ``reconcile_interval`` seconds, drops indexed documents whose ``_id``
+      is no longer in the collection (deleted by other means)
+    """
+
+    def __init__(self, text_field: str, fields: List[str], group_field: str, sync_interval: float = 60,
+                 lookback: float = 300, reconcile_interval: float = 3600):
+        self.text_field = text_field
+        self.fields = fields
+        self.group_field = group_field
+        self.sync_interval = sync_interval
+        self.lookback = lookback
+        self.reconcile_interval = reconcile_interval
+        self.index = BM25Index()
+        self.ready = False
+        self._collection = None
+        self._manifest = None
+        self._manifest_versions: Dict[str, tuple] = {}
+        self._last_id = None
+        self._last_sync = 0.0
+        self._last_reconcile = 0.0
+        self._sync_lock = threading.Lock()
+        self.stats = {"groups_reloaded": 0, "removed": 0}
+
+    def add(self, document: dict):
+        """Index one inserted document (must carry ``_id``)."""
+        self.index.add(document["_id"], document.get(self.text_field) or "", {field: document.get(field) for field in ("_id", self.text_field, *self.fields)})
+
+    def _projection(self) -> Dict:
+        return {field: 1 for field in (self.text_field, *self.fields)}
+
+    def _read_manifest(self) -> Dict[str, tuple]:
+        if self._manifest is None:
+            return {}
+        return {record["_id"]: (record.get("file_hash"), record.get("ingested_at"))
+                for record in self._manifest.find({}, {"file_hash": 1, "ingested_at": 1})}
+
+    def _read_new(self) -> int:
+        query = {}
+        if isinstance(self._last_id, ObjectId):
+            since = self._last_id.generation_time - timedelta(seconds=self.lookback)
+            query = {"_id": {"$gte": ObjectId.from_datetime(since)}}
+        elif self._last_id is not None:
+            query = {"_id": {"$gt": self._last_id}}
+        added = 0
+        for document in self._collection.find(query, self._projection()).sort("_id", 1):
+            if document["_id"] not in self.index:
+                added += 1
+            self.add(document)
+            self._last_id = document["_id"] if self._last_id is None else max(self._last_id, document["_id"])
+        return added
+
+    def _reload_group(self, group: str):
+        documents = list(self._collection.find({self.group_field: group}, self._projection()))
+        live = {document["_id"] for document in documents}
+        stale = self.index.doc_ids(lambda payload: payload.get(self.group_field) == group and payload["_id"] not in live)
+        for doc_id in stale:
+            self.index.remove(doc_id)
+        for document in documents:
+            self.add(document)
+        self.stats["groups_reloaded"] += 1
+        self.stats["removed"] += len(stale)
+
+    def _reconcile(self) -> int:
+        live = {document["_id"] for document in self._collection.find({}, {"_id": 1})}
+        stale = [doc_id for doc_id in self.index.doc_ids() if doc_id not in live]
+        for doc_id in stale:
+            self.index.remove(doc_id)
+        self.stats["removed"] += len(stale)
+        return len(stale)
+
+    def sync(self):
+        if self._collection is None or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            # Manifest first: a filing re-ingested after this read shows up as changed next time
+            manifest = self._read_manifest()
+            changed = [group for group in set(manifest) | set(self._manifest_versions)
+                       if self.ready and self._manifest_versions.get(group) != manifest.get(group)]
+            added = self._read_new()
+            for group in changed:
+                self._reload_group(group)
+            self._manifest_versions = manifest
+            removed = 0
+            if self.ready and time.time() - self._last_reconcile > self.reconcile_interval:
+                removed = self._reconcile()
+                self._last_reconcile = time.time()
+            self._last_sync = time.time()
+            if added or changed or removed:
+                print(f"📚 BM25 index: +{added} chunks, {len(changed)} filings reloaded, {removed} deleted chunks dropped ({len(self.index)} total)")
+        except Exception as e:
+            print(f"⚠️ BM25 sync failed: {e}")
+        finally:
+            self._sync_lock.release()
+
+    def start(self, collection, manifest=None):
+        if self._collection is not None:
+            return
+        self._collection = collection
+        self._manifest = manifest
+
+        def load():
+            self.sync()
+            self._last_reconcile = time.time()
+            self.ready = True
+
+        threading.Thread(target=load, name="bm25-load", daemon=True).start()
+
+    def search(self, query: str, k: int, predicate: Optional[Callable[[dict], bool]] = None) -> List[dict]:
+        if not self.ready:
+            return []
+        if time.time() - self._last_sync > self.sync_interval:
+            self._last_sync = time.time()
+            threading.Thread(target=self.sync, name="bm25-sync", daemon=True).start()
+        return [{**payload, "bm25_score": score} for payload, score in self.index.search(query, k, predicate)]
+
+    def get_stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "documents": len(self.index),
+            **self.stats,
+            "seconds_since_sync": round(time.time() - self._last_sync, 1) if self._last_sync else None,
+            "sync_interval": self.sync_interval
+        }
+
+# Global instance for the SEC filing chunks (chunks_data)
+filing_chunks_bm25 = CollectionBM25(
+    text_field="content",
+    fields=["company_id", "chunk_id", "sequence"],
+    group_field="company_id",
+    sync_interval=float(os.getenv("BM25_SYNC_INTERVAL", 60)),
+    lookback=float(os.getenv("BM25_SYNC_LOOKBACK", 300)),
+    reconcile_interval=float(os.getenv("BM25_RECONCILE_INTERVAL", 3600))
+)
@@ -0,0 +1,99 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class ChatHistoryCache:
+    """In-memory cache of the most recent messages of each chat session.
+
+    The chatbot only ever looks at the last few turns of a conversation, so each
+    session keeps a window of its newest ``window`` messages. /save_chat appends
+    through to the window, so a warm session never re-reads its messages from
+    Postgres; every lookup still costs one query for the session's newest message id.
+
+    Each session also carries a version that every append bumps. A window loaded
+    from the database is only stored if no append happened while it was being read,
+    so a slow read can never overwrite a newer window with a stale one. Other server
+    processes write to the same sessions, so the caller passes the session's newest
+    message id (one index lookup) and a window that doesn't end with it is reloaded.
+    Windows also expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, window: int, max_sessions: int, ttl: float):
+        self.window = window
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # session_id -> [version, loaded_at, window as [(id, sender, message)] or None]
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "appends": 0}
+
+    def _entry(self, session_id: str) -> list:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = self._sessions[session_id] = [0, 0.0, None]
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def get(self, session_id: str, limit: Optional[int] = None, newest_id: Optional[int] = None) -> Tuple[Optional[List[Dict]], int]:
+        """Return (last ``limit`` messages or None on a miss, version to pass to ``set``).
+
+        ``newest_id`` is the session's max(id) in the database; None skips the check.
+        """
+        with self._lock:
+            entry = self._entry(session_id)
+            version, loaded_at, messages = entry
+            stale = newest_id is not None and (not messages or messages[-1][0] != newest_id)
+            if messages is None or stale or time.time() - loaded_at > self.ttl:
+                entry[2] = None
+                self.stats["misses"] += 1
+                return None, version
+            self.stats["hits"] += 1
+        messages = messages[-limit:] if limit else messages
+        return [{"sender": sender, "message": message} for _, sender, message in messages], version
+
+    def set(self, session_id: str, rows: List[Tuple[int, str, str]], version: int):
+        """Store a window read from the database as (id, sender, message) rows, oldest first."""
+        with self._lock:
+            entry = self._entry(session_id)
+            if entry[0] == version:
+                entry[1] = time.time()
+                entry[2] = list(rows[-self.window:])
+
+    def append(self, session_id: str, rows: List[Tuple[int, str, str]]):
+        """Write newly saved messages through to the session's window (if it is cached)."""
+        with self._lock:
+            entry = self._entry(session_id)
+            entry[0] += 1
+            self.stats["appends"] += len(rows)
+            if entry[2] is not None:
+                # Concurrent saves may commit out of order; keep the window sorted by id
+                entry[2] = sorted(entry[2] + list(rows))[-self.window:]
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            entry = self._entry(session_id)
+            entry[0] += 1
+            entry[2] = None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / total, 3) if total else 0.0,
+                "sessions": sum(1 for entry in self._sessions.values() if entry[2] is not None),
+                "window": self.window
+            }
+
+# Global instance (configured from the environment)
+chat_history_cache = ChatHistoryCache(
+    window=int(os.getenv("CHAT_HISTORY_WINDOW", 5)),
+    max_sessions=int(os.getenv("CHAT_HISTORY_CACHE_SESSIONS", 5000)),
+    ttl=float(os.getenv("CHAT_HISTORY_CACHE_TTL", 300))
+)
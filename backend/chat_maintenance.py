@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import and_, delete, exists, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+
+class ChatMaintenance:
+    """Set-based housekeeping for the chat tables.
+
+    Empty sessions (no Chat rows) are removed with an anti-join DELETE in batches of
+    ``batch_size``. Each batch is its own short transaction, so the job never holds
+    locks on more than one batch and never pulls session ids into Python. Candidate
+    rows are locked with SKIP LOCKED, so a session that /save_chat is writing to
+    right now is left for the next run. Several server processes can also run the
+    job at the same time.
+
+    A user's newest session is never removed, however old: the frontend keeps its
+    id in localStorage and saves the first message to it whenever the user comes
+    back. The scheduled run is off unless CHAT_CLEANUP_INTERVAL is set.
+    """
+
+    def __init__(self, app, db, session_model, chat_model):
+        self.app = app
+        self.db = db
+        self.session_model = session_model
+        self.chat_model = chat_model
+
+        self.batch_size = int(os.getenv("CHAT_CLEANUP_BATCH_SIZE", 1000))
+        # Only sessions older than this are removed by the scheduled job: a session is empty
+        # between /new_session and its first /save_chat, which may be days later
+        self.min_age = float(os.getenv("CHAT_CLEANUP_MIN_AGE", 7 * 24 * 3600))
+        self.interval = float(os.getenv("CHAT_CLEANUP_INTERVAL", 0))
+
+        self._lock = threading.Lock()
+        self._scheduler: Optional[threading.Thread] = None
+        self.runs = 0
+        self.total_deleted = 0
+        self.last_run: Optional[Dict] = None
+
+    def _delete_batch(self, cutoff: Optional[datetime]) -> int:
+        ChatSession, Chat = self.session_model, self.chat_model
+        Newer = aliased(ChatSession)
+        has_newer_session = exists().where(
+            Newer.user_id == ChatSession.user_id,
+            or_(Newer.created_at > ChatSession.created_at, and_(Newer.created_at == ChatSession.created_at, Newer.id > ChatSession.id))
+        )
+        empty_sessions = select(ChatSession.id).where(~exists().where(Chat.session_id == ChatSession.id), has_newer_session)
+        if cutoff is not None:
+            empty_sessions = empty_sessions.where(ChatSession.created_at < cutoff)
+        empty_sessions = empty_sessions.limit(self.batch_size).with_for_update(skip_locked=True)
+
+        result = self.db.session.execute(
+            delete(ChatSession).where(ChatSession.id.in_(empty_sessions.scalar_subquery())),
+            execution_options={"synchronize_session": False}
+        )
+        self.db.session.commit()
+        return result.rowcount
+
+    def delete_empty_sessions(self, min_age: Optional[float] = None) -> Dict:
+        """Delete sessions without messages that are older than ``min_age`` seconds (default: CHAT_CLEANUP_MIN_AGE),
+        except each user's newest session.
+
+        Needs an app context. Returns {"deleted", "batches", "duration_ms"}.
+        """
+        min_age = self.min_age if min_age is None else min_age
+        cutoff = datetime.utcnow() - timedelta(seconds=min_age) if min_age > 0 else None
+
+        start_time = time.perf_counter()
+        deleted = batches = conflicts = 0
+        while True:
+            try:
+                removed = self._delete_batch(cutoff)
+            except IntegrityError:
+                # A message landed in a candidate session after the anti-join saw it empty
+                self.db.session.rollback()
+                conflicts += 1
+                if conflicts >= 3:
+                    break
+                continue
+            batches += 1
+            deleted += removed
+            if removed < self.batch_size:
+                break
+
+        report = {
+            "deleted": deleted,
+            "batches": batches,
+            "duration_ms": round((time.perf_counter() - start_time) * 1000, 1),
+            "finished_at": datetime.utcnow().isoformat()
+        }
+        with self._lock:
+            self.runs += 1
+            self.total_deleted += deleted
+            self.last_run = report
+        print(f"🧹 Removed {deleted} empty chat sessions in {batches} batches ({report['duration_ms']} ms)")
+        return report
+
+    def start_scheduler(self):
+        """Run delete_empty_sessions every CHAT_CLEANUP_INTERVAL seconds in a daemon thread (0 disables)."""
+        if self.interval <= 0 or self._scheduler is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    with self.app.app_context():
+                        self.delete_empty_sessions()
+                except Exception as e:
+                    print(f"⚠️ Scheduled chat cleanup failed: {e}")
+
+        self._scheduler = threading.Thread(target=loop, name="chat-maintenance", daemon=True)
+        self._scheduler.start()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "total_deleted": self.total_deleted,
+                "last_run": self.last_run,
+                "interval_s": self.interval,
+                "min_age_s": self.min_age,
+                "batch_size": self.batch_size
+            }
@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import threading
+from functools import lru_cache
+from typing import Dict, Optional
+
+# Company name mapping (selected company -> company_id prefix of its filings)
+COMPANY_MAPPING = {
+    "AMAZON": "Amazon",
+    "AMD": "AMD",
+    "ATT": "AT&T",
+    "GOOGLE": "Google",
+    "JPMORGAN": "JP Morgan",
+    "MASTERCARD": "Mastercard",
+    "MCDONALDS": "McDonald",
+    "META": "Meta",
+    "PEPSICO": "Pepsico",
+    "S&P GLOBAL": "S&P Global",
+    "TESLA": "Tesla",
+    "NETFLIX": "Netflix",
+    "COCACOLA": "CocaCola"
+}
+
+PARTITION_FIELDS = ("company", "quarter", "year")
+FILING_ID_PATTERN = re.compile(r"^(?P<company>.+?)_Q(?P<quarter>[1-4])\s*(?P<year>\d{4})", re.IGNORECASE)
+QUARTER_WORDS = {"first": "Q1", "second": "Q2", "third": "Q3", "fourth": "Q4"}
+QUERY_QUARTER_PATTERN = re.compile(r"\bq([1-4])\b|\b(first|second|third|fourth)\s+quarter\b", re.IGNORECASE)
+QUERY_YEAR_PATTERN = re.compile(r"\b(20\d{2})\b")
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+# "Coca-Cola", "CocaCola" and "COCACOLA" all resolve to the same key
+_COMPANY_BY_SLUG = {_slug(name): key for key, prefix in COMPANY_MAPPING.items() for name in (key, prefix)}
+
+
+def company_key(name: str) -> Optional[str]:
+    """Canonical company key (a COMPANY_MAPPING key, else the upper-cased alphanumerics)."""
+    slug = _slug(name or "")
+    return _COMPANY_BY_SLUG.get(slug, slug.upper()) or None
+
+
+@lru_cache(maxsize=4096)
+def partition_keys(company_id: str) -> Dict:
+    """{"company", "quarter", "year"} of a filing id such as "Amazon_Q1 2023.txt"; {} if it has no period."""
+    match = FILING_ID_PATTERN.match(company_id or "")
+    if not match:
+        return {}
+    return {"company": company_key(match["company"]), "quarter": f"Q{match['quarter']}", "year": int(match["year"])}
+
+
+def query_period(query: str) -> Dict:
+    """Quarter and year named in a question. A field is left out when the question names none or several."""
+    quarters = {f"Q{digit}" if digit else QUARTER_WORDS[word.lower()] for digit, word in QUERY_QUARTER_PATTERN.findall(query or "")}
+    years = {int(year) for year in QUERY_YEAR_PATTERN.findall(query or "")}
+    period = {}
+    if len(quarters) == 1:
+        period["quarter"] = quarters.pop()
+    if len(years) == 1:
+        period["year"] = years.pop()
+    return period
+
+
+def vector_index_definition(dimensions: int = 768) -> Dict:
+    return {
+        "fields": [
+            {"type": "vector", "path": "embedding", "numDimensions": dimensions, "similarity": "cosine"},
+            {"type": "filter", "path": "company_id"},
+            *({"type": "filter", "path": field} for field in PARTITION_FIELDS)
+        ]
+    }
+
+
+class ChunkPartitions:
+    """Exact company / quarter / year keys on chunks_data, used as vector-search pre-filters.
+
+    ingest_filings.py writes ``partition_keys(company_id)`` onto every chunk,
+    backfills chunks stored without them and declares them as filter fields of
+    the Atlas vector index. The server only reads: ``start`` loads the catalog of
+    (company, quarter, year) values that exist and polls ``list_search_indexes``
+    every ``poll_interval`` seconds until the index can serve the partition
+    filters. ``resolve`` turns the selected company and the periods named in a
+    question into the partition to search, checked against the catalog so a
+    filter never selects an empty partition. ``vector_filter`` expresses it as an
+    equality filter on the partition fields once the index can serve them, and
+    as ``company_id $in`` (already a filter field) until then. The catalog is
+    re-read every ``refresh_interval`` seconds, so filings added later by
+    ingest_filings.py become filterable without a restart.
+    """
+
+    def __init__(self, index_name: str = "vector_index", poll_interval: float = 30, refresh_interval: float = 300):
+        self.index_name = index_name
+        self.poll_interval = poll_interval
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+        self.filter_ready = False
+        self._lock = threading.Lock()
+        self._company_ids: Dict[tuple, list] = {}  # (company, quarter, year) -> company_ids
+        self._collection = None
+
+    def register(self, company_id: str) -> Dict:
+        keys = partition_keys(company_id)
+        if keys:
+            with self._lock:
+                ids = self._company_ids.setdefault(tuple(keys[field] for field in PARTITION_FIELDS), [])
+                if company_id not in ids:
+                    ids.append(company_id)
+        return keys
+
+    def index_serves_partitions(self) -> bool:
+        """Whether the vector index is queryable with the partition filter fields."""
+        index = next(iter(self._collection.list_search_indexes(self.index_name)), {})
+        if index.get("status") == "FAILED":
+            raise RuntimeError(f"{self.index_name} build failed")
+        paths = {field.get("path") for field in index.get("latestDefinition", {}).get("fields", []) if field.get("type") == "filter"}
+        return bool(index.get("queryable")) and index.get("status") == "READY" and set(PARTITION_FIELDS) <= paths
+
+    def start(self, collection):
+        if self._collection is not None:
+            return
+        self._collection = collection
+
+        def watch_index():
+            self.refresh()
+            print(f"🗂️ Chunk partitions: {len(self._company_ids)} filings")
+            try:
+                while not self.index_serves_partitions():
+                    time.sleep(self.poll_interval)
+            except Exception as e:
+                print(f"⚠️ Chunk partitioning unavailable, using company_id filters: {e}")
+                return
+            self.filter_ready = True
+            print(f"✅ {self.index_name} serves company/quarter/year pre-filters")
+
+        threading.Thread(target=watch_index, name="chunk-partitions", daemon=True).start()
+
+    def refresh(self):
+        self._last_refresh = time.time()
+        try:
+            for company_id in self._collection.distinct("company_id"):
+                self.register(company_id)
+        except Exception as e:
+            print(f"⚠️ Chunk partition catalog refresh failed: {e}")
+
+    def resolve(self, selected_company: Optional[str], query: str) -> Dict:
+        """Partition keys to search for this question ({} = whole corpus)."""
+        if self._collection is not None and self._last_refresh and time.time() - self._last_refresh > self.refresh_interval:
+            self._last_refresh = time.time()
+            threading.Thread(target=self.refresh, name="chunk-partitions-refresh", daemon=True).start()
+        with self._lock:
+            catalog = list(self._company_ids)
+        partition = {}
+        if selected_company and selected_company.lower() != "all":
+            company = company_key(selected_company)
+            if any(entry[0] == company for entry in catalog):
+                partition["company"] = company
+            else:
+                print(f"⚠️ No filings found for company: {selected_company}")
+        # A period filter is only kept if that partition has filings
+        for field, value in query_period(query).items():
+            candidate = {**partition, field: value}
+            if any(all(entry[PARTITION_FIELDS.index(f)] == v for f, v in candidate.items()) for entry in catalog):
+                partition = candidate
+        return partition
+
+    def vector_filter(self, partition: Dict) -> Optional[Dict]:
+        """$vectorSearch filter for a partition: equality on the partition fields, or company_id $in."""
+        if not partition:
+            return None
+        if self.filter_ready:
+            clauses = [{field: {"$eq": partition[field]}} for field in PARTITION_FIELDS if field in partition]
+            return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+        with self._lock:
+            company_ids = [company_id for entry, ids in self._company_ids.items()
+                           if all(entry[PARTITION_FIELDS.index(f)] == v for f, v in partition.items()) for company_id in ids]
+        return {"company_id": {"$in": company_ids}}
+
+    @staticmethod
+    def matches(document: Dict, partition: Dict) -> bool:
+        """Whether a chunk (by its company_id) lies in the partition."""
+        keys = partition_keys(document.get("company_id") or "")
+        return all(keys.get(field) == value for field, value in partition.items())
+
+# Global instance for chunks_data
+chunk_partitions = ChunkPartitions(
+    index_name="vector_index",
+    poll_interval=float(os.getenv("CHUNK_PARTITION_POLL_INTERVAL", 30)),
+    refresh_interval=float(os.getenv("CHUNK_PARTITION_REFRESH_INTERVAL", 300))
+)
@@ -0,0 +1,169 @@
+import os
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from huggingface_hub import hf_hub_download
+from tokenizers import Tokenizer
+
+MIN_OVERLAP_CHARS = 40  # shorter shared edges are coincidence, not splitter overlap
+MIN_PARTIAL_TOKENS = 48  # a chunk is only cut down if at least this much of it fits
+
+
+def stitch(block: str, text: str) -> Optional[str]:
+    """``block`` and ``text`` joined on the edge they share, or None if they don't overlap.
+
+    The PDF and filing splitters overlap neighbouring chunks by up to 200
+    characters, so two adjacent hits repeat that stretch word for word. A chunk
+    contained in the other one is absorbed.
+    """
+    if text in block:
+        return block
+    if block in text:
+        return text
+    # block's tail == text's head
+    index = block.rfind(text[:MIN_OVERLAP_CHARS])
+    if index >= 0 and text.startswith(block[index:]):
+        return block + text[len(block) - index:]
+    # text's tail == block's head
+    index = text.rfind(block[:MIN_OVERLAP_CHARS])
+    if index >= 0 and block.startswith(text[index:]):
+        return text[:index] + block
+    return None
+
+
+class ContextPacker:
+    """Fits retrieved chunks and chat history into a prompt token budget.
+
+    Tokens are counted with the tokenizer of the answering model, loaded once
+    from the Hugging Face hub cache. Counts are cached per text. Until the
+    tokenizer has loaded, or if it can't be, the old characters / 4 estimate is used. Chunks
+    are taken greedily by relevance score. One that overlaps a chunk already
+    taken (splitter overlap) is stitched onto it, and the last chunk that fits
+    is cut at a sentence boundary. History is shrunk first: it only
+    gets the budget left over after the question and the packed documents,
+    newest messages first.
+    """
+
+    def __init__(self, tokenizer_name: str, budget: int = 3500, max_cached_counts: int = 8192):
+        self.tokenizer_name = tokenizer_name
+        self.budget = budget
+        self._tokenizer = None
+        self._loading = False
+        self._lock = threading.Lock()
+        self.count_tokens = lru_cache(maxsize=max_cached_counts)(self._count_tokens)
+        self.stats = {"packed": 0, "prompt_tokens": 0, "chunks_dropped": 0, "chunks_merged": 0, "overlap_tokens_removed": 0, "history_messages_dropped": 0}
+
+    def _load_tokenizer(self):
+        try:
+            self._tokenizer = Tokenizer.from_file(hf_hub_download(self.tokenizer_name, "tokenizer.json"))
+            self.count_tokens.cache_clear()  # drop the estimates made while loading
+            print(f"🔡 Context packer using tokenizer {self.tokenizer_name}")
+        except Exception as e:
+            print(f"⚠️ Tokenizer {self.tokenizer_name} unavailable, estimating tokens as chars / 4: {e}")
+
+    def _get_tokenizer(self) -> Optional[Tokenizer]:
+        """The tokenizer, or None while it loads (in the background, so no request waits on the download)."""
+        if self._tokenizer is None and not self._loading:
+            with self._lock:
+                if not self._loading:
+                    self._loading = True
+                    threading.Thread(target=self._load_tokenizer, name="tokenizer-load", daemon=True).start()
+        return self._tokenizer
+
+    def _count_tokens(self, text: str) -> int:
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return len(text) // 4
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def _cut_to_fit(self, text: str, max_tokens: int) -> Optional[str]:
+        """Longest prefix of ``text`` that ends a sentence (or a word) and has at most ``max_tokens`` tokens."""
+        cut = text
+        while cut and self.count_tokens(cut) > max_tokens:
+            cut = cut[:int(len(cut) * max_tokens / self.count_tokens(cut) * 0.95)]
+            boundary = max(cut.rfind(". "), cut.rfind("\n"))
+            cut = cut[:boundary + 1] if boundary > len(cut) // 2 else cut[:cut.rfind(" ") + 1]
+        return cut.rstrip() or None
+
+    def pack_documents(self, docs: List[dict], budget: int, render: Callable[[dict, str], str],
+                       text_key: str = "text", score_key: Optional[str] = "score") -> Tuple[List[str], int]:
+        """Rendered context blocks that fit ``budget`` tokens, in input order, and their token count.
+
+        ``render(doc, text)`` formats one block (e.g. with its page header). Docs are
+        taken in descending ``score_key`` order, or in input order (already ranked) if
+        ``score_key`` is None. A chunk that overlaps one already taken is stitched onto
+        it, so the shared text is sent once and the passage reads continuously.
+        """
+        order = sorted(range(len(docs)), key=lambda i: -(docs[i].get(score_key) or 0)) if score_key else range(len(docs))
+        blocks = []  # [first input position, doc rendered with, text, tokens]
+        used = 0
+        for i in order:
+            text = docs[i].get(text_key) or ""
+            block, stitched = next(((block, joined) for block in blocks for joined in [stitch(block[2], text)] if joined is not None), (None, None))
+            if block is not None:
+                tokens = self.count_tokens(render(block[1], stitched))
+                if used + tokens - block[3] > budget:
+                    self._count("chunks_dropped")
+                    continue
+                self._count("chunks_merged")
+                self._count("overlap_tokens_removed", self.count_tokens(text) - (tokens - block[3]))
+                block[0], block[2] = min(block[0], i), stitched
+                used += tokens - block[3]
+                block[3] = tokens
+                continue
+
+            tokens = self.count_tokens(render(docs[i], text))
+            if used + tokens > budget:
+                room = budget - used - (tokens - self.count_tokens(text))  # minus the header
+                cut = self._cut_to_fit(text, room) if room >= MIN_PARTIAL_TOKENS else None
+                if cut is None:
+                    self._count("chunks_dropped")
+                    continue
+                text = cut + "..."
+                tokens = self.count_tokens(render(docs[i], text))
+            blocks.append([i, docs[i], text, tokens])
+            used += tokens
+        return [render(doc, text) for _, doc, text, _ in sorted(blocks, key=lambda block: block[0])], used
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def fit_history(self, history: List[dict], budget: int) -> List[dict]:
+        """The newest chat messages ({"role", "content"}) that fit ``budget`` tokens, oldest first."""
+        kept, used = [], 0
+        for message in reversed(history):
+            tokens = self.count_tokens(message["content"]) + 4  # role and message framing
+            if used + tokens > budget:
+                break
+            kept.append(message)
+            used += tokens
+        self._count("history_messages_dropped", len(history) - len(kept))
+        return kept[::-1]
+
+    def record(self, messages: List[dict]) -> int:
+        """Count a finished prompt's tokens into the stats; returns the count."""
+        tokens = sum(self.count_tokens(message["content"]) + 4 for message in messages)
+        with self._lock:
+            self.stats["packed"] += 1
+            self.stats["prompt_tokens"] += tokens
+        return tokens
+
+    def get_stats(self) -> Dict:
+        cache = self.count_tokens.cache_info()
+        with self._lock:
+            return {
+                **self.stats,
+                "avg_prompt_tokens": round(self.stats["prompt_tokens"] / self.stats["packed"], 1) if self.stats["packed"] else 0.0,
+                "budget": self.budget,
+                "tokenizer": self.tokenizer_name if self._tokenizer is not None else "chars/4 estimate",
+                "count_cache_hit_rate": round(cache.hits / (cache.hits + cache.misses), 3) if cache.hits + cache.misses else 0.0
+            }
+
+# Global instance (configured from the environment)
+context_packer = ContextPacker(
+    tokenizer_name=os.getenv("CONTEXT_TOKENIZER", "Xenova/llama3-tokenizer-new"),
+    budget=int(os.getenv("PROMPT_TOKEN_BUDGET", 3500)),
+    max_cached_counts=int(os.getenv("TOKEN_COUNT_CACHE_SIZE", 8192))
+)
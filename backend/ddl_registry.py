@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from oracle_pool import oracle_pool
+
+DDL_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Oracle_DDLs")
+METRICS_FILE = os.path.join(DDL_DIRECTORY, "metrics_values.txt")
+ALL_TABLES_FILE = os.path.join(DDL_DIRECTORY, "all_tables.sql")
+
+TABLE_PATTERN = re.compile(r'CREATE TABLE "ADMIN"\."([A-Z0-9_]+)"', re.IGNORECASE)
+QUARTER_COLUMN_PATTERN = re.compile(r'"(Q[1-4]_\d{4})"')
+METRICS_HEADER_PATTERN = re.compile(r"^--\s*Metrics for\s+([A-Z0-9_]+)", re.IGNORECASE)
+TABLE_SUFFIXES = ("_BALANCE_SHEET_QUARTERLY", "_CASH_FLOW_QUARTERLY", "_INCOME_QUARTERLY", "_RATIO_QUARTERLY")
+
+
+@dataclass
+class CompanyEntry:
+    name: str
+    ddl_prefix: str
+    ddl_text: Optional[str] = None
+    tables: List[str] = field(default_factory=list)
+    columns_by_table: Dict[str, List[str]] = field(default_factory=dict)
+    metrics_by_table: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def metrics(self) -> List[str]:
+        """All METRICS values across the company's tables, in file order without duplicates."""
+        seen = {}
+        for table in self.tables or self.metrics_by_table:
+            for metric in self.metrics_by_table.get(table, []):
+                seen.setdefault(metric, None)
+        return list(seen)
+
+
+def table_prefix(table_name: str) -> Optional[str]:
+    """Return the DDL prefix of a *_QUARTERLY table name (e.g. AMZN_INCOME_QUARTERLY -> AMZN)."""
+    table_name = table_name.upper()
+    for suffix in TABLE_SUFFIXES:
+        if table_name.endswith(suffix):
+            return table_name[:-len(suffix)]
+    return None
+
+
+def parse_table_columns(ddl_text: str) -> Dict[str, List[str]]:
+    """{TABLE_NAME: ["Q3_2024", ...]} for every CREATE TABLE in ``ddl_text`` that declares quarter columns."""
+    parts = TABLE_PATTERN.split(ddl_text)
+    columns_by_table = {}
+    for table, body in zip(parts[1::2], parts[2::2]):
+        columns = list(dict.fromkeys(QUARTER_COLUMN_PATTERN.findall(body)))
+        if columns:
+            columns_by_table[table.upper()] = columns
+    return columns_by_table
+
+
+def parse_metrics_file(path: str) -> Dict[str, List[str]]:
+    """Parse metrics_values.txt into {TABLE_NAME: [metric, ...]}."""
+    metrics_by_table: Dict[str, List[str]] = {}
+    current = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            header = METRICS_HEADER_PATTERN.match(line)
+            if header:
+                current = metrics_by_table.setdefault(header.group(1).upper(), [])
+            elif current is not None and not line.startswith("--"):
+                current.append(line)
+    return metrics_by_table
+
+
+class DDLRegistry:
+    """In-memory registry of company -> DDL prefix, DDL text, tables and METRICS vocabulary.
+
+    The company mapping comes from Oracle's COMPANY_MAPPING table and is reloaded after
+    ``ttl`` seconds. The DDL files and metrics_values.txt are re-read only when their
+    mtime changes. The per-company DDL files omit the column list, so each table's
+    quarter columns come from all_tables.sql. Every rebuild bumps ``version`` so dependent caches can tell when
+    the data underneath them changed.
+    """
+
+    def __init__(self, ddl_directory: str = DDL_DIRECTORY, metrics_file: str = METRICS_FILE, all_tables_file: str = ALL_TABLES_FILE):
+        self.ddl_directory = ddl_directory
+        self.metrics_file = metrics_file
+        self.all_tables_file = all_tables_file
+        self.ttl = float(os.getenv("DDL_REGISTRY_TTL", 3600))
+        self.check_interval = float(os.getenv("DDL_REGISTRY_CHECK_INTERVAL", 5))
+        self.version = 0
+
+        self._lock = threading.RLock()
+        self._companies: Dict[str, CompanyEntry] = {}
+        self._mapping_loaded_at = 0.0
+        self._last_check = 0.0
+        self._mtimes: Dict[str, float] = {}
+        self._metrics_by_table: Dict[str, List[str]] = {}
+        self._columns_by_table: Dict[str, List[str]] = {}
+
+    def _load_company_mapping(self) -> Dict[str, str]:
+        """Fetch {COMPANY_NAME: DDL_PREFIX} from the Oracle mapping table."""
+        query = "SELECT UPPER(COMPANY_NAME), DDL_PREFIX FROM COMPANY_MAPPING"
+        with oracle_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query)
+                return {row[0]: row[1] for row in cursor.fetchall() if row[0] and row[1]}
+
+    def _mtime(self, path: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def _ddl_path(self, ddl_prefix: str) -> str:
+        return os.path.join(self.ddl_directory, f"{ddl_prefix.lower()}_ddl.sql")
+
+    def _build_entry(self, name: str, ddl_prefix: str) -> CompanyEntry:
+        entry = CompanyEntry(name=name, ddl_prefix=ddl_prefix)
+        ddl_path = self._ddl_path(ddl_prefix)
+        if os.path.exists(ddl_path):
+            with open(ddl_path, "r", encoding="utf-8") as ddl_file:
+                entry.ddl_text = ddl_file.read().strip()
+            entry.tables = [t.upper() for t in TABLE_PATTERN.findall(entry.ddl_text)]
+            self._mtimes[ddl_path] = self._mtime(ddl_path)
+            own_columns = parse_table_columns(entry.ddl_text)
+        else:
+            own_columns = {}
+        entry.metrics_by_table = {
+            table: metrics for table, metrics in self._metrics_by_table.items()
+            if table_prefix(table) == ddl_prefix.upper()
+        }
+        if not entry.tables:
+            entry.tables = sorted(entry.metrics_by_table)
+        entry.columns_by_table = {
+            table: own_columns.get(table) or self._columns_by_table[table]
+            for table in entry.tables if table in own_columns or table in self._columns_by_table
+        }
+        return entry
+
+    def load(self, mapping: Optional[Dict[str, str]] = None):
+        """(Re)build the whole registry. ``mapping`` skips the Oracle lookup when given."""
+        with self._lock:
+            if mapping is None:
+                try:
+                    mapping = self._load_company_mapping()
+                    self._mapping_loaded_at = time.time()
+                except Exception as e:
+                    print(f"⚠️ Could not load COMPANY_MAPPING from Oracle: {e}")
+                    mapping = {name: entry.ddl_prefix for name, entry in self._companies.items()}
+            else:
+                self._mapping_loaded_at = time.time()
+
+            if os.path.exists(self.metrics_file):
+                self._metrics_by_table = parse_metrics_file(self.metrics_file)
+                self._mtimes[self.metrics_file] = self._mtime(self.metrics_file)
+            if os.path.exists(self.all_tables_file):
+                with open(self.all_tables_file, "r", encoding="utf-8") as f:
+                    self._columns_by_table = parse_table_columns(f.read())
+                self._mtimes[self.all_tables_file] = self._mtime(self.all_tables_file)
+
+            self._companies = {name.upper(): self._build_entry(name.upper(), prefix) for name, prefix in mapping.items()}
+            self.version += 1
+            self._last_check = time.time()
+            print(f"✅ DDL registry v{self.version} loaded ({len(self._companies)} companies, {len(self._metrics_by_table)} metric tables)")
+
+    def _maybe_refresh(self):
+        now = time.time()
+        if now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            mapping_expired = now - self._mapping_loaded_at >= self.ttl
+            files_changed = any(self._mtime(path) != mtime for path, mtime in self._mtimes.items())
+            if mapping_expired or files_changed:
+                print(f"🔄 Refreshing DDL registry (ttl expired: {mapping_expired}, files changed: {files_changed})")
+                self.load()
+
+    def get_company(self, company_name: str) -> Optional[CompanyEntry]:
+        """Look up a company entry by name (case-insensitive)."""
+        if not company_name:
+            return None
+        self._maybe_refresh()
+        return self._companies.get(company_name.upper())
+
+    def get_ddl_prefix(self, company_name: str) -> Optional[str]:
+        entry = self.get_company(company_name)
+        return entry.ddl_prefix if entry else None
+
+    def get_company_names(self) -> List[str]:
+        self._maybe_refresh()
+        return sorted(self._companies)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "companies": len(self._companies),
+                "metric_tables": len(self._metrics_by_table),
+                "mapping_age_s": round(time.time() - self._mapping_loaded_at, 1) if self._mapping_loaded_at else None
+            }
+
+# Global instance
+ddl_registry = DDLRegistry()
@@ -0,0 +1,275 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl  # serializes appends between server processes (not available on Windows)
+except ImportError:
+    fcntl = None
+
+DIGEST_SIZE = 32                 # sha256
+RECORD_SIZE = DIGEST_SIZE + 8    # digest + int64 row number
+
+
+def normalize_embedding_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace; case is kept because it can change the embedding."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class DiskEmbeddingStore:
+    """Append-only on-disk embedding store for one model.
+
+    ``vectors.f32`` holds the float32 vectors back to back and is read through a
+    read-only memory map. ``index.bin`` holds fixed-size (sha256 digest, row)
+    records that are loaded into a dict. Each record names its row explicitly, so
+    a crash between the two appends leaves an unreferenced vector, never a wrong
+    one. When another process appends, the new records are picked up on the next
+    miss. Once ``max_rows`` vectors are stored, new vectors stay in memory only.
+    """
+
+    def __init__(self, directory: str, max_rows: int):
+        self.directory = directory
+        self.max_rows = max_rows
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.bin")
+        self.meta_path = os.path.join(directory, "meta.json")
+        os.makedirs(directory, exist_ok=True)
+
+        self.dim: Optional[int] = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dim = json.load(f).get("dim")
+
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._index_offset = 0
+        self._vectors: Optional[np.memmap] = None
+        self.full = False
+        self._sync_index()
+
+    def _sync_index(self):
+        """Load index records appended since the last sync (by this or another process)."""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        usable = len(data) - len(data) % RECORD_SIZE
+        for offset in range(0, usable, RECORD_SIZE):
+            record = data[offset:offset + RECORD_SIZE]
+            self._index[record[:DIGEST_SIZE]] = int.from_bytes(record[DIGEST_SIZE:], "little")
+        self._index_offset += usable
+
+    def _row_count(self) -> int:
+        if not self.dim or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _read_row(self, row: int) -> Optional[np.ndarray]:
+        if self._vectors is None or row >= self._vectors.shape[0]:
+            rows = self._row_count()
+            if row >= rows:
+                return None
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return np.array(self._vectors[row])
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._index.get(digest)
+            if row is None:
+                self._sync_index()
+                row = self._index.get(digest)
+            if row is None or not self.dim:
+                return None
+            return self._read_row(row)
+
+    def put(self, digest: bytes, vector: np.ndarray):
+        with self._lock:
+            if self.full or digest in self._index:
+                return
+            if self.dim is None:
+                self.dim = len(vector)
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            if len(vector) != self.dim:
+                return
+
+            with open(self.index_path, "ab") as index_file, open(self.vectors_path, "ab") as vectors_file:
+                if fcntl:
+                    fcntl.flock(index_file, fcntl.LOCK_EX)
+                try:
+                    row = vectors_file.seek(0, os.SEEK_END) // (4 * self.dim)
+                    if row >= self.max_rows:
+                        self.full = True
+                        return
+                    # Drop the tail of a write torn by a crash so the next row starts at row * 4 * dim
+                    vectors_file.truncate(row * 4 * self.dim)
+                    index_file.truncate(index_file.seek(0, os.SEEK_END) // RECORD_SIZE * RECORD_SIZE)
+                    vectors_file.write(np.asarray(vector, dtype=np.float32).tobytes())
+                    vectors_file.flush()
+                    index_file.write(digest + row.to_bytes(8, "little"))
+                    index_file.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(index_file, fcntl.LOCK_UN)
+            self._index[digest] = row
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index)
+
+
+class EmbeddingCache:
+    """Query-embedding cache keyed on (model, normalized text).
+
+    Lookups go to an in-memory LRU of ``max_entries`` vectors first, then to the
+    per-model DiskEmbeddingStore under ``directory`` (if enabled), so repeated
+    questions skip the embedding API even after a restart. Misses are timed; every
+    hit is credited with the average miss latency as ``latency_saved_ms``.
+    """
+
+    def __init__(self, max_entries: int, directory: Optional[str] = None, max_disk_rows: int = 100000):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_rows = max_disk_rows
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._stores: Dict[str, DiskEmbeddingStore] = {}
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "miss_time_ms": 0.0}
+
+    @staticmethod
+    def make_key(model: str, text: str) -> bytes:
+        return hashlib.sha256(f"{model}|{normalize_embedding_text(text)}".encode("utf-8")).digest()
+
+    def _store(self, model: str) -> Optional[DiskEmbeddingStore]:
+        if not self.directory:
+            return None
+        with self._lock:
+            store = self._stores.get(model)
+            if store is None:
+                safe_name = re.sub(r"[^\w.-]", "_", model)
+                try:
+                    store = self._stores[model] = DiskEmbeddingStore(os.path.join(self.directory, safe_name), self.max_disk_rows)
+                except OSError as e:
+                    print(f"⚠️ Embedding disk cache unavailable: {e}")
+                    self.directory = None
+            return store
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return vector.tolist()
+
+        store = self._store(model)
+        vector = store.get(key) if store is not None else None
+        if vector is None:
+            return None
+        self._remember(key, vector)
+        with self._lock:
+            self.stats["disk_hits"] += 1
+        return vector.tolist()
+
+    def set(self, model: str, text: str, embedding: List[float], elapsed: float = 0.0):
+        """Store a freshly computed embedding; ``elapsed`` is the API call time in seconds."""
+        key = self.make_key(model, text)
+        vector = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, vector)
+        with self._lock:
+            self.stats["misses"] += 1
+            self.stats["miss_time_ms"] += elapsed * 1000
+        store = self._store(model)
+        if store is not None:
+            try:
+                store.put(key, vector)
+            except OSError as e:
+                print(f"⚠️ Embedding disk cache write failed: {e}")
+
+    def embed_query(self, embeddings: Embeddings, model: str, text: str) -> List[float]:
+        cached = self.get(model, text)
+        if cached is not None:
+            return cached
+        start_time = time.perf_counter()
+        embedding = embeddings.embed_query(text)
+        self.set(model, text, embedding, time.perf_counter() - start_time)
+        return embedding
+
+    async def aembed_query(self, embeddings: Embeddings, model: str, text: str) -> List[float]:
+        cached = self.get(model, text)
+        if cached is not None:
+            return cached
+        start_time = time.perf_counter()
+        embedding = await embeddings.aembed_query(text)
+        self.set(model, text, embedding, time.perf_counter() - start_time)
+        return embedding
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            total = hits + self.stats["misses"]
+            avg_miss_ms = self.stats["miss_time_ms"] / self.stats["misses"] if self.stats["misses"] else 0.0
+            stores = dict(self._stores)
+            stats = {
+                "memory_hits": self.stats["memory_hits"],
+                "disk_hits": self.stats["disk_hits"],
+                "misses": self.stats["misses"],
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+                "avg_miss_latency_ms": round(avg_miss_ms, 1),
+                "latency_saved_ms": round(hits * avg_miss_ms, 1),
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries
+            }
+        stats["disk"] = {model: {"entries": len(store), "full": store.full} for model, store in stores.items()}
+        return stats
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that answers embed_query from the embedding cache.
+
+    Document embeddings (PDF ingestion) pass straight through: they are computed
+    once per chunk and stored in MongoDB anyway.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache or embedding_cache
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.embed_query(self.embeddings, self.model, text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.cache.aembed_query(self.embeddings, self.model, text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+# Global instance (configured from the environment)
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 5000)),
+    directory=os.path.join(os.getenv("CACHE_DIR", "cache"), "embeddings") if os.getenv("EMBEDDING_CACHE_DISK", "true").lower() == "true" else None,
+    max_disk_rows=int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", 100000))
+)
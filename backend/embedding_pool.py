@@ -0,0 +1,137 @@
+import os
+import time
+import threading
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from groq_key_manager import KeyStatus
+
+QUOTA_ERROR_MARKERS = ("429", "quota", "resource exhausted", "resource_exhausted", "rate limit")
+
+
+class EmbeddingClientPool(Embeddings):
+    """Long-lived Google embedding clients, one per API key, behind a single Embeddings object.
+
+    Clients are built once per key and reused. Calls rotate round-robin across the
+    healthy keys. A quota error takes the key out of rotation for ``cooldown_period``
+    seconds immediately, and other errors after ``error_threshold`` consecutive
+    failures (same rule as EnhancedGroqKeyManager). The failed call is retried on the
+    next key. Because the pool is itself a LangChain ``Embeddings``, vector stores can
+    be built over it once and still rotate keys underneath.
+    """
+
+    def __init__(self, model: str = "models/embedding-001"):
+        self.model = model
+        self.keys: Dict[str, KeyStatus] = {}
+        self._clients: Dict[str, GoogleGenerativeAIEmbeddings] = {}
+        self._order: List[str] = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self.error_threshold = 3
+        self.cooldown_period = float(os.getenv("EMBEDDING_KEY_COOLDOWN", 300))
+
+    def initialize_keys(self, keys: List[Optional[str]]):
+        """Register the available API keys (empty entries are ignored)."""
+        with self._lock:
+            self._order = [key for key in dict.fromkeys(keys) if key]
+            self.keys = {key: KeyStatus(key) for key in self._order}
+            self._clients = {}
+            self._next = 0
+
+    def _client(self, key: str) -> GoogleGenerativeAIEmbeddings:
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = GoogleGenerativeAIEmbeddings(model=self.model, google_api_key=key)
+        return client
+
+    def _next_key(self, tried: set) -> Optional[str]:
+        """Next healthy key in round-robin order that this call has not tried yet."""
+        with self._lock:
+            now = time.time()
+            for _ in range(len(self._order)):
+                key = self._order[self._next % len(self._order)]
+                self._next += 1
+                status = self.keys[key]
+                if key not in tried and (status.disabled_until is None or status.disabled_until < now):
+                    status.last_used = now
+                    return key
+        return None
+
+    def _mark_key_result(self, key: str, success: bool, error: Optional[Exception] = None):
+        with self._lock:
+            status = self.keys.get(key)
+            if status is None:
+                return
+            if success:
+                status.success_count += 1
+                status.error_count = 0
+                status.disabled_until = None
+                return
+
+            status.error_count += 1
+            status.success_count = 0
+            is_quota_error = any(marker in str(error).lower() for marker in QUOTA_ERROR_MARKERS)
+            if is_quota_error or status.error_count >= self.error_threshold:
+                status.disabled_until = time.time() + self.cooldown_period
+                print(f"⚠️ Embedding key ...{key[-6:]} out of rotation for {self.cooldown_period:.0f}s ({'quota' if is_quota_error else 'errors'})")
+
+    def _call(self, method: str, *args):
+        tried = set()
+        last_error = None
+        while True:
+            key = self._next_key(tried)
+            if key is None:
+                break
+            tried.add(key)
+            try:
+                result = getattr(self._client(key), method)(*args)
+                self._mark_key_result(key, True)
+                return result
+            except Exception as e:
+                last_error = e
+                self._mark_key_result(key, False, e)
+                print(f"❌ Embedding key ...{key[-6:]} failed: {str(e)[:100]}")
+        raise RuntimeError(f"No Google embedding key available: {last_error}")
+
+    async def _acall(self, method: str, *args):
+        tried = set()
+        last_error = None
+        while True:
+            key = self._next_key(tried)
+            if key is None:
+                break
+            tried.add(key)
+            try:
+                result = await getattr(self._client(key), method)(*args)
+                self._mark_key_result(key, True)
+                return result
+            except Exception as e:
+                last_error = e
+                self._mark_key_result(key, False, e)
+                print(f"❌ Embedding key ...{key[-6:]} failed: {str(e)[:100]}")
+        raise RuntimeError(f"No Google embedding key available: {last_error}")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("embed_query", text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call("embed_documents", texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._acall("aembed_query", text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._acall("aembed_documents", texts)
+
+    def get_usage_stats(self) -> Dict[str, Dict]:
+        """Per-key usage statistics (keys shown by their last 6 characters)"""
+        with self._lock:
+            return {f"...{key[-6:]}": {k: v for k, v in vars(status).items() if k != "key"} for key, status in self.keys.items()}
+
+# Global instance
+embedding_pool = EmbeddingClientPool()
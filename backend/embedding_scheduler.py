@@ -0,0 +1,115 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+class RateLimiter:
+    """Spaces calls at least 60 / ``requests_per_minute`` seconds apart across threads (0 = unlimited)."""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class EmbeddingScheduler:
+    """Embeds a document's chunks in bounded, concurrent, rate-limited batches.
+
+    Identical chunk texts (repeated headers, disclaimers, boilerplate tables) are
+    embedded once, by content hash. The unique texts are split into batches of at
+    most ``batch_size`` texts and ``max_batch_chars`` characters. Up to
+    ``max_workers`` batches run at a time, and batch starts are spaced by the
+    ``requests_per_minute`` limit. A failed batch is retried on its own, with
+    backoff, up to ``max_retries`` times. Only a batch that still fails fails the
+    whole run.
+    """
+
+    def __init__(self, batch_size: int = 64, max_batch_chars: int = 60000, max_workers: int = 4,
+                 requests_per_minute: float = 120, max_retries: int = 3):
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(requests_per_minute)
+
+    def make_batches(self, texts: List[str]) -> List[List[str]]:
+        batches, batch, batch_chars = [], [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or batch_chars + len(text) > self.max_batch_chars):
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            batch.append(text)
+            batch_chars += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, embeddings: Embeddings, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                vectors = embeddings.embed_documents(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"expected {len(batch)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"⚠️ Embedding batch of {len(batch)} failed (attempt {attempt + 1}): {str(e)[:100]}")
+                time.sleep((attempt + 1) * 2)
+
+    def embed(self, embeddings: Embeddings, texts: List[str],
+              progress: Optional[Callable[[int, int], None]] = None) -> List[List[float]]:
+        """Embeddings for ``texts``, in order. ``progress(done, total)`` counts unique texts."""
+        unique: Dict[str, str] = {}
+        keys = []
+        for text in texts:
+            key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            unique.setdefault(key, text)
+            keys.append(key)
+
+        batches = self.make_batches(list(unique.values()))
+        print(f"🧮 Embedding {len(unique)} unique chunks ({len(texts) - len(unique)} duplicates skipped) in {len(batches)} batches")
+
+        vectors_by_text: Dict[str, List[float]] = {}
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed-batch") as executor:
+            futures = {executor.submit(self._embed_batch, embeddings, batch): batch for batch in batches}
+            try:
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    vectors_by_text.update(zip(batch, future.result()))
+                    done += len(batch)
+                    if progress:
+                        progress(done, len(unique))
+            except Exception:
+                # A batch ran out of retries: don't start the ones still queued
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return [vectors_by_text[unique[key]] for key in keys]
+
+# Global instance (configured from the environment)
+embedding_scheduler = EmbeddingScheduler(
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", 64)),
+    max_batch_chars=int(os.getenv("EMBEDDING_BATCH_MAX_CHARS", 60000)),
+    max_workers=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4)),
+    requests_per_minute=float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", 120)),
+    max_retries=int(os.getenv("EMBEDDING_BATCH_RETRIES", 3))
+)
@@ -0,0 +1,257 @@
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ddl_registry import CompanyEntry
+
+# Rule-based text-to-SQL for the templated questions that make up most traffic:
+# one metric (or a ratio of two), one or more quarters/years, and an optional
+# sum / difference / ratio / percentage change / min / max / average. Anything the
+# parser is not sure about returns None so the caller can fall back to the LLM.
+
+ORDINALS = {"first": 1, "1st": 1, "second": 2, "2nd": 2, "third": 3, "3rd": 3, "fourth": 4, "4th": 4}
+COUNTS = {"two": 2, "three": 3, "2": 2, "3": 3}
+
+PERIOD_PATTERN = re.compile(
+    r"(?P<first_n>\bfirst\s+(?P<count>two|three|2|3)\s+quarters(?:\s+of)?(?:\s+fy)?\s+(?P<first_n_year>20\d{2})\b)"
+    r"|(?P<half>\bfirst\s+half(?:\s+of)?(?:\s+fy)?\s+(?P<half_year>20\d{2})\b)"
+    r"|(?P<qy>\bq(?P<qy_q>[1-4])\s*[-_/]?\s*(?:fy)?(?P<qy_year>20\d{2})\b)"
+    r"|(?P<yq>\b(?P<yq_year>20\d{2})\s*[-_/]?\s*q(?P<yq_q>[1-4])\b)"
+    r"|(?P<nq>\bquarter\s*(?P<nq_q>[1-4])(?:\s+of)?(?:\s+(?:fy)?(?P<nq_year>20\d{2}))?\b)"
+    r"|(?P<oq>\b(?P<oq_ord>first|1st|second|2nd|third|3rd|fourth|4th)\s+quarter(?:\s+of)?(?:\s+(?:fy)?(?P<oq_year>20\d{2}))?\b)"
+    r"|(?P<q>\bq(?P<q_q>[1-4])\b)"
+    r"|(?P<year>\b(?:fy\s*)?(?P<year_year>20\d{2})\b)"
+)
+
+OPERATION_KEYWORDS = [
+    ("pct_change", re.compile(r"\b(?:percentage|percent)\s+(?:change|increase|decrease|growth)\b|%\s*change|\bgrowth\s+rate\b")),
+    ("ratio", re.compile(r"\bratio\b|\bproportion\b")),
+    ("min", re.compile(r"\b(?:minimum|min|lowest|smallest)\b")),
+    ("max", re.compile(r"\b(?:maximum|max|highest|largest|peak)\b")),
+    ("average", re.compile(r"\b(?:average|mean|avg)\b")),
+    ("change", re.compile(r"\b(?:change|difference|increase|decrease|compare|compared|yoy|year over year|qoq|quarter over quarter)\b")),
+    ("sum", re.compile(r"\b(?:total|sum|combined|cumulative)\b")),
+]
+
+# Words that may appear around a templated question without changing its meaning.
+# Anything else left over after removing the metric, periods and company means the
+# question is not one we can answer deterministically.
+FILLER_WORDS = {
+    "what", "was", "were", "is", "are", "the", "a", "an", "of", "in", "for", "to", "from", "and", "did",
+    "does", "do", "how", "much", "report", "reported", "reports", "give", "me", "provide", "show", "tell",
+    "with", "value", "values", "by", "at", "its", "their", "company", "during", "between", "than", "on",
+    "fiscal", "year", "quarter", "quarters", "please", "find", "get", "level", "amount", "figure", "us",
+    "can", "you", "i", "want", "know", "s", "it", "this", "that", "which", "as", "over", "across", "all",
+    "calculate", "compute", "whats", "has", "have", "had", "been", "be", "respectively",
+}
+
+FLOW_TABLE_SUFFIXES = ("_INCOME_QUARTERLY", "_CASH_FLOW_QUARTERLY")
+
+
+def normalize_text(text: str) -> str:
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"year[\s-]+over[\s-]+year", "year over year", text)
+    text = re.sub(r"quarter[\s-]+over[\s-]+quarter", "quarter over quarter", text)
+    text = re.sub(r"'s\b", "", text).replace("'", "")
+    text = re.sub(r"(?<=[a-z])-(?=[a-z])", "", text)
+    text = re.sub(r"[^\w\s&%./-]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _mask(text: str, start: int, end: int) -> str:
+    return text[:start] + " " * (end - start) + text[end:]
+
+
+_matcher_cache: Dict[str, Tuple[CompanyEntry, "re.Pattern", Dict[str, Tuple[str, str]]]] = {}
+_matcher_lock = threading.Lock()
+
+
+def _metric_matcher(entry: CompanyEntry) -> Tuple["re.Pattern", Dict[str, Tuple[str, str]]]:
+    """One alternation regex over the company's METRICS (longest first), rebuilt when the registry reloads the company."""
+    cached = _matcher_cache.get(entry.name)
+    if cached is not None and cached[0] is entry:
+        return cached[1], cached[2]
+
+    candidates = {}
+    for table in entry.tables:
+        for metric in entry.metrics_by_table.get(table, []):
+            candidates.setdefault(normalize_text(metric), (metric, table))
+    alternatives = "|".join(re.escape(m) for m in sorted(candidates, key=len, reverse=True))
+    pattern = re.compile(rf"(?<![a-z0-9])(?:{alternatives})(?![a-z0-9])")
+    with _matcher_lock:
+        _matcher_cache[entry.name] = (entry, pattern, candidates)  # replaces the stale entry
+    return pattern, candidates
+
+
+def _find_metrics(text: str, entry: CompanyEntry) -> Tuple[List[Tuple[int, str, str]], str]:
+    """Longest non-overlapping METRICS matches as (position, metric, table); returns the masked text too."""
+    pattern, candidates = _metric_matcher(entry)
+    found = []
+    for match in pattern.finditer(text):
+        metric, table = candidates[match.group(0)]
+        found.append((match.start(), metric, table))
+        text = _mask(text, match.start(), match.end())
+    return found, text
+
+
+def _find_periods(text: str) -> Tuple[List[List[str]], str]:
+    """Quarter/year mentions in order of appearance, each as a list of "Qn_YYYY" columns."""
+    raw = []  # (quarters, year or None)
+    for match in PERIOD_PATTERN.finditer(text):
+        groups = match.groupdict()
+        if groups["first_n"]:
+            raw.append((list(range(1, COUNTS[groups["count"]] + 1)), int(groups["first_n_year"])))
+        elif groups["half"]:
+            raw.append(([1, 2], int(groups["half_year"])))
+        elif groups["qy"]:
+            raw.append(([int(groups["qy_q"])], int(groups["qy_year"])))
+        elif groups["yq"]:
+            raw.append(([int(groups["yq_q"])], int(groups["yq_year"])))
+        elif groups["nq"]:
+            raw.append(([int(groups["nq_q"])], int(groups["nq_year"]) if groups["nq_year"] else None))
+        elif groups["oq"]:
+            raw.append(([ORDINALS[groups["oq_ord"]]], int(groups["oq_year"]) if groups["oq_year"] else None))
+        elif groups["q"]:
+            raw.append(([int(groups["q_q"])], None))
+        elif groups["year"]:
+            raw.append(([1, 2, 3, 4], int(groups["year_year"])))
+        text = _mask(text, match.start(), match.end())
+
+    # Quarters mentioned without a year borrow the nearest following year, else the previous one
+    periods = []
+    for i, (quarters, year) in enumerate(raw):
+        if year is None:
+            following = [y for _, y in raw[i + 1:] if y is not None]
+            preceding = [y for _, y in raw[:i] if y is not None]
+            year = following[0] if following else (preceding[-1] if preceding else None)
+        if year is None:
+            return [], text
+        periods.append([f"Q{q}_{year}" for q in quarters])
+    return periods, text
+
+
+def _company_patterns(entry: CompanyEntry) -> List[str]:
+    """Regexes for the ways a company is written, e.g. JPMORGAN -> "jp morgan", ATT -> "at&t"."""
+    compact = re.sub(r"[^a-z0-9]", "", normalize_text(entry.name))
+    variants = {compact, compact.rstrip("s"), entry.ddl_prefix.lower()}
+    return [r"[\s&.]*".join(map(re.escape, v)) for v in sorted((v for v in variants if v), key=len, reverse=True)]
+
+
+def _detect_operation(text: str) -> Optional[str]:
+    for name, pattern in OPERATION_KEYWORDS:
+        if pattern.search(text):
+            return name
+    return None
+
+
+def _column_order(column: str) -> Tuple[int, int]:
+    quarter, year = column[1:].split("_")
+    return int(year), int(quarter)
+
+
+def _quote(value: str) -> str:
+    return value.replace("'", "''")
+
+
+def generate_fast_sql(question: str, entry: Optional[CompanyEntry]) -> Optional[str]:
+    """Build the SQL for a templated metric question, or return None if the question does not fit."""
+    if not question or entry is None or not entry.metrics_by_table:
+        return None
+
+    text = normalize_text(question)
+    metrics, remaining = _find_metrics(text, entry)
+    # Detect the operation only after metric names are masked ("Total Assets" is not a sum)
+    operation = _detect_operation(remaining)
+    periods, remaining = _find_periods(remaining)
+    for company_pattern in _company_patterns(entry):
+        remaining = re.sub(rf"(?<![a-z0-9]){company_pattern}(?![a-z0-9])", " ", remaining)
+    for _, pattern in OPERATION_KEYWORDS:
+        remaining = pattern.sub(" ", remaining)
+
+    leftover = [w for w in re.findall(r"[a-z0-9&%]+", remaining) if w not in FILLER_WORDS]
+    if leftover or not metrics or not periods:
+        return None
+
+    # Periods the tables don't have (or tables whose columns are unknown) are left to the LLM
+    columns = [c for period in periods for c in period]
+    for _, _, table in metrics:
+        available = entry.columns_by_table.get(table, [])
+        if any(c not in available for c in columns):
+            return None
+
+    # Ratio of two metrics in the same quarter (self-join on METRICS)
+    if len(metrics) == 2:
+        (_, metric_a, table_a), (_, metric_b, table_b) = metrics
+        if operation != "ratio" or len(columns) != 1 or metric_a == metric_b:
+            return None
+        column = columns[0]
+        return (
+            f'SELECT a."{column}" * 1.0 / b."{column}" AS ratio '
+            f'FROM "ADMIN"."{table_a}" a JOIN "ADMIN"."{table_b}" b '
+            f"ON a.\"METRICS\" = '{_quote(metric_a)}' AND b.\"METRICS\" = '{_quote(metric_b)}'"
+        )
+    if len(metrics) != 1:
+        return None
+
+    _, metric, table = metrics[0]
+    from_where = f"FROM \"ADMIN\".\"{table}\" WHERE \"METRICS\" = '{_quote(metric)}'"
+    quoted = [f'"{c}"' for c in columns]
+
+    if operation in ("min", "max", "average") or (operation == "sum" and len(columns) > 1):
+        if len(columns) < 2:
+            return None
+        if operation == "min":
+            return f"SELECT LEAST({', '.join(quoted)}) {from_where}"
+        if operation == "max":
+            return f"SELECT GREATEST({', '.join(quoted)}) {from_where}"
+        if operation == "average":
+            return f"SELECT ({' + '.join(quoted)}) / {len(quoted)} {from_where}"
+        return f"SELECT ({' + '.join(quoted)}) {from_where}"
+
+    if operation in ("change", "pct_change", "ratio"):
+        if len(periods) != 2 or any(len(p) != 1 for p in periods):
+            return None
+        first, second = columns
+        if operation == "ratio":
+            return f'SELECT ("{first}" / "{second}") {from_where}'
+        older, newer = sorted(columns, key=_column_order)
+        if older == newer:
+            return None
+        if operation == "pct_change":
+            return f'SELECT ("{newer}" - "{older}") / "{older}" * 100 {from_where}'
+        return f'SELECT ("{newer}" - "{older}") {from_where}'
+
+    if operation is not None and operation != "sum":
+        return None
+
+    if len(columns) == 1:
+        return f'SELECT "{columns[0]}" {from_where}'
+
+    # A bare year means a full-year total, which only makes sense for flow statements
+    if len(periods) == 1 and (operation == "sum" or table.endswith(FLOW_TABLE_SUFFIXES)):
+        return f"SELECT ({' + '.join(quoted)}) {from_where}"
+    return None
+
+
+class FastSQLStats:
+    """Hit/miss counters for the deterministic SQL path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+# Global instance
+fast_sql_stats = FastSQLStats()
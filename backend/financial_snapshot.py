@@ -0,0 +1,398 @@
+import os
+import re
+import time
+import itertools
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from oracle_pool import oracle_pool
+from ddl_registry import ddl_registry
+
+# Local columnar copy of the ADMIN.*_QUARTERLY tables plus an executor for the SQL
+# subset that query_llm / fast_sql produce (column arithmetic, LEAST/GREATEST and
+# self-joins on METRICS). Anything outside that subset returns None so the caller
+# can run the statement on Oracle instead.
+
+SNAPSHOT_PATH = os.path.join(os.getenv("SNAPSHOT_DIR", "snapshot"), "financial_snapshot.npz")
+
+
+@dataclass
+class TableSnapshot:
+    columns: List[str]
+    metrics: List[str]
+    values: np.ndarray  # float64, shape (len(metrics), len(columns)); NaN for NULL
+    metric_rows: Dict[str, List[int]]
+
+    @classmethod
+    def build(cls, columns: List[str], metrics: List[str], values: np.ndarray) -> "TableSnapshot":
+        metric_rows: Dict[str, List[int]] = {}
+        for i, metric in enumerate(metrics):
+            metric_rows.setdefault(metric, []).append(i)
+        return cls(columns=columns, metrics=metrics, values=values, metric_rows=metric_rows)
+
+
+def _oracle_number(value: Optional[float]) -> Union[int, float, None]:
+    """A result cell as python-oracledb returns it: None for NULL, int for whole numbers, else float."""
+    if value is None or np.isnan(value):
+        return None
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class UnsupportedQuery(Exception):
+    """The statement is outside the subset the snapshot executor understands."""
+
+
+TOKEN_PATTERN = re.compile(
+    r"\s*(?:(?P<number>\d+(?:\.\d+)?)|(?P<quoted>\"[^\"]+\")|(?P<string>'(?:[^']|'')*')"
+    r"|(?P<ident>[A-Za-z_][A-Za-z0-9_$#]*)|(?P<op>[(),.+\-*/=;]))"
+)
+
+
+def tokenize(sql: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    sql = sql.strip()
+    while position < len(sql):
+        match = TOKEN_PATTERN.match(sql, position)
+        if not match or match.end() == position:
+            raise UnsupportedQuery(f"Unexpected input at: {sql[position:position + 20]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "quoted":
+            kind, value = "ident", value[1:-1]
+        elif kind == "ident":
+            value = value.upper()
+        elif kind == "string":
+            value = value[1:-1].replace("''", "'")
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+class SnapshotQuery:
+    """Recursive-descent parser/evaluator for one SELECT over snapshot tables."""
+
+    def __init__(self, sql: str, tables: Dict[str, TableSnapshot]):
+        self.tokens = tokenize(sql)
+        self.position = 0
+        self.tables = tables
+        self.sources: Dict[str, TableSnapshot] = {}  # alias -> table
+        self.filters: Dict[str, str] = {}  # alias -> METRICS value
+
+    # -- token helpers --------------------------------------------------
+    def _peek(self, offset: int = 0) -> Tuple[str, str]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else ("eof", "")
+
+    def _take(self) -> Tuple[str, str]:
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def _accept(self, kind: str, value: Optional[str] = None) -> bool:
+        token_kind, token_value = self._peek()
+        if token_kind == kind and (value is None or token_value == value):
+            self.position += 1
+            return True
+        return False
+
+    def _expect(self, kind: str, value: Optional[str] = None) -> str:
+        token_kind, token_value = self._take()
+        if token_kind != kind or (value is not None and token_value != value):
+            raise UnsupportedQuery(f"Expected {value or kind}, got {token_value!r}")
+        return token_value
+
+    # -- statement ------------------------------------------------------
+    def run(self) -> List[tuple]:
+        self._expect("ident", "SELECT")
+        select_start = self.position
+        self._skip_select_list()
+        self._expect("ident", "FROM")
+        self._table_ref()
+        while self._accept("ident", "JOIN") or (self._accept("ident", "INNER") and self._expect("ident", "JOIN")):
+            self._table_ref()
+            if self._accept("ident", "ON"):
+                self._conditions()
+        if self._accept("ident", "WHERE"):
+            self._conditions()
+        self._accept("op", ";")
+        if self._peek()[0] != "eof":
+            raise UnsupportedQuery(f"Unsupported clause: {self._peek()[1]}")
+
+        # Every combination of matching rows, like Oracle's join without further predicates
+        aliases = list(self.sources)
+        row_choices = []
+        for alias in aliases:
+            table = self.sources[alias]
+            if alias in self.filters:
+                rows = table.metric_rows.get(self.filters[alias])
+                if rows is None:
+                    raise UnsupportedQuery(f"Metric {self.filters[alias]!r} not in snapshot")
+            else:
+                rows = list(range(len(table.metrics)))
+            row_choices.append(rows)
+
+        results = []
+        for combination in itertools.product(*row_choices):
+            self.current_rows = dict(zip(aliases, combination))
+            self.position = select_start
+            results.append(tuple(self._select_list()))
+        return results
+
+    def _table_ref(self):
+        name = self._expect("ident")
+        if self._accept("op", "."):
+            if name != "ADMIN":
+                raise UnsupportedQuery(f"Unsupported schema {name}")
+            name = self._expect("ident")
+        table = self.tables.get(name)
+        if table is None:
+            raise UnsupportedQuery(f"Table {name} not in snapshot")
+        alias = name
+        kind, value = self._peek()
+        if kind == "ident" and value not in ("JOIN", "INNER", "ON", "WHERE"):
+            alias = value
+            self.position += 1
+        self.sources[alias] = table
+
+    def _conditions(self):
+        while True:
+            alias = self._column_alias()
+            self._expect("op", "=")
+            kind, value = self._take()
+            if kind != "string":
+                raise UnsupportedQuery("Only METRICS = '<value>' predicates are supported")
+            if self.filters.get(alias, value) != value:
+                raise UnsupportedQuery(f"Conflicting METRICS predicates on {alias}")
+            self.filters[alias] = value
+            if not self._accept("ident", "AND"):
+                break
+
+    def _column_alias(self) -> str:
+        """Parse a METRICS column reference and return the alias it belongs to."""
+        first = self._expect("ident")
+        if self._accept("op", "."):
+            alias, column = first, self._expect("ident")
+        else:
+            if len(self.sources) != 1:
+                raise UnsupportedQuery("Ambiguous METRICS reference")
+            alias, column = next(iter(self.sources)), first
+        if column != "METRICS" or alias not in self.sources:
+            raise UnsupportedQuery(f"Unsupported predicate on {alias}.{column}")
+        return alias
+
+    # -- select list ----------------------------------------------------
+    def _skip_select_list(self):
+        depth = 0
+        while True:
+            kind, value = self._peek()
+            if kind == "eof":
+                raise UnsupportedQuery("Missing FROM")
+            if depth == 0 and kind == "ident" and value == "FROM":
+                return
+            depth += (value == "(") - (value == ")") if kind == "op" else 0
+            self.position += 1
+
+    def _select_list(self) -> List[Union[int, float, None]]:
+        values = []
+        while True:
+            values.append(self._expression())
+            if self._accept("ident", "AS"):
+                self._expect("ident")
+            elif self._peek()[0] == "ident" and self._peek()[1] != "FROM":
+                self.position += 1
+            if not self._accept("op", ","):
+                return [_oracle_number(v) for v in values]
+
+    def _expression(self) -> Optional[float]:
+        value = self._term()
+        while self._peek() in (("op", "+"), ("op", "-")):
+            op = self._take()[1]
+            right = self._term()
+            value = None if value is None or right is None else (value + right if op == "+" else value - right)
+        return value
+
+    def _term(self) -> Optional[float]:
+        value = self._factor()
+        while self._peek() in (("op", "*"), ("op", "/")):
+            op = self._take()[1]
+            right = self._factor()
+            if value is None or right is None:
+                value = None
+            elif op == "*":
+                value = value * right
+            elif right == 0:
+                raise UnsupportedQuery("Division by zero")
+            else:
+                value = value / right
+        return value
+
+    def _factor(self) -> Optional[float]:
+        kind, value = self._take()
+        if kind == "op" and value == "-":
+            inner = self._factor()
+            return None if inner is None else -inner
+        if kind == "op" and value == "(":
+            inner = self._expression()
+            self._expect("op", ")")
+            return inner
+        if kind == "number":
+            return float(value)
+        if kind == "ident" and value in ("LEAST", "GREATEST") and self._accept("op", "("):
+            args = [self._expression()]
+            while self._accept("op", ","):
+                args.append(self._expression())
+            self._expect("op", ")")
+            if any(a is None for a in args):
+                return None
+            return min(args) if value == "LEAST" else max(args)
+        if kind == "ident":
+            if self._accept("op", "."):
+                alias, column = value, self._expect("ident")
+            else:
+                if len(self.sources) != 1:
+                    raise UnsupportedQuery(f"Ambiguous column {value}")
+                alias, column = next(iter(self.sources)), value
+            table = self.sources.get(alias)
+            if table is None or column not in table.columns:
+                raise UnsupportedQuery(f"Unknown column {alias}.{column}")
+            cell = table.values[self.current_rows[alias], table.columns.index(column)]
+            return None if np.isnan(cell) else float(cell)
+        raise UnsupportedQuery(f"Unexpected token {value!r}")
+
+
+class FinancialSnapshot:
+    """Columnar snapshot of all ADMIN.*_QUARTERLY tables, refreshed on demand or on a schedule."""
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self.refresh_interval = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", 3600))  # seconds, 0 = on demand only
+        self._tables: Dict[str, TableSnapshot] = {}
+        self._lock = threading.Lock()
+        self._scheduler: Optional[threading.Thread] = None
+        self.refreshed_at: Optional[float] = None
+        self.hits = 0
+        self.fallbacks = 0
+
+    def _fetch_table(self, cursor, table: str) -> TableSnapshot:
+        cursor.execute(f'SELECT * FROM "ADMIN"."{table}"')
+        names = [desc[0] for desc in cursor.description]
+        metric_col = names.index("METRICS")
+        columns = [n for n in names if n != "METRICS"]
+        rows = cursor.fetchall()
+        metrics = [row[metric_col] for row in rows]
+        values = np.array(
+            [[np.nan if row[i] is None else row[i] for i, n in enumerate(names) if i != metric_col] for row in rows],
+            dtype=np.float64
+        ).reshape(len(rows), len(columns))
+        return TableSnapshot.build(columns, metrics, values)
+
+    def refresh(self) -> List[str]:
+        """Pull every *_QUARTERLY table from Oracle; returns the tables whose data changed."""
+        start_time = time.time()
+        tables = sorted({t for name in ddl_registry.get_company_names() for t in ddl_registry.get_company(name).tables})
+        fresh: Dict[str, TableSnapshot] = {}
+        with oracle_pool.connection() as connection:
+            with connection.cursor() as cursor:
+                for table in tables:
+                    try:
+                        fresh[table] = self._fetch_table(cursor, table)
+                    except Exception as e:
+                        print(f"⚠️ Snapshot skipped {table}: {e}")
+
+        with self._lock:
+            changed = [t for t, snap in fresh.items() if not self._same(self._tables.get(t), snap)]
+            self._tables = {**self._tables, **fresh}  # swapped, never mutated: execute() reads it without the lock
+            self.refreshed_at = time.time()
+        self.save()
+        print(f"✅ Financial snapshot refreshed: {len(fresh)} tables, {len(changed)} changed ({time.time() - start_time:.2f}s)")
+        return changed
+
+    @staticmethod
+    def _same(old: Optional[TableSnapshot], new: TableSnapshot) -> bool:
+        return (old is not None and old.columns == new.columns and old.metrics == new.metrics
+                and np.array_equal(old.values, new.values, equal_nan=True))
+
+    def save(self):
+        with self._lock:
+            arrays = {}
+            for table, snap in self._tables.items():
+                arrays[f"{table}__values"] = snap.values
+                arrays[f"{table}__metrics"] = np.array(snap.metrics, dtype=str)
+                arrays[f"{table}__columns"] = np.array(snap.columns, dtype=str)
+            arrays["__refreshed_at__"] = np.array([self.refreshed_at or time.time()])
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"  # several server processes may save at once
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> bool:
+        """Load the snapshot saved by the last refresh, if there is one."""
+        if not os.path.exists(self.path):
+            return False
+        with np.load(self.path, allow_pickle=False) as data:
+            tables = {}
+            for key in data.files:
+                if key.endswith("__values"):
+                    table = key[:-len("__values")]
+                    tables[table] = TableSnapshot.build(
+                        data[f"{table}__columns"].tolist(), data[f"{table}__metrics"].tolist(), data[key]
+                    )
+            refreshed_at = float(data["__refreshed_at__"][0]) if "__refreshed_at__" in data.files else None
+        with self._lock:
+            self._tables = tables
+            self.refreshed_at = refreshed_at
+        print(f"✅ Financial snapshot loaded from disk ({len(tables)} tables)")
+        return True
+
+    def execute(self, sql: str) -> Optional[List[tuple]]:
+        """Answer ``sql`` from the snapshot, or return None if Oracle has to run it."""
+        with self._lock:
+            tables = self._tables
+        if not tables:
+            return None
+        try:
+            results = SnapshotQuery(sql, tables).run()
+            with self._lock:
+                self.hits += 1
+            return results
+        except UnsupportedQuery as e:
+            with self._lock:
+                self.fallbacks += 1
+            print(f"↪️ Snapshot cannot answer query ({e}); falling back to Oracle")
+            return None
+
+    def start_scheduler(self, on_change=None):
+        """Refresh every ``refresh_interval`` seconds in a daemon thread; ``on_change(tables)`` gets changed tables."""
+        if self.refresh_interval <= 0 or self._scheduler is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.refresh_interval)
+                try:
+                    changed = self.refresh()
+                    if changed and on_change:
+                        on_change(changed)
+                except Exception as e:
+                    print(f"❌ Scheduled snapshot refresh failed: {e}")
+
+        self._scheduler = threading.Thread(target=loop, daemon=True, name="snapshot-refresh")
+        self._scheduler.start()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "tables": len(self._tables),
+                "metrics_rows": sum(len(s.metrics) for s in self._tables.values()),
+                "refreshed_at": self.refreshed_at,
+                "refresh_interval_s": self.refresh_interval,
+                "hits": self.hits,
+                "fallbacks": self.fallbacks
+            }
+
+# Global instance
+financial_snapshot = FinancialSnapshot()
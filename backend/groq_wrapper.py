@@ -1,7 +1,17 @@
-from groq import Groq
+from groq import Groq, AsyncGroq
 from groq_key_manager import key_manager
 import time
-from typing import Optional, Tuple
+import asyncio
+from typing import Dict, Iterator, Optional, Tuple
+
+# One AsyncGroq client (and its HTTP connection pool) per API key, shared by all coroutines
+_async_clients: Dict[str, AsyncGroq] = {}
+
+def _backoff(seconds: float, deadline: Optional[float] = None) -> float:
+    """``seconds``, cut to the time left before ``deadline`` (a time.monotonic() timestamp) if one is given."""
+    if deadline is None:
+        return seconds
+    return min(seconds, max(deadline - time.monotonic(), 0))
 
 class GroqWrapper:
     @staticmethod
@@ -32,12 +42,112 @@ class GroqWrapper:
         )
     
     @staticmethod
-    def _make_request(key_getter, result_marker, *args, **kwargs):
-        """Generic request handler with retry logic"""
+    async def make_rag_request_async(*args, **kwargs) -> Tuple[Optional[dict], Optional[str]]:
+        """Async RAG request with error handling and key rotation"""
+        return await GroqWrapper._make_request_async(
+            key_manager.get_rag_key,
+            key_manager.mark_rag_key_result,
+            *args, **kwargs
+        )
+
+    @staticmethod
+    async def make_sql_request_async(*args, **kwargs) -> Tuple[Optional[dict], Optional[str]]:
+        """Async SQL request with error handling and key rotation"""
+        return await GroqWrapper._make_request_async(
+            key_manager.get_sql_key,
+            key_manager.mark_sql_key_result,
+            *args, **kwargs
+        )
+
+    @staticmethod
+    async def make_summarize_request_async(*args, **kwargs) -> Tuple[Optional[dict], Optional[str]]:
+        """Async summarize request with error handling and key rotation"""
+        return await GroqWrapper._make_request_async(
+            key_manager.get_summarize_key,
+            key_manager.mark_summarize_key_result,
+            *args, **kwargs
+        )
+
+    @staticmethod
+    def stream_rag_request(*args, **kwargs) -> Iterator[str]:
+        """Stream a RAG completion token by token with key rotation"""
+        return GroqWrapper._stream_request(
+            key_manager.get_rag_key,
+            key_manager.mark_rag_key_result,
+            *args, **kwargs
+        )
+
+    @staticmethod
+    def stream_summarize_request(*args, **kwargs) -> Iterator[str]:
+        """Stream a summarize completion token by token with key rotation"""
+        return GroqWrapper._stream_request(
+            key_manager.get_summarize_key,
+            key_manager.mark_summarize_key_result,
+            *args, **kwargs
+        )
+
+    @staticmethod
+    def _stream_request(key_getter, result_marker, *args, deadline=None, **kwargs):
+        """Generator yielding content deltas as they arrive.
+
+        A failing key is rotated out only until the first token has been yielded;
+        after that an error is raised to the caller, since the partial output is already sent.
+        A ``deadline`` bounds attempts and backoff as in _make_request.
+        """
+        max_retries = 3
+        last_error = None
+
+        for attempt in range(max_retries):
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    last_error = last_error or "Request deadline exceeded"
+                    break
+                kwargs["timeout"] = remaining
+            key = key_getter()
+            started = False
+            try:
+                print(f"Streaming with API Key: {key[-6]}... (Attempt {attempt + 1}/{max_retries})")
+                client = Groq(api_key=key)
+                stream = client.chat.completions.create(*args, stream=True, **kwargs)
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        started = True
+                        yield delta
+
+                result_marker(key, True)
+                return
+
+            except Exception as e:
+                last_error = str(e)
+                result_marker(key, False)
+
+                print(f"❌ Key {key[-6:]} failed while streaming: {str(e)[:100]}...")
+                if started:
+                    raise
+                # Exponential backoff
+                time.sleep(_backoff(2 ** attempt, deadline))
+
+        raise RuntimeError(last_error)
+
+    @staticmethod
+    def _make_request(key_getter, result_marker, *args, deadline=None, **kwargs):
+        """Generic request handler with retry logic.
+
+        With a ``deadline`` (time.monotonic() timestamp) each attempt gets the time left
+        as its timeout, and no attempt or backoff runs past it.
+        """
         max_retries = 3
         last_error = None
         
         for attempt in range(max_retries):
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    last_error = last_error or "Request deadline exceeded"
+                    break
+                kwargs["timeout"] = remaining
             key = key_getter()
             try:
                 print(f"Using API Key: {key[-6]}... (Attempt {attempt + 1}/{max_retries})")
@@ -66,6 +176,56 @@ class GroqWrapper:
                 
                 print(f"❌ Key {key[-6:]} failed: {str(e)[:100]}...")
                 # Exponential backoff
-                time.sleep(2 ** attempt)
+                time.sleep(_backoff(2 ** attempt, deadline))
         
-        return None, last_error
\ No newline at end of file
+        return None, last_error
+
+    @staticmethod
+    def get_async_client(key: str) -> AsyncGroq:
+        """Shared AsyncGroq client for ``key``"""
+        client = _async_clients.get(key)
+        if client is None:
+            client = _async_clients.setdefault(key, AsyncGroq(api_key=key))
+        return client
+
+    @staticmethod
+    async def _make_request_async(key_getter, result_marker, *args, deadline=None, **kwargs):
+        """Async counterpart of _make_request; backs off with asyncio.sleep so the event loop keeps serving"""
+        max_retries = 3
+        last_error = None
+
+        for attempt in range(max_retries):
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    last_error = last_error or "Request deadline exceeded"
+                    break
+                kwargs["timeout"] = remaining
+            key = key_getter()
+            try:
+                print(f"Using API Key: {key[-6]}... (Attempt {attempt + 1}/{max_retries}, async)")
+                client = GroqWrapper.get_async_client(key)
+                start_time = time.time()
+                response = await client.chat.completions.create(*args, **kwargs)
+                latency = time.time() - start_time
+
+                result_marker(key, True)
+
+                if hasattr(response, '__dict__'):
+                    response.__dict__['_metadata'] = {
+                        'api_key': key[-6:],
+                        'latency': latency,
+                        'attempt': attempt + 1
+                    }
+
+                return response, None
+
+            except Exception as e:
+                last_error = str(e)
+                result_marker(key, False)
+
+                print(f"❌ Key {key[-6:]} failed: {str(e)[:100]}...")
+                # Exponential backoff
+                await asyncio.sleep(_backoff(2 ** attempt, deadline))
+
+        return None, last_error
@@ -0,0 +1,205 @@
+"""Offline ingestion of the extracted SEC filings (extracted_sec_text/) into chunks_data.
+
+Streams the filings one file at a time and chunks them with the splitter
+FinancialRAGSystem uses. Company, quarter and year come from the file name
+("Amazon_Q1 2023.txt"). New chunks are embedded through the embedding
+scheduler (concurrent, rate-limited batches) and upserted by content hash:
+- a file whose bytes did not change since its last ingestion (recorded in
+  ingested_filings) is skipped
+- in a changed file, only chunks with new text are embedded
+- chunks that are no longer in the file are deleted. Chunks loaded by hand
+  (without a content_hash) are left alone unless --replace-legacy is given, which
+  deletes them once the file's own chunks are stored.
+
+Before ingesting, company / quarter / year partition keys are backfilled onto
+chunks stored without them, and the Atlas vector index is given those filter
+fields (the server only reads the index state). --partitions-only does just
+that.
+
+Reports files/sec, chunks/sec and the estimated embedding cost
+(EMBEDDING_PRICE_PER_MILLION_TOKENS, tokens estimated as characters / 4).
+
+Usage: python ingest_filings.py [--dir extracted_sec_text] [--match Amazon_] [--force] [--dry-run] [--replace-legacy] [--partitions-only]
+"""
+import os
+import sys
+import glob
+import time
+import hashlib
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from pymongo.operations import SearchIndexModel
+
+from chunk_partitions import PARTITION_FIELDS, partition_keys, vector_index_definition
+from embedding_pool import embedding_pool
+from embedding_scheduler import embedding_scheduler
+from pdf_extraction import make_text_splitter
+
+load_dotenv()
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extracted_sec_text")
+PRICE_PER_MILLION_TOKENS = float(os.getenv("EMBEDDING_PRICE_PER_MILLION_TOKENS", 0.15))
+
+
+def _arg(name, default):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def ensure_index(chunks):
+    """Unique (company_id, content_hash) upsert key; hand-loaded chunks without a hash are exempt."""
+    chunks.create_index(
+        [("company_id", 1), ("content_hash", 1)],
+        name="company_content_hash",
+        unique=True,
+        partialFilterExpression={"content_hash": {"$exists": True}}
+    )
+
+
+def backfill_partitions(chunks):
+    """Write partition keys onto chunks stored without them (one update per filing)."""
+    updated = 0
+    for company_id in chunks.distinct("company_id", {"year": {"$exists": False}}):
+        keys = partition_keys(company_id)
+        if not keys:
+            print(f"⚠️ No period in company_id {company_id!r}; its chunks stay unpartitioned")
+            continue
+        updated += chunks.update_many({"company_id": company_id, "year": {"$exists": False}}, {"$set": keys}).modified_count
+    print(f"🗂️ Partition keys backfilled onto {updated} chunks")
+
+
+def ensure_vector_index(chunks, index_name="vector_index"):
+    """Create the vector index, or add the partition filter fields to it. Atlas rebuilds it in the background."""
+    indexes = list(chunks.list_search_indexes(index_name))
+    if not indexes:
+        chunks.create_search_index(SearchIndexModel(vector_index_definition(), name=index_name, type="vectorSearch"))
+        print(f"🔧 Creating {index_name}")
+        return
+    fields = indexes[0].get("latestDefinition", {}).get("fields", [])
+    if not set(PARTITION_FIELDS) <= {field.get("path") for field in fields if field.get("type") == "filter"}:
+        vector = next((field for field in fields if field.get("type") == "vector"), {})
+        chunks.update_search_index(index_name, vector_index_definition(vector.get("numDimensions", 768)))
+        print(f"🔧 Adding {', '.join(PARTITION_FIELDS)} filter fields to {index_name}")
+
+
+def chunk_filing(path, splitter):
+    """(content_hash, sequence, text) per chunk; repeated chunk texts in a filing are kept once."""
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    seen = set()
+    for sequence, chunk in enumerate(splitter.split_text(text), start=1):
+        digest = content_hash(chunk)
+        if digest not in seen:
+            seen.add(digest)
+            yield digest, sequence, chunk
+
+
+def ingest_file(path, chunks, manifest, splitter, force, dry_run, replace_legacy=False):
+    """Ingest one filing; returns (chunks written, chunks embedded, characters embedded)."""
+    company_id = os.path.basename(path)
+    with open(path, "rb") as f:
+        file_hash = hashlib.sha256(f.read()).hexdigest()
+    record = manifest.find_one({"_id": company_id})
+    if record and record.get("file_hash") == file_hash and not force and not replace_legacy:
+        print(f"⏭️ {company_id}: unchanged")
+        return 0, 0, 0
+
+    keys = partition_keys(company_id)
+    if not keys:
+        print(f"⚠️ {company_id}: no company/quarter in the file name, skipped")
+        return 0, 0, 0
+
+    records = list(chunk_filing(path, splitter))
+    stored = set(chunks.distinct("content_hash", {"company_id": company_id}))
+    new = [(digest, sequence, text) for digest, sequence, text in records if digest not in stored]
+    new_chars = sum(len(text) for _, _, text in new)
+    print(f"📄 {company_id}: {len(records)} chunks, {len(new)} new")
+    if dry_run:
+        return len(records), len(new), new_chars
+
+    vectors = embedding_scheduler.embed(embedding_pool, [text for _, _, text in new]) if new else []
+    embedding_by_hash = {digest: vector for (digest, _, _), vector in zip(new, vectors)}
+
+    operations = []
+    for digest, sequence, text in records:
+        update = {"$set": {"chunk_id": f"{company_id}_{sequence}", "sequence": sequence, **keys}}
+        if digest in embedding_by_hash:
+            update["$setOnInsert"] = {"content": text, "embedding": embedding_by_hash[digest]}
+        operations.append(UpdateOne({"company_id": company_id, "content_hash": digest}, update, upsert=True))
+    chunks.bulk_write(operations, ordered=False)
+    # Chunks of an earlier version of the file
+    removed = chunks.delete_many({"company_id": company_id, "content_hash": {"$exists": True, "$nin": [digest for digest, _, _ in records]}}).deleted_count
+    if replace_legacy:
+        removed += chunks.delete_many({"company_id": company_id, "content_hash": {"$exists": False}}).deleted_count
+    manifest.replace_one(
+        {"_id": company_id},
+        {"file_hash": file_hash, "chunks": len(records), "ingested_at": datetime.utcnow()},
+        upsert=True
+    )
+    if removed:
+        print(f"🧹 {company_id}: removed {removed} stale chunks")
+    return len(records), len(new), new_chars
+
+
+def main():
+    directory = _arg("--dir", SAMPLE_DIR)
+    match = _arg("--match", "")
+    force = "--force" in sys.argv
+    dry_run = "--dry-run" in sys.argv
+    replace_legacy = "--replace-legacy" in sys.argv
+    partitions_only = "--partitions-only" in sys.argv
+
+    if not os.getenv("MONGO_URI"):
+        sys.exit("MONGO_URI not found in .env file")
+    embedding_pool.initialize_keys([os.getenv("GOOGLE_API_KEY1"), os.getenv("GOOGLE_API_KEY2"), os.getenv("GOOGLE_API_KEY3")])
+    if not embedding_pool.keys and not dry_run and not partitions_only:
+        sys.exit("Set GOOGLE_API_KEY1..3 to embed the filings")
+
+    db = MongoClient(os.getenv("MONGO_URI"))["Financial_Rag_DB"]
+    chunks, manifest = db["chunks_data"], db["ingested_filings"]
+    if not dry_run:
+        ensure_index(chunks)
+        backfill_partitions(chunks)
+        try:
+            ensure_vector_index(chunks)
+        except Exception as e:
+            print(f"⚠️ Vector index not updated (Atlas only): {e}")
+    if partitions_only:
+        return
+    splitter = make_text_splitter()
+
+    paths = [path for path in sorted(glob.glob(os.path.join(directory, "*.txt"))) if match in os.path.basename(path)]
+    print(f"\n=== INGESTING {len(paths)} FILINGS FROM {directory}{' (dry run)' if dry_run else ''} ===")
+    start = time.perf_counter()
+    totals = {"files": 0, "chunks": 0, "embedded": 0, "chars": 0, "failed": 0}
+    for path in paths:
+        try:
+            written, embedded, chars = ingest_file(path, chunks, manifest, splitter, force, dry_run, replace_legacy)
+        except Exception as e:
+            print(f"❌ {os.path.basename(path)}: {e}")
+            totals["failed"] += 1
+            continue
+        totals["files"] += bool(written)
+        totals["chunks"] += written
+        totals["embedded"] += embedded
+        totals["chars"] += chars
+    elapsed = time.perf_counter() - start
+
+    tokens = totals["chars"] // 4
+    print("\n=== INGESTION SUMMARY ===")
+    print(f"Files ingested: {totals['files']} / {len(paths)} ({len(paths) - totals['files'] - totals['failed']} unchanged or skipped, {totals['failed']} failed)")
+    print(f"Chunks written: {totals['chunks']} | Embedded: {totals['embedded']} | Elapsed: {elapsed:.1f}s | "
+          f"{totals['files'] / elapsed if elapsed else 0:.2f} files/s | {totals['chunks'] / elapsed if elapsed else 0:.1f} chunks/s")
+    print(f"Embedding cost: ~{tokens:,} tokens ≈ ${tokens / 1_000_000 * PRICE_PER_MILLION_TOKENS:.4f} (at ${PRICE_PER_MILLION_TOKENS}/1M tokens)")
+    sys.exit(1 if totals["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from bm25_index import BM25Index, reciprocal_rank_fusion
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length rows, so inner product is cosine similarity (as in the Atlas index)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalIndexBuilder:
+    """Writes one PDF's vectors and chunk documents to a staging directory during ingestion.
+
+    ``add`` appends each stored group to disk, so the builder holds no vectors in
+    memory. ``commit`` builds the FAISS index from the staged vectors (memory-mapped)
+    and swaps it in. ``abort`` discards the staging directory. A failing step
+    never fails ingestion: it only gives up the local index for this upload, and
+    queries for the file keep using Atlas.
+    """
+
+    def __init__(self, owner: "LocalVectorIndex", user_id: str, filename: str, ingest_id: str):
+        self.owner = owner
+        self.user_id = str(user_id)
+        self.filename = filename
+        self.ingest_id = ingest_id
+        self.final_dir = owner.index_dir(user_id, filename)
+        self.staging_dir = f"{self.final_dir}.building-{ingest_id}"
+        self.dim: Optional[int] = None
+        self.count = 0
+        self.failed = False
+        self._step(os.makedirs, self.staging_dir, exist_ok=True)
+
+    def _step(self, fn, *args, **kwargs):
+        if self.failed:
+            return
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"⚠️ Local vector index for {self.filename} abandoned, Atlas only: {e}")
+            self.abort()
+
+    def add(self, chunks: List[dict]):
+        self._step(self._append, chunks)
+
+    def commit(self):
+        self._step(self._build)
+
+    def abort(self):
+        self.failed = True
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _append(self, chunks: List[dict]):
+        vectors = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+        self.dim = self.dim or vectors.shape[1]
+        with open(os.path.join(self.staging_dir, "vectors.f32"), "ab") as f:
+            f.write(_normalize(vectors).tobytes())
+        with open(os.path.join(self.staging_dir, "docs.jsonl"), "a", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps({
+                    "user_id": chunk["user_id"],
+                    "filename": chunk["filename"],
+                    "chunk_key": chunk.get("chunk_key"),
+                    "content": chunk["content"],
+                    "metadata": chunk["metadata"]
+                }, default=str) + "\n")
+        self.count += len(chunks)
+
+    def _build(self):
+        if not self.count:
+            self.abort()
+            return
+        vectors = np.memmap(os.path.join(self.staging_dir, "vectors.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        if self.count >= self.owner.hnsw_min_vectors:
+            index = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 80
+            kind = "hnsw"
+        else:
+            index = faiss.IndexFlatIP(self.dim)
+            kind = "flat"
+        for start in range(0, self.count, 4096):
+            index.add(np.ascontiguousarray(vectors[start:start + 4096]))
+        del vectors
+        faiss.write_index(index, os.path.join(self.staging_dir, "index.faiss"))
+        os.remove(os.path.join(self.staging_dir, "vectors.f32"))  # the index file holds the vectors
+        with open(os.path.join(self.staging_dir, "manifest.json"), "w") as f:
+            json.dump({"user_id": self.user_id, "filename": self.filename, "ingest_id": self.ingest_id,
+                       "count": self.count, "dim": self.dim, "kind": kind, "built_at": time.time()}, f)
+        self.owner._install(self.staging_dir, self.final_dir)
+        print(f"📇 Local {kind} index built for {self.filename}: {self.count} vectors")
+
+
+class LocalVectorIndex:
+    """On-disk FAISS index per (user_id, filename) for uploaded-PDF retrieval.
+
+    Indexes are built at ingest time (see LocalIndexBuilder). They are opened
+    memory-mapped on first use, and up to ``max_loaded`` of them stay open in
+    LRU order. Small documents get an exact flat index; from
+    ``hnsw_min_vectors`` vectors on, an HNSW graph is used. The index directory
+    is touched on every search. Once more than ``max_indexes`` are on disk, the
+    least recently searched ones are deleted. Each loaded index also gets a BM25
+    index over the same chunks. With ``query_text``, ``search`` fuses the
+    ``hybrid_candidates`` best vector and keyword hits by reciprocal rank fusion.
+    ``search`` returns None when there
+    is no usable local index (never built, evicted, or a re-upload is in
+    progress); the caller then falls back to Atlas $vectorSearch.
+    """
+
+    def __init__(self, directory: str, max_loaded: int = 32, max_indexes: int = 500, hnsw_min_vectors: int = 5000,
+                 hybrid_candidates: int = 10):
+        self.directory = directory
+        self.hybrid_candidates = hybrid_candidates
+        self.max_loaded = max_loaded
+        self.max_indexes = max_indexes
+        self.hnsw_min_vectors = hnsw_min_vectors
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # index dir -> (manifest mtime, faiss index, docs, BM25 index over docs)
+        self._loaded: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0, "search_time_ms": 0.0}
+
+    def index_dir(self, user_id: str, filename: str) -> str:
+        digest = hashlib.sha256(f"{user_id}\x00{filename}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, digest)
+
+    def builder(self, user_id: str, filename: str, ingest_id: str) -> LocalIndexBuilder:
+        """Start staging a new index; the file's current index is dropped so stale results are never served."""
+        self.drop(user_id, filename)
+        return LocalIndexBuilder(self, user_id, filename, ingest_id)
+
+    def drop(self, user_id: str, filename: str):
+        path = self.index_dir(user_id, filename)
+        with self._lock:
+            self._loaded.pop(path, None)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _install(self, staging_dir: str, final_dir: str):
+        trash = f"{final_dir}.old-{os.getpid()}-{threading.get_ident()}"
+        with self._lock:
+            self._loaded.pop(final_dir, None)
+            if os.path.exists(final_dir):
+                os.rename(final_dir, trash)
+            os.rename(staging_dir, final_dir)
+        shutil.rmtree(trash, ignore_errors=True)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """Delete the least recently searched indexes beyond ``max_indexes``."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if "." not in name and os.path.exists(os.path.join(path, "manifest.json")):
+                entries.append((os.path.getmtime(path), path))
+        for _, path in sorted(entries)[:max(len(entries) - self.max_indexes, 0)]:
+            with self._lock:
+                self._loaded.pop(path, None)
+                self.stats["evicted"] += 1
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _load(self, path: str) -> Optional[tuple]:
+        manifest_path = os.path.join(path, "manifest.json")
+        try:
+            mtime = os.path.getmtime(manifest_path)
+        except OSError:
+            with self._lock:
+                self._loaded.pop(path, None)
+            return None
+
+        with self._lock:
+            entry = self._loaded.get(path)
+            if entry is not None and entry[0] == mtime:
+                self._loaded.move_to_end(path)
+                return entry
+
+        # Built or replaced by another process since it was loaded
+        index_path = os.path.join(path, "index.faiss")
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            index = faiss.read_index(index_path)
+        with open(os.path.join(path, "docs.jsonl"), encoding="utf-8") as f:
+            docs = [json.loads(line) for line in f]
+        keyword_index = BM25Index()
+        for position, doc in enumerate(docs):
+            keyword_index.add(position, doc["content"], {"position": position})
+        entry = (mtime, index, docs, keyword_index)
+        with self._lock:
+            self._loaded[path] = entry
+            self._loaded.move_to_end(path)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return entry
+
+    def search(self, user_id: str, filename: str, query_embedding: List[float], k: int,
+               query_text: Optional[str] = None) -> Optional[List[dict]]:
+        """Top-``k`` chunks of the file (hybrid if ``query_text`` is given), or None if there is no local index."""
+        path = self.index_dir(user_id, filename)
+        start_time = time.perf_counter()
+        try:
+            entry = self._load(path)
+        except Exception as e:
+            print(f"⚠️ Local vector index unreadable, using Atlas: {e}")
+            entry = None
+        if entry is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        _, index, docs, keyword_index = entry
+        candidates = max(k, self.hybrid_candidates) if query_text else k
+        query = _normalize(np.asarray([query_embedding], dtype=np.float32))
+        params = faiss.SearchParametersHNSW(efSearch=max(64, candidates * 4)) if isinstance(index, faiss.IndexHNSW) else None
+        scores, ids = index.search(query, min(candidates, len(docs)), params=params)
+        results = [{**docs[i], "position": int(i), "score": float(score)} for score, i in zip(scores[0], ids[0]) if i >= 0]
+        if query_text:
+            keyword_hits = [{**docs[hit["position"]], **hit} for hit, _ in keyword_index.search(query_text, candidates)]
+            results = reciprocal_rank_fusion([results, keyword_hits], key=lambda doc: doc["position"], k=k)
+
+        try:
+            os.utime(path)  # last access, for disk eviction
+        except OSError:
+            pass
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["search_time_ms"] += (time.perf_counter() - start_time) * 1000
+        return results
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.stats["hits"],
+                "misses": self.stats["misses"],
+                "evicted": self.stats["evicted"],
+                "avg_search_ms": round(self.stats["search_time_ms"] / self.stats["hits"], 3) if self.stats["hits"] else 0.0,
+                "loaded": len(self._loaded),
+                "max_loaded": self.max_loaded,
+                "max_indexes": self.max_indexes
+            }
+
+# Global instance (configured from the environment)
+local_vector_index = LocalVectorIndex(
+    directory=os.path.join(os.getenv("CACHE_DIR", "cache"), "pdf_indexes"),
+    max_loaded=int(os.getenv("PDF_INDEX_MAX_LOADED", 32)),
+    max_indexes=int(os.getenv("PDF_INDEX_MAX_INDEXES", 500)),
+    hnsw_min_vectors=int(os.getenv("PDF_INDEX_HNSW_MIN_VECTORS", 5000)),
+    hybrid_candidates=int(os.getenv("PDF_HYBRID_CANDIDATES", 10))
+)
@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+import oracledb
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class OraclePool:
+    """Process-wide Oracle session pool shared by every Oracle call site.
+
+    Opening a wallet-authenticated connection means a TLS handshake and a wallet
+    decrypt, so sessions are created once and handed out from the pool instead.
+    """
+
+    def __init__(self):
+        self._pool: Optional[oracledb.ConnectionPool] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # Pool sizing (configurable through the environment)
+        self.min_sessions = int(os.getenv("ORACLE_POOL_MIN", 1))
+        self.max_sessions = int(os.getenv("ORACLE_POOL_MAX", 8))
+        self.increment = int(os.getenv("ORACLE_POOL_INCREMENT", 1))
+        self.ping_interval = int(os.getenv("ORACLE_POOL_PING_INTERVAL", 60))  # seconds idle before a health ping
+        self.wait_timeout = int(os.getenv("ORACLE_POOL_WAIT_TIMEOUT", 10000))  # ms to wait for a free session
+
+        # Acquisition statistics
+        self.acquired_count = 0
+        self.dropped_count = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _pool_params(self) -> Dict:
+        db_password = os.getenv("DB_PASSWORD")
+        db_wallet = os.getenv("DB_WALLET_LOCATION")
+        return dict(
+            user=os.getenv("DB_USER"),
+            password=db_password,
+            dsn=os.getenv("DB_DSN"),
+            config_dir=db_wallet,
+            wallet_location=db_wallet,
+            wallet_password=db_password,
+            min=self.min_sessions,
+            max=self.max_sessions,
+            increment=self.increment,
+            ping_interval=self.ping_interval,
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+            wait_timeout=self.wait_timeout,
+            retry_count=3,
+            retry_delay=1
+        )
+
+    def _record_acquire(self, wait_time: float):
+        with self._stats_lock:
+            self.acquired_count += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def _create_pool(self) -> oracledb.ConnectionPool:
+        pool = oracledb.create_pool(**self._pool_params())
+        print(f"✅ Oracle session pool created (min={self.min_sessions}, max={self.max_sessions}, increment={self.increment})")
+        return pool
+
+    def get_pool(self) -> oracledb.ConnectionPool:
+        """Return the shared pool, creating it on first use."""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = self._create_pool()
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        """Borrow a session from the pool and give it back when the block exits.
+
+        Sessions that are no longer healthy (e.g. the network dropped mid-query)
+        are dropped from the pool instead of being handed to the next caller.
+        """
+        pool = self.get_pool()
+        start_time = time.perf_counter()
+        conn = pool.acquire()
+        self._record_acquire(time.perf_counter() - start_time)
+
+        try:
+            yield conn
+        finally:
+            if conn.is_healthy():
+                pool.release(conn)
+            else:
+                with self._stats_lock:
+                    self.dropped_count += 1
+                pool.drop(conn)
+
+    def get_stats(self) -> Dict:
+        """Get pool usage statistics"""
+        with self._stats_lock:
+            stats = {
+                "initialized": self._pool is not None,
+                "min": self.min_sessions,
+                "max": self.max_sessions,
+                "increment": self.increment,
+                "acquired": self.acquired_count,
+                "dropped": self.dropped_count,
+                "avg_wait_ms": round(self.total_wait_time / self.acquired_count * 1000, 2) if self.acquired_count else 0.0,
+                "max_wait_ms": round(self.max_wait_time * 1000, 2)
+            }
+        if self._pool is not None:
+            stats["busy"] = self._pool.busy
+            stats["open"] = self._pool.opened
+        return stats
+
+    def close(self):
+        """Close the pool and all of its sessions."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close(force=True)
+                self._pool = None
+
+
+class AsyncOraclePool(OraclePool):
+    """asyncio flavour of OraclePool for the ASGI server (python-oracledb thin mode).
+
+    Same configuration and statistics as the threaded pool, but sessions are
+    acquired, used and released with ``await`` so a request waiting on Oracle
+    does not hold a worker thread.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._async_lock = asyncio.Lock()
+
+    async def get_pool(self) -> oracledb.AsyncConnectionPool:
+        """Return the shared async pool, creating it on first use (inside the running event loop)."""
+        if self._pool is None:
+            async with self._async_lock:
+                if self._pool is None:
+                    self._pool = oracledb.create_pool_async(**self._pool_params())
+                    print(f"✅ Async Oracle session pool created (min={self.min_sessions}, max={self.max_sessions}, increment={self.increment})")
+        return self._pool
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a session: ``async with async_oracle_pool.connection() as connection:``"""
+        pool = await self.get_pool()
+        start_time = time.perf_counter()
+        conn = await pool.acquire()
+        self._record_acquire(time.perf_counter() - start_time)
+
+        try:
+            yield conn
+        finally:
+            if conn.is_healthy():
+                await pool.release(conn)
+            else:
+                with self._stats_lock:
+                    self.dropped_count += 1
+                await pool.drop(conn)
+
+    async def close(self):
+        """Close the pool and all of its sessions."""
+        async with self._async_lock:
+            if self._pool is not None:
+                await self._pool.close(force=True)
+                self._pool = None
+
+# Global instances
+oracle_pool = OraclePool()
+async_oracle_pool = AsyncOraclePool()
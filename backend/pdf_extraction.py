@@ -0,0 +1,281 @@
+import os
+import re
+import sys
+import math
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import fitz
+import pandas as pd
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Page-level PDF parsing shared by FinancialRAGSystem and the extraction worker
+# processes. This module must stay free of database and API clients: every
+# worker process imports it.
+
+# (chunk_key, content, metadata)
+ChunkRecord = Tuple[str, str, Dict]
+
+TASK_TIMEOUT_GRACE = 30  # seconds past task_timeout before a worker that ignored its alarm counts as hung
+
+
+def make_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        separators=["\n\n", "\n", r"(?<=\. )", " ", ""]
+    )
+
+
+def detect_section(text: str) -> str:
+    """Detect financial report section with logging"""
+    text = text.lower()
+    if "balance sheet" in text:
+        return "balance_sheet"
+    elif "income statement" in text:
+        return "income_statement"
+    elif "cash flow" in text:
+        return "cash_flow"
+    return "other"
+
+
+def is_financial_table(df: pd.DataFrame) -> bool:
+    """Check if table contains financial data with logging"""
+    cols = "|".join(df.columns.astype(str))
+    patterns = r"year|quarter|q\d|fy\d|usd|million|billion|revenue|income|balance|assets|liabilities"
+    is_financial = bool(re.search(patterns, cols, re.IGNORECASE))
+    if not is_financial:
+        print(f"    Table filtered out (non-financial): {df.columns.tolist()}")
+    return is_financial
+
+
+def format_table(df: pd.DataFrame) -> str:
+    """Convert table to structured string format"""
+    df = df.map(lambda x: re.sub(r"\((\d+)\)", r"-\1", str(x)))
+    return df.to_markdown(index=False, floatfmt=".2f")
+
+
+def extract_financial_tables(page, page_num: int, pdf_path: str, section: Optional[str] = None) -> List[Document]:
+    """Extract and format tables from PDF page with logging"""
+    print(f"  Processing page {page_num+1} for tables...")
+    table_docs = []
+    tables = page.find_tables()
+
+    if tables.tables:
+        print(f"  Found {len(tables.tables)} tables on page {page_num+1}")
+        for i, table in enumerate(tables.tables):
+            try:
+                df = table.to_pandas()
+                if not df.empty and is_financial_table(df):
+                    table_str = format_table(df)
+                    table_docs.append(Document(
+                        page_content=f"TABLE {i+1} FROM PAGE {page_num+1}:\n{table_str}",
+                        metadata={
+                            "source": pdf_path,
+                            "page": page_num + 1,
+                            "table_id": i + 1,
+                            "type": "financial_table",
+                            "section": section or detect_section(page.get_text("text"))
+                        }
+                    ))
+                    print(f"    Added table {i+1} (shape: {df.shape})")
+            except Exception as e:
+                print(f"    ❌ Error processing table {i+1}: {e}")
+    else:
+        print(f"  No tables found on page {page_num+1}")
+    return table_docs
+
+
+def page_records(page, page_num: int, pdf_path: str, text_splitter) -> List[ChunkRecord]:
+    """Text and financial-table chunks of one page as (chunk_key, content, metadata)"""
+    text = page.get_text("text")
+    section = detect_section(text)
+
+    # 1. Process text chunks
+    records = [
+        (f"{page_num + 1}:text:{i}", chunk, {"page": page_num + 1, "section": section, "type": "text", "chunk_id": i})
+        for i, chunk in enumerate(text_splitter.split_text(text))
+    ]
+
+    # 2. Process financial tables
+    for table_doc in extract_financial_tables(page, page_num, pdf_path, section):
+        records.append((f"{page_num + 1}:table:{table_doc.metadata['table_id']}", table_doc.page_content, table_doc.metadata))
+    return records
+
+
+_worker_splitter = None
+
+def _on_task_timeout(signum, frame):
+    raise TimeoutError("page range exceeded its time limit")
+
+
+def _init_worker():
+    """Give a forked worker stdout/stderr objects of its own. A server thread
+    printing at fork time leaves the inherited streams' locks held for good, and
+    the worker's first page log would block on them. Also installs the handler
+    that turns a task's SIGALRM into a TimeoutError."""
+    sys.stdout = os.fdopen(os.dup(1), "w", buffering=1)
+    sys.stderr = os.fdopen(os.dup(2), "w", buffering=1)
+    signal.signal(signal.SIGALRM, _on_task_timeout)
+
+
+def _extract_range(pdf_path: str, start: int, stop: int, timeout: float = 0) -> List[List[ChunkRecord]]:
+    """Worker task: open the file independently and parse pages [start, stop), giving up after ``timeout`` seconds"""
+    global _worker_splitter
+    if _worker_splitter is None:
+        _worker_splitter = make_text_splitter()
+    signal.alarm(math.ceil(timeout))
+    try:
+        with fitz.open(pdf_path) as doc:
+            return [page_records(doc.load_page(page_num), page_num, pdf_path, _worker_splitter) for page_num in range(start, stop)]
+    finally:
+        signal.alarm(0)
+
+
+class PageExtractor:
+    """Parses a PDF's pages in a pool of worker processes.
+
+    ``find_tables`` and the pandas table formatting are CPU-bound, so pages are
+    sharded into ranges of ``pages_per_task`` pages across ``max_workers``
+    processes. Each worker opens the file itself and returns only chunk records.
+    Results are yielded in page order, and at most two ranges per worker are
+    in flight, so a long document is never held in memory at once.
+
+    Workers are forked, so they do not re-run the server's start-up code (which a
+    spawned or forkserver worker would do under ``python app.py``). ``start``
+    forks them all up front; the server calls it before any of its threads exist.
+    The pool is shared by every PDF job thread and is never torn down: a range
+    that runs longer than ``task_timeout`` seconds raises TimeoutError inside its
+    worker (SIGALRM), which fails only that document. Its retries run in a
+    separate single-worker isolation pool, also forked by ``start``, so a
+    pathological file can't tie up the shared workers again. A worker that
+    doesn't even answer the alarm (stuck in C code) is killed only if it is the
+    isolation worker; that pool is then forked again on demand. Where fork is not
+    available, or with ``max_workers`` <= 1, pages are parsed in the calling process.
+    """
+
+    def __init__(self, max_workers: int, pages_per_task: int = 8, task_timeout: float = 300):
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.task_timeout = task_timeout
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._isolation_executor: Optional[ProcessPoolExecutor] = None
+        self._isolation_pid: Optional[int] = None
+        self._isolated_paths = set()  # documents that timed out once
+
+    @property
+    def parallel(self) -> bool:
+        return self.max_workers > 1 and "fork" in multiprocessing.get_all_start_methods()
+
+    @staticmethod
+    def _fork_pool(max_workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("fork"), initializer=_init_worker)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._fork_pool(self.max_workers)
+                self._executor.submit(os.getpid).result()  # a fork pool starts all its workers on the first task
+            return self._executor
+
+    def _get_isolation_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._isolation_executor is None:
+                self._isolation_executor = self._fork_pool(1)
+                self._isolation_pid = self._isolation_executor.submit(os.getpid).result()
+            return self._isolation_executor
+
+    def start(self):
+        """Fork the shared and isolation worker processes now, before the server starts any threads."""
+        if self.parallel:
+            self._get_executor()
+            self._get_isolation_executor()
+            print(f"🧵 PDF extraction pool: {self.max_workers} worker processes (+1 for documents that timed out)")
+
+    def _result(self, pdf_path: str, first_page: int, future, isolated: bool) -> List[List[ChunkRecord]]:
+        try:
+            return future.result(timeout=self.task_timeout + TASK_TIMEOUT_GRACE)
+        except (TimeoutError, FuturesTimeoutError):
+            # Either the worker's alarm fired (it is free again) or the worker ignores it
+            hung = not future.done()
+            with self._lock:
+                self._isolated_paths.add(pdf_path)
+            if hung and isolated:
+                print(f"⚠️ PDF extraction hung on {os.path.basename(pdf_path)} page {first_page + 1}; killing the isolation worker")
+                self._kill_isolation_worker()
+            elif hung:
+                print(f"⚠️ PDF extraction hung on {os.path.basename(pdf_path)} page {first_page + 1}; "
+                      f"one shared worker stays busy until it returns")
+            else:
+                print(f"⚠️ PDF extraction timed out on {os.path.basename(pdf_path)} page {first_page + 1}; retries use the isolation worker")
+            raise TimeoutError(f"Pages from {first_page + 1} not parsed within {self.task_timeout:.0f}s")
+
+    def iter_pages(self, pdf_path: str) -> Iterator[Tuple[int, int, List[ChunkRecord]]]:
+        """Yield (page count, page number, chunk records) for every page, in page order."""
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+
+        if not self.parallel:
+            text_splitter = make_text_splitter()
+            with fitz.open(pdf_path) as doc:
+                for page_num in range(page_count):
+                    yield page_count, page_num, page_records(doc.load_page(page_num), page_num, pdf_path, text_splitter)
+            return
+
+        with self._lock:
+            isolated = pdf_path in self._isolated_paths
+        executor = self._get_isolation_executor() if isolated else self._get_executor()
+        in_flight = 2 if isolated else self.max_workers * 2
+        ranges = [(start, min(start + self.pages_per_task, page_count)) for start in range(0, page_count, self.pages_per_task)]
+        pending = []
+        try:
+            for start, stop in ranges:
+                pending.append((start, executor.submit(_extract_range, pdf_path, start, stop, self.task_timeout)))
+                if len(pending) < in_flight:
+                    continue
+                first_page, future = pending.pop(0)
+                for offset, records in enumerate(self._result(pdf_path, first_page, future, isolated)):
+                    yield page_count, first_page + offset, records
+            while pending:
+                first_page, future = pending.pop(0)
+                for offset, records in enumerate(self._result(pdf_path, first_page, future, isolated)):
+                    yield page_count, first_page + offset, records
+        finally:
+            for _, future in pending:
+                future.cancel()
+        with self._lock:
+            self._isolated_paths.discard(pdf_path)
+
+    def close(self):
+        with self._lock:
+            executors = [self._executor, self._isolation_executor]
+            self._executor = self._isolation_executor = self._isolation_pid = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def _kill_isolation_worker(self):
+        """Terminate the isolation worker (a hung one can't be interrupted) and drop its pool; the next isolated document forks a new one."""
+        with self._lock:
+            executor, pid = self._isolation_executor, self._isolation_pid
+            self._isolation_executor = self._isolation_pid = None
+        if executor is None:
+            return
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# Global instance (configured from the environment)
+pdf_extractor = PageExtractor(
+    max_workers=int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1)),
+    pages_per_task=int(os.getenv("PDF_EXTRACT_PAGES_PER_TASK", 8)),
+    task_timeout=float(os.getenv("PDF_EXTRACT_TASK_TIMEOUT", 300))
+)
@@ -0,0 +1,271 @@
+import os
+import time
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, exists, func, or_, select, update
+from sqlalchemy.orm import aliased
+
+ACTIVE_STATUSES = ("queued", "processing")
+
+
+class JobCancelled(Exception):
+    """Raised from a job's progress callback once cancellation was requested."""
+
+
+class PdfJobQueue:
+    """Durable queue of PDF processing jobs, stored in the jobs table.
+
+    /upload_pdf only inserts a row. Each server process runs ``workers`` threads
+    that claim the highest-priority due job with UPDATE ... FOR UPDATE SKIP LOCKED,
+    so any number of processes can share the table and a job runs once. A running
+    job records its stage and progress in its row and refreshes ``heartbeat_at``.
+    A job whose worker died stops heartbeating and is claimed again after
+    ``stale_after`` seconds. Failed runs are retried with a growing delay until
+    ``max_attempts``. Cancelling a queued job takes effect at once; a running job
+    stops at its next progress report. A file's jobs never run at the same time:
+    a job is only claimed while no other job of the same file is processing, and
+    each upload has its own ``file_path``, which is deleted once its job is
+    done, cancelled or out of attempts.
+
+    ``handler(job, progress)`` does the work and returns True on success; ``job``
+    is a dict of the row and ``progress(stage, **details)`` reports progress.
+    """
+
+    def __init__(self, app, db, job_model, handler: Callable[[Dict, Callable], bool]):
+        self.app = app
+        self.db = db
+        self.job_model = job_model
+        self.handler = handler
+
+        self.workers = int(os.getenv("PDF_JOB_WORKERS", 2))
+        self.max_attempts = int(os.getenv("PDF_JOB_MAX_ATTEMPTS", 3))
+        self.retry_delay = float(os.getenv("PDF_JOB_RETRY_DELAY", 30))
+        self.poll_interval = float(os.getenv("PDF_JOB_POLL_INTERVAL", 2))
+        self.stale_after = float(os.getenv("PDF_JOB_STALE_AFTER", 600))
+
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.stats = {"claimed": 0, "done": 0, "failed": 0, "retried": 0, "cancelled": 0}
+
+    #----- Producer side (request handlers, need an app context) -----
+
+    def enqueue(self, user_id: str, filename: str, file_path: str, priority: int = 0) -> int:
+        """Queue a job for an uploaded file; unfinished jobs for the same file are cancelled."""
+        self.cancel(user_id, filename)
+        Job = self.job_model
+        job = Job(user_id=user_id, filename=filename, file_path=file_path, priority=priority,
+                  status="queued", stage="queued", max_attempts=self.max_attempts)
+        self.db.session.add(job)
+        self.db.session.commit()
+        self._wakeup.set()
+        return job.id
+
+    def cancel(self, user_id: str, filename: str) -> int:
+        """Cancel the file's queued jobs and ask its running job to stop; returns the number of jobs affected."""
+        Job = self.job_model
+        same_file = and_(Job.user_id == user_id, Job.filename == filename)
+        now = datetime.utcnow()
+        cancelled_paths = self.db.session.execute(
+            update(Job).where(same_file, Job.status == "queued")
+            .values(status="cancelled", stage="cancelled", finished_at=now, updated_at=now)
+            .returning(Job.file_path)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        queued = len(cancelled_paths)
+        running = self.db.session.execute(
+            update(Job).where(same_file, Job.status == "processing", Job.cancel_requested.is_(False))
+            .values(cancel_requested=True, updated_at=now)
+        ).rowcount
+        self.db.session.commit()
+        for path in cancelled_paths:
+            self._discard_upload(path)
+        return queued + running
+
+    def get_status(self, user_id: str, filename: str) -> Optional[Dict]:
+        """The file's most recent job as a dict, or None."""
+        Job = self.job_model
+        job = self.db.session.execute(
+            select(Job).where(Job.user_id == user_id, Job.filename == filename).order_by(Job.id.desc()).limit(1)
+        ).scalar_one_or_none()
+        return self._as_dict(job) if job else None
+
+    #----- Worker side -----
+
+    @staticmethod
+    def _as_dict(job) -> Dict:
+        return {column.name: getattr(job, column.name) for column in job.__table__.columns}
+
+    @staticmethod
+    def _discard_upload(path: Optional[str]):
+        """Delete an upload's file and its per-upload folder."""
+        if not path:
+            return
+        for remove, target in ((os.remove, path), (os.rmdir, os.path.dirname(path))):
+            try:
+                remove(target)
+            except OSError:
+                pass  # already gone, or a folder that still holds other uploads
+
+    def _claim(self) -> Optional[Dict]:
+        Job = self.job_model
+        Running = aliased(Job)
+        now = datetime.utcnow()
+        stale_cutoff = now - timedelta(seconds=self.stale_after)
+        # Another job of the same file is still running (and heartbeating)
+        file_busy = exists().where(
+            Running.user_id == Job.user_id, Running.filename == Job.filename, Running.id != Job.id,
+            Running.status == "processing", Running.heartbeat_at >= stale_cutoff
+        )
+        candidate = (
+            select(Job.id)
+            .where(or_(
+                and_(Job.status == "queued", Job.run_after <= now),
+                and_(Job.status == "processing", Job.heartbeat_at < stale_cutoff, Job.attempts < Job.max_attempts,
+                     Job.cancel_requested.is_(False)),
+            ), ~file_busy)
+            .order_by(Job.priority.desc(), Job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = self.db.session.execute(
+            update(Job).where(Job.id == candidate.scalar_subquery())
+            .values(status="processing", stage="started", attempts=Job.attempts + 1, worker=self.worker_id,
+                    started_at=now, heartbeat_at=now, updated_at=now, error=None)
+            .returning(Job)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        claimed = self._as_dict(job) if job else None
+        self.db.session.commit()
+        return claimed
+
+    def _fail_lost_jobs(self):
+        """Jobs whose worker died on their last attempt (or after being cancelled) would otherwise stay 'processing' forever."""
+        Job = self.job_model
+        now = datetime.utcnow()
+        lost = and_(Job.status == "processing", Job.heartbeat_at < now - timedelta(seconds=self.stale_after))
+        paths = self.db.session.execute(
+            update(Job).where(lost, Job.cancel_requested.is_(True))
+            .values(status="cancelled", stage="cancelled", finished_at=now, updated_at=now)
+            .returning(Job.file_path)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        paths += self.db.session.execute(
+            update(Job).where(lost, Job.attempts >= Job.max_attempts)
+            .values(status="failed", stage="failed", error="Worker stopped responding", finished_at=now, updated_at=now)
+            .returning(Job.file_path)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        self.db.session.commit()
+        for path in paths:
+            self._discard_upload(path)
+
+    def _touch(self, job_id: int, **values) -> bool:
+        """Refresh the heartbeat (plus any given columns); returns whether cancellation was requested."""
+        Job = self.job_model
+        now = datetime.utcnow()
+        cancel_requested = self.db.session.execute(
+            update(Job).where(Job.id == job_id, Job.worker == self.worker_id)
+            .values(heartbeat_at=now, updated_at=now, **values)
+            .returning(Job.cancel_requested)
+        ).scalar()
+        self.db.session.commit()
+        return bool(cancel_requested)
+
+    def _finish(self, job: Dict, succeeded: bool, error: Optional[str]):
+        Job = self.job_model
+        now = datetime.utcnow()
+        cancelled = self._touch(job["id"])
+        if succeeded:
+            values, outcome = {"status": "done", "stage": "done", "finished_at": now}, "done"
+        elif cancelled:
+            values, outcome = {"status": "cancelled", "stage": "cancelled", "finished_at": now}, "cancelled"
+        elif job["attempts"] < job["max_attempts"]:
+            delay = self.retry_delay * job["attempts"]
+            values, outcome = {"status": "queued", "stage": "retry_scheduled", "run_after": now + timedelta(seconds=delay)}, "retried"
+        else:
+            values, outcome = {"status": "failed", "stage": "failed", "finished_at": now}, "failed"
+        self.db.session.execute(
+            update(Job).where(Job.id == job["id"], Job.worker == self.worker_id)
+            .values(error=error, updated_at=now, **values)
+        )
+        self.db.session.commit()
+        if outcome != "retried":
+            self._discard_upload(job["file_path"])
+        with self._lock:
+            self.stats[outcome] += 1
+        print(f"📄 PDF job {job['id']} ({job['filename']}) {outcome} after attempt {job['attempts']}")
+
+    def _run(self, job: Dict):
+        stop_heartbeat = threading.Event()
+
+        def heartbeat():
+            # Keeps the claim alive through long stages that report no progress
+            while not stop_heartbeat.wait(self.stale_after / 3):
+                with self.app.app_context():
+                    self._touch(job["id"])
+
+        def progress(stage, **details):
+            with self.app.app_context():
+                if self._touch(job["id"], stage=stage, progress=details):
+                    raise JobCancelled(f"PDF job {job['id']} cancelled")
+
+        heartbeat_thread = threading.Thread(target=heartbeat, name=f"pdf-job-{job['id']}-heartbeat", daemon=True)
+        heartbeat_thread.start()
+        error = None
+        try:
+            succeeded = bool(self.handler(job, progress))
+            if not succeeded:
+                error = "Processing failed"
+        except Exception as e:
+            succeeded, error = False, str(e)
+        finally:
+            stop_heartbeat.set()
+        self._finish(job, succeeded, error)
+
+    def _worker_loop(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    job = self._claim()
+                    if job is None:
+                        self._fail_lost_jobs()
+                if job is None:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                with self._lock:
+                    self.stats["claimed"] += 1
+                print(f"⚙️ PDF job {job['id']} claimed: user={job['user_id']} file={job['filename']} attempt={job['attempts']}")
+                with self.app.app_context():
+                    self._run(job)
+            except Exception as e:
+                print(f"⚠️ PDF job worker error: {e}")
+                time.sleep(self.poll_interval)
+
+    def start_workers(self):
+        """Start the worker threads of this process (PDF_JOB_WORKERS, 0 = enqueue only)."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"pdf-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def get_stats(self) -> Dict:
+        Job = self.job_model
+        counts = dict(self.db.session.execute(
+            select(Job.status, func.count()).where(Job.status.in_(ACTIVE_STATUSES)).group_by(Job.status)
+        ).all())
+        with self._lock:
+            return {
+                **self.stats,
+                "queued": counts.get("queued", 0),
+                "processing": counts.get("processing", 0),
+                "workers": self.workers,
+                "worker_id": self.worker_id
+            }
@@ -9,6 +9,8 @@ import httpx
 from datetime import datetime
 from groq import Groq
 import itertools
+from groq_wrapper import GroqWrapper
+from oracle_pool import oracle_pool, async_oracle_pool
 
 
 def load_excel_data(file_path):
@@ -37,9 +39,8 @@ def save_progress(df, model_name, mode="w"):
     df.to_csv(output_file, mode=mode, index=False, header=header)
     logging.info("Progress saved to %s", output_file)
 
-def query_llm(user_question, ddl_content, model_name, api_key_sql, max_retries=5, chat_history=None):
-    """Queries the LLM API with retry logic."""
-    logging.debug("Querying LLM API using model: %s", model_name)
+def build_sql_prompt(user_question, ddl_content, chat_history=None):
+    """Text-to-SQL prompt with the few-shot examples, recent conversation and the company DDL."""
     # Format last 5 messages if provided
     history_context = ""
     if chat_history:
@@ -108,6 +109,12 @@ query = "{user_question}"
 \n\n
 
 """
+    return prompt
+
+def query_llm(user_question, ddl_content, model_name, api_key_sql, max_retries=5, chat_history=None):
+    """Queries the LLM API with retry logic."""
+    logging.debug("Querying LLM API using model: %s", model_name)
+    prompt = build_sql_prompt(user_question, ddl_content, chat_history)
     retries = 0
     while retries < max_retries:
         try:
@@ -137,25 +144,47 @@ query = "{user_question}"
     logging.error("Max retries reached. Skipping query.")
     return None, 0
 
-def execute_sql(query, db_config):
-    """Executes the SQL query and handles errors."""
+def execute_sql(query):
+    """Executes the SQL query on a pooled Oracle session and handles errors."""
+    try:
+        with oracle_pool.connection() as conn:
+            with conn.cursor() as cursor:
+                start_time = time.time()
+                cursor.execute(query.rstrip(";"))
+                results = cursor.fetchall()
+                columns = [desc for desc in cursor.description]
+                execution_time = round(time.time() - start_time, 4)
+        return results, columns, execution_time, ""
+    except oracledb.DatabaseError as e:
+        logging.error("Database error: %s", e)
+        return None, None, None, str(e)
+
+async def query_llm_async(user_question, ddl_content, model_name, chat_history=None):
+    """Async text-to-SQL call; key rotation and non-blocking backoff come from GroqWrapper."""
+    logging.debug("Querying LLM API (async) using model: %s", model_name)
+    response, error = await GroqWrapper.make_sql_request_async(
+        model=model_name,
+        messages=[{"role": "user", "content": build_sql_prompt(user_question, ddl_content, chat_history)}],
+        temperature=0.3,
+        max_completion_tokens=512,
+        top_p=1,
+        stream=False,
+    )
+    if error:
+        logging.error("LLM API error: %s", error)
+        return None
+    return response.choices[0].message.content.strip()
+
+async def execute_sql_async(query):
+    """Async counterpart of execute_sql on the asyncio Oracle pool."""
     try:
-        conn = oracledb.connect(
-            user=db_config["user"],
-            password=db_config["password"],
-            dsn=db_config["dsn"],
-            config_dir=db_config["wallet_location"],
-            wallet_location=db_config["wallet_location"],
-            wallet_password=db_config["password"]
-        )
-        cursor = conn.cursor()
-        start_time = time.time()
-        cursor.execute(query.rstrip(";"))
-        results = cursor.fetchall()
-        columns = [desc for desc in cursor.description]
-        execution_time = round(time.time() - start_time, 4)
-        cursor.close()
-        conn.close()
+        async with async_oracle_pool.connection() as conn:
+            with conn.cursor() as cursor:
+                start_time = time.time()
+                await cursor.execute(query.rstrip(";"))
+                results = await cursor.fetchall()
+                columns = [desc for desc in cursor.description]
+                execution_time = round(time.time() - start_time, 4)
         return results, columns, execution_time, ""
     except oracledb.DatabaseError as e:
         logging.error("Database error: %s", e)
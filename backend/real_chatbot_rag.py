@@ -1,14 +1,20 @@
 import os
 import re
 import time
+import asyncio
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, AsyncMongoClient
 from bs4 import BeautifulSoup
 from langchain_mongodb import MongoDBAtlasVectorSearch
 from langchain_groq import ChatGroq
 from groq import Groq
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from stock_data import fetch_stock_price_llm
+from groq_wrapper import GroqWrapper
+from embedding_pool import embedding_pool
+from embedding_cache import CachedQueryEmbeddings
+from bm25_index import filing_chunks_bm25, reciprocal_rank_fusion
+from chunk_partitions import chunk_partitions
+from context_packer import context_packer
 
 
 
@@ -30,51 +36,41 @@ GOOGLE_API_KEYS = [
     os.getenv("GOOGLE_API_KEY2"),
     os.getenv("GOOGLE_API_KEY3"),
 ]
+embedding_pool.initialize_keys(GOOGLE_API_KEYS)
+# Question embeddings are served from the (model, normalized text) embedding cache when possible
+query_embeddings = CachedQueryEmbeddings(embedding_pool, embedding_pool.model)
 
-# Company name mapping
-COMPANY_MAPPING = {
-    "AMAZON": "Amazon",
-    "AMD": "AMD",
-    "ATT": "AT&T",
-    "GOOGLE": "Google",
-    "JPMORGAN": "JP Morgan",
-    "MASTERCARD": "Mastercard",
-    "MCDONALDS": "McDonald",
-    "META": "Meta",
-    "PEPSICO": "Pepsico",
-    "S&P GLOBAL": "S&P Global",
-    "TESLA": "Tesla",
-    "NETFLIX": "Netflix",
-    "COCACOLA": "CocaCola"
-}
+# Hybrid retrieval: vector and BM25 candidates per query, fused with reciprocal rank fusion
+RAG_VECTOR_CANDIDATES = int(os.getenv("RAG_VECTOR_CANDIDATES", 10))
+RAG_BM25_CANDIDATES = int(os.getenv("RAG_BM25_CANDIDATES", 10))
 
 # Globals
 _initialized = False
 _collection = None
 _vector_store = None
-
-def get_rotated_embedding():
-    for i, current_key in enumerate(GOOGLE_API_KEYS):
-        if not current_key:
-            continue
-        try:
-            os.environ["GOOGLE_API_KEY"] = current_key
-            return GoogleGenerativeAIEmbeddings(
-                model="models/embedding-001",
-                google_api_key=current_key
-            )
-        except Exception as e:
-            print(f"❌ Error initializing embedding with key #{i + 1}: {e}")
-    return None
-
-def create_company_filter(selected_company):
-    if not selected_company or selected_company.lower() == "all":
-        return None
-    mapped_prefix = COMPANY_MAPPING.get(selected_company.upper())
-    if not mapped_prefix:
-        print(f"⚠️ No mapping found for: {selected_company}")
-        return None
-    return {"company_id": {"$regex": f"^{re.escape(mapped_prefix)}", "$options": "i"}}
+_async_collection = None
+
+def embed_query(text):
+    """Embed a single query string (embedding cache, then the shared key-rotating pool)."""
+    return query_embeddings.embed_query(text)
+
+async def embed_query_async(text):
+    """Async variant of embed_query for the ASGI server."""
+    return await query_embeddings.aembed_query(text)
+
+def fuse_with_keyword_hits(query, vector_docs, partition, k):
+    """Fuse vector hits ({_id, content, company_id, chunk_id, sequence} dicts) with BM25 hits from the same partition, top ``k`` in document order."""
+    predicate = (lambda doc: chunk_partitions.matches(doc, partition)) if partition else None
+    keyword_docs = filing_chunks_bm25.search(query, RAG_BM25_CANDIDATES, predicate)
+    print(f"🔤 BM25 hits: {len(keyword_docs)}")
+
+    # Fused on _id (a str in langchain metadata, an ObjectId from the driver and BM25): chunk_id changes on re-ingestion
+    fused = reciprocal_rank_fusion([vector_docs, keyword_docs], key=lambda doc: str(doc.get("_id")), k=k)
+    fused.sort(key=lambda doc: (doc.get("company_id") or "", doc.get("sequence") or 0))
+    return [
+        {"text": doc.get("content", ""), "source": f"{doc.get('company_id')} | Chunk: {doc.get('chunk_id')}", "score": doc["rrf_score"]}
+        for doc in fused
+    ]
 
 def initialize_components():
     global _initialized, _collection, _vector_store
@@ -84,6 +80,16 @@ def initialize_components():
         _collection = connect_to_mongo()
         if _collection is None:
             return False
+        # Built once; key rotation happens inside embedding_pool on every call
+        _vector_store = MongoDBAtlasVectorSearch(
+            collection=_collection,
+            embedding=query_embeddings,
+            index_name="vector_index",
+            embedding_key="embedding",
+            text_key="content"
+        )
+        filing_chunks_bm25.start(_collection, manifest=_collection.database["ingested_filings"])
+        chunk_partitions.start(_collection)
         _initialized = True
         print("✅ All components initialized successfully")
         return True
@@ -113,6 +119,15 @@ def connect_to_mongo():
         print(f"❌ MongoDB connection failed: {e}")
         return None
 
+def get_async_collection():
+    """chunks_data through pymongo's asyncio client (created on first use, inside the event loop)."""
+    global _async_collection
+    if _async_collection is None:
+        if not MONGO_URI:
+            raise ValueError("MONGO_URI not found in .env file")
+        _async_collection = AsyncMongoClient(MONGO_URI)["Financial_Rag_DB"]["chunks_data"]
+    return _async_collection
+
 def financial_preprocessor(text):
     text = BeautifulSoup(text, "html.parser").get_text()
     return URL_PATTERN.sub('', text).strip()
@@ -121,55 +136,96 @@ def retrieve_documents(query, selected_company=None, k=5):
     if not _initialized:
         raise RuntimeError("Components not initialized")
 
-    embeddings = get_rotated_embedding()
-    if not embeddings:
-        return []
-
     try:
-        vector_store = MongoDBAtlasVectorSearch(
-            collection=_collection,
-            embedding=embeddings,
-            index_name="vector_index",
-            embedding_key="embedding",
-            text_key="content"
-        )
-
         print(f"🔎 Searching MongoDB → DB: Financial_Rag_DB | Collection: chunks_data")
 
-        filter_query = create_company_filter(selected_company)
-        print(f"🔍 Using filter: {filter_query}")
-
-        if filter_query:
-            matches = list(_collection.find(filter_query, {"company_id": 1}).limit(10))
-            print("🧪 Matched company_ids:")
-            for doc in matches:
-                print(" -", doc.get("company_id"))
+        # Equality pre-filter: the ANN search only walks the company/quarter/year partition
+        partition = chunk_partitions.resolve(selected_company, query)
+        pre_filter = chunk_partitions.vector_filter(partition)
+        print(f"🔍 Partition: {partition or 'all filings'} | Filter: {pre_filter}")
 
-        if filter_query:
-            retrieved_docs = vector_store.similarity_search(
-                query, k=15, search_kwargs={"filter": filter_query})
-        else:
-            retrieved_docs = vector_store.similarity_search(query, k=15)
+        retrieved_docs = _vector_store.similarity_search(query, k=RAG_VECTOR_CANDIDATES, pre_filter=pre_filter)
 
         print(f"✅ Retrieved {len(retrieved_docs)} documents")
         for doc in retrieved_docs:
             print(" -", doc.metadata.get("company_id"), "| Chunk:", doc.metadata.get("chunk_id"))
 
-        retrieved_docs.sort(key=lambda d: d.metadata.get("sequence", 0))
-
-        return [
-            {"text": doc.page_content, "source": f"{doc.metadata.get('company_id')} | Chunk: {doc.metadata.get('chunk_id')}"}
-            for doc in retrieved_docs[:k]
-        ]
+        vector_docs = [{**doc.metadata, "content": doc.page_content} for doc in retrieved_docs]
+        return fuse_with_keyword_hits(query, vector_docs, partition, k)
 
     except Exception as e:
         print(f"❌ Retrieval Error: {str(e)}")
         return []
 
-def estimate_tokens(text):
-    return len(text) // 4
+async def retrieve_documents_async(query, selected_company=None, k=5):
+    """Async counterpart of retrieve_documents (non-blocking embedding call and Mongo driver)."""
+    if not _initialized:
+        raise RuntimeError("Components not initialized")
+
+    try:
+        query_embedding = await embed_query_async(query)
+        partition = chunk_partitions.resolve(selected_company, query)
+        vector_search = {
+            "index": "vector_index",
+            "path": "embedding",
+            "queryVector": query_embedding,
+            "numCandidates": RAG_VECTOR_CANDIDATES * 10,
+            "limit": RAG_VECTOR_CANDIDATES
+        }
+        pre_filter = chunk_partitions.vector_filter(partition)
+        if pre_filter:
+            vector_search["filter"] = pre_filter
+
+        # Same stages MongoDBAtlasVectorSearch.similarity_search(query, k=RAG_VECTOR_CANDIDATES, pre_filter=...) runs in retrieve_documents
+        cursor = await get_async_collection().aggregate([
+            {"$vectorSearch": vector_search},
+            {"$set": {"score": {"$meta": "vectorSearchScore"}}},
+            {"$project": {"embedding": 0}}
+        ])
+        retrieved_docs = await cursor.to_list()
+        print(f"✅ Retrieved {len(retrieved_docs)} documents (async)")
+
+        # BM25 scoring is in-process (no extra round trip) but CPU-bound, so it stays off the event loop
+        return await asyncio.to_thread(fuse_with_keyword_hits, query, retrieved_docs, partition, k)
 
-def query_llm_groq(final_query, selected_company=None, chat_history=None, numerical_response=None):
+    except Exception as e:
+        print(f"❌ Retrieval Error: {str(e)}")
+        return []
+
+def build_rag_messages(final_query, relevant_docs, chat_history=None, numerical_response=None):
+    """Chat messages for the contextual answer, packed into the prompt token budget (history is shrunk first)."""
+    system_message = {
+        "role": "system",
+        "content": (
+            "You are a financial AI assistant that answers using:\n"
+            "1. Numerical data (from SQL)\n"
+            "2. Supporting document context (from RAG)\n\n"
+            "Prioritize the SQL result if it directly answers the question. Use documents for support or elaboration."
+        )
+    }
+    sql_context = f"SQL result: {numerical_response}\n\n" if numerical_response else ""
+    question = f"\n\nMy question: {final_query}"
+
+    # The system prompt, SQL result and question are always sent; documents get the rest, then history
+    remaining = context_packer.budget - sum(context_packer.count_tokens(text) for text in (system_message["content"], sql_context, question)) - 16
+    documents, document_tokens = context_packer.pack_documents(relevant_docs or [], remaining, render=lambda doc, text: text)
+    retrieved_text = "\n\n".join(documents)
+
+    history = [
+        {"role": "assistant" if msg['sender'] == 'bot' else "user", "content": msg['message']}
+        for msg in (chat_history or [])[-5:]
+    ]
+    history_messages = context_packer.fit_history(history, remaining - document_tokens)
+
+    messages = [system_message] + history_messages + [{
+        "role": "user",
+        "content": f"{sql_context}Context from documents:\n{retrieved_text}{question}"
+    }]
+    print(f"Prompt tokens: {context_packer.record(messages)} ({len(documents)}/{len(relevant_docs or [])} chunks, {len(history_messages)}/{len(history)} history messages)")
+    return messages
+
+def query_llm_groq(final_query, selected_company=None, chat_history=None, numerical_response=None, progress=None):
+    """Answer a contextual question from retrieved chunks; ``progress(stage, **details)`` is told when retrieval finishes."""
     if not _initialized:
         raise RuntimeError("Components not initialized")
 
@@ -184,41 +240,9 @@ def query_llm_groq(final_query, selected_company=None, chat_history=None, numeri
     # 📊 Oracle-based numerical responses for non-stock queries stay intact
     try:
         relevant_docs = retrieve_documents(final_query, selected_company)
-        retrieved_text = "\n\n".join([doc["text"] + "..." for doc in relevant_docs]) if relevant_docs else ""
-
-        sql_context = f"SQL result: {numerical_response}\n\n" if numerical_response else ""
-        full_context = sql_context + "Context from documents:\n" + retrieved_text
-
-        history_messages = []
-        if chat_history:
-            for msg in chat_history[-5:]:
-                role = "assistant" if msg['sender'] == 'bot' else "user"
-                history_messages.append({"role": role, "content": msg['message']})
-
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a financial AI assistant that answers using:\n"
-                    "1. Numerical data (from SQL)\n"
-                    "2. Supporting document context (from RAG)\n\n"
-                    "Prioritize the SQL result if it directly answers the question. Use documents for support or elaboration."
-                )
-            }
-        ] + history_messages + [{
-            "role": "user",
-            "content": f"{full_context}\n\nMy question: {final_query}"
-        }]
-
-        total_text = "\n".join([m["content"] for m in messages])
-        token_limit = 5800
-        if estimate_tokens(total_text) > token_limit:
-            excess = estimate_tokens(total_text) - token_limit
-            retrieved_text = retrieved_text[: max(len(retrieved_text) - excess * 4, 50)] + "..."
-            full_context = sql_context + "Context from documents:\n" + retrieved_text
-            messages[-1]["content"] = f"{full_context}\n\nMy question: {final_query}"
-
-        print(f"Estimated tokens: {estimate_tokens(total_text)}")
+        if progress:
+            progress("documents_retrieved", count=len(relevant_docs))
+        messages = build_rag_messages(final_query, relevant_docs, chat_history, numerical_response)
 
         client = Groq(api_key=GROQ_API_KEY)
         response = client.chat.completions.create(
@@ -234,6 +258,36 @@ def query_llm_groq(final_query, selected_company=None, chat_history=None, numeri
     except Exception as e:
         return f"❌ Groq API Error: {str(e)}", []
 
+async def query_llm_groq_async(final_query, selected_company=None, chat_history=None, numerical_response=None):
+    """Async counterpart of query_llm_groq for the ASGI server."""
+    if not _initialized:
+        raise RuntimeError("Components not initialized")
+
+    if any(keyword in final_query.lower() for keyword in stock_keywords):
+        if selected_company:
+            stock_response = await asyncio.to_thread(fetch_stock_price_llm, final_query, selected_company.upper())
+            return stock_response, []
+        else:
+            return "⚠️ Please specify a valid company ticker (e.g., TSLA, AMZN).", []
+
+    try:
+        relevant_docs = await retrieve_documents_async(final_query, selected_company)
+        messages = await asyncio.to_thread(build_rag_messages, final_query, relevant_docs, chat_history, numerical_response)
+
+        client = GroqWrapper.get_async_client(GROQ_API_KEY)
+        response = await client.chat.completions.create(
+            model="llama3-70b-8192",
+            messages=messages,
+            temperature=0.3,
+            max_tokens=512,
+            top_p=1,
+            stream=False,
+        )
+        return response.choices[0].message.content, relevant_docs
+
+    except Exception as e:
+        return f"❌ Groq API Error: {str(e)}", []
+
 
 if __name__ == "__main__":
     if initialize_components():
@@ -0,0 +1,150 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from answer_cache import normalize_question
+from cache_backends import create_cache_backend
+
+TABLE_REFERENCE_PATTERN = re.compile(r'"?ADMIN"?\s*\.\s*"?([A-Za-z0-9_]+)"?', re.IGNORECASE)
+QUOTED_OR_TOKEN_PATTERN = re.compile(r"('(?:[^']|'')*'|\"[^\"]*\"|--[^\n]*|/\*.*?\*/|\s+|[^'\"\s]+)", re.DOTALL)
+OPERATORS = "(),+-*/=<>|"
+OPERATOR_SPACING_PATTERN = re.compile(r"\s*([(),+\-*/=<>|])\s*")
+
+
+def canonicalize_sql(sql: str) -> str:
+    """Canonical form of a SQL statement for cache keys.
+
+    Comments and the trailing semicolon are dropped, whitespace is collapsed (and
+    removed around operators) and keywords are upper-cased. Quoted identifiers and
+    string literals are kept verbatim because they are case-sensitive in Oracle.
+    """
+    tokens = []
+    for token in QUOTED_OR_TOKEN_PATTERN.findall(sql.strip().rstrip(";")):
+        if token.startswith("--") or token.startswith("/*"):
+            continue
+        if token.isspace():
+            tokens.append(" ")
+        elif token[0] in "'\"":
+            tokens.append(token)
+        else:
+            tokens.append(OPERATOR_SPACING_PATTERN.sub(r"\1", token.upper()))
+
+    parts = []
+    for i, token in enumerate(tokens):
+        if token == " ":
+            prev_token = parts[-1] if parts else ""
+            next_token = tokens[i + 1] if i + 1 < len(tokens) else ""
+            if not prev_token or not next_token or prev_token[-1] in OPERATORS or next_token[0] in OPERATORS or next_token == " ":
+                continue
+        parts.append(token)
+    return "".join(parts)
+
+
+def tables_in_sql(sql: str) -> List[str]:
+    """Names of the ADMIN.* tables a statement reads from (upper-cased, sorted)."""
+    return sorted({name.upper() for name in TABLE_REFERENCE_PATTERN.findall(sql)})
+
+
+class SQLCache:
+    """Two-tier text-to-SQL cache.
+
+    Tier 1 maps (company, normalized question) to the SQL generated for it. SQL the
+    LLM wrote with chat history in its prompt answers that conversation ("What about
+    Q2?"), so its key also covers the last ``history_window`` messages (what the SQL
+    prompt reads). Lookups pass the request's history; fast-path SQL depends on the
+    question alone and is stored without it, where history-free requests find it.
+    Tier 2 maps canonicalized SQL to its result rows. Result keys embed a version per
+    referenced table, so ``invalidate_tables`` makes every cached result that reads a
+    reloaded table unreachable without having to track individual keys. The versions
+    live in ``version_backend`` (the same kind as the result tier), so with the disk
+    backend an invalidation reaches every worker and survives restarts. A new version
+    is a random token rather than an incremented counter: workers never have to agree
+    on the next number, and a version can never return to an earlier value.
+    """
+
+    def __init__(self, sql_backend, result_backend, version_backend, sql_ttl: float, result_ttl: float, history_window: int = 3):
+        self.sql_backend = sql_backend
+        self.result_backend = result_backend
+        self.version_backend = version_backend
+        self.sql_ttl = sql_ttl
+        self.result_ttl = result_ttl
+        self.history_window = history_window
+
+        self._lock = threading.Lock()
+        self.stats = {"sql_hits": 0, "sql_misses": 0, "result_hits": 0, "result_misses": 0, "invalidations": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _sql_key(self, company: str, question: str, history: Optional[List[dict]] = None) -> str:
+        raw = f"{company.upper()}|{normalize_question(question)}"
+        if history:
+            raw += "|" + json.dumps(history[-self.history_window:], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _result_key(self, sql: str) -> str:
+        canonical = canonicalize_sql(sql)
+        versions = ",".join(f"{t}:{self.version_backend.get(t) or 0}" for t in tables_in_sql(canonical))
+        return hashlib.sha256(f"{versions}|{canonical}".encode("utf-8")).hexdigest()
+
+    def get_sql(self, company: str, question: str, history: Optional[List[dict]] = None) -> Optional[str]:
+        sql = self.sql_backend.get(self._sql_key(company, question, history))
+        self._count("sql_hits" if sql is not None else "sql_misses")
+        return sql
+
+    def set_sql(self, company: str, question: str, sql: str, history: Optional[List[dict]] = None):
+        """Remember ``sql``; pass the chat ``history`` it was generated from, if any, so other conversations don't reuse it."""
+        self.sql_backend.set(self._sql_key(company, question, history), sql, ttl=self.sql_ttl)
+
+    def get_result(self, sql: str) -> Optional[list]:
+        rows = self.result_backend.get(self._result_key(sql))
+        self._count("result_hits" if rows is not None else "result_misses")
+        return rows
+
+    def set_result(self, sql: str, rows: list):
+        self.result_backend.set(self._result_key(sql), [list(row) for row in rows], ttl=self.result_ttl)
+
+    def invalidate_tables(self, tables: Iterable[str]) -> List[str]:
+        """Drop cached results that read any of ``tables`` (call after a *_QUARTERLY reload)."""
+        tables = sorted({t.upper() for t in tables})
+        for table in tables:
+            self.version_backend.set(table, uuid.uuid4().hex)
+        with self._lock:
+            self.stats["invalidations"] += len(tables)
+        print(f"🧹 SQL result cache invalidated for: {', '.join(tables)}")
+        return tables
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["sql_tier"] = self.sql_backend.get_stats()
+        stats["result_tier"] = self.result_backend.get_stats()
+        return stats
+
+
+# Global instance (configured from the environment)
+sql_cache = SQLCache(
+    sql_backend=create_cache_backend(
+        os.getenv("SQL_CACHE_BACKEND", "memory"), "sql_cache_queries",
+        max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", 2000)),
+        max_bytes=int(os.getenv("SQL_CACHE_MAX_BYTES", 4 * 1024 * 1024))
+    ),
+    result_backend=create_cache_backend(
+        os.getenv("SQL_CACHE_BACKEND", "memory"), "sql_cache_results",
+        max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", 2000)),
+        max_bytes=int(os.getenv("SQL_CACHE_MAX_BYTES", 4 * 1024 * 1024))
+    ),
+    # One small entry per table, without TTL; never evicted at these limits
+    version_backend=create_cache_backend(
+        os.getenv("SQL_CACHE_BACKEND", "memory"), "sql_cache_table_versions",
+        max_entries=100000, max_bytes=16 * 1024 * 1024
+    ),
+    sql_ttl=float(os.getenv("SQL_CACHE_TTL", 7 * 24 * 3600)),
+    result_ttl=float(os.getenv("SQL_RESULT_CACHE_TTL", 24 * 3600)),
+    history_window=int(os.getenv("SQL_CACHE_HISTORY_WINDOW", 3))
+)
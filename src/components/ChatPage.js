@@ -172,13 +172,11 @@ function ChatPage() {
         const userMessage = { sender: "user", message: message };
         setCurrentChat((prevChat) => [...prevChat, userMessage]);
     
-        await saveChatToBackend(userMessage);
-    
         //  Check if company is selected
         if (!selectedCompany) {
             const errorMessage = { sender: "bot", message: "Please select a company before sending a message." };
             setCurrentChat((prevChat) => [...prevChat, errorMessage]);
-            await saveChatToBackend(errorMessage);
+            await saveChatsToBackend([userMessage, errorMessage]);
             setMessage(""); // Clear input field
             return;
         }
@@ -198,26 +196,25 @@ function ChatPage() {
                 : { sender: "bot", message: "I'm not sure how to respond to that." };
     
             setCurrentChat((prevChat) => [...prevChat, botMessage]);
-            await saveChatToBackend(botMessage);
+            await saveChatsToBackend([userMessage, botMessage]);
         } catch (error) {
             console.error("Error sending message:", error); // Log technical error
     
             //  User-friendly error message
             const errorMessage = { sender: "bot", message: "Oops! Something went wrong. Please try again later." };
             setCurrentChat((prevChat) => [...prevChat, errorMessage]);
-            await saveChatToBackend(errorMessage);
+            await saveChatsToBackend([userMessage, errorMessage]);
         }
     
         setMessage(""); // Clear input field
     };
 
-    //  Save message to backend (SQLite)
-    const saveChatToBackend = async (chatMessage) => {
+    //  Save a whole turn (question + reply) to the backend in one request
+    const saveChatsToBackend = async (chatMessages) => {
         try {
             const userId = localStorage.getItem("userId");
-            await axios.post(`${CHATBOT_API_URL}/save_chat`, {
-                sender: chatMessage.sender,
-                message: chatMessage.message,
+            await axios.post(`${CHATBOT_API_URL}/save_chats`, {
+                messages: chatMessages.map(({ sender, message }) => ({ sender, message })),
                 session_id: sessionId,
                 user_id: userId
             });
@@ -375,7 +372,7 @@ function ChatPage() {
                     clearInterval(interval);
                     setUploadMessage("✅ Processing completed! Redirecting...");
                     setTimeout(() => navigate("/pdf-chat"), 2000);
-                } else if (statusResponse.data.status === "failed") {
+                } else if (statusResponse.data.status === "failed" || statusResponse.data.status === "cancelled") {
                     clearInterval(interval);
                     setUploadMessage("❌ Processing failed. Please try again.");
                 }